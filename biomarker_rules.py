@@ -0,0 +1,280 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Motor declarativo de biomarcadores IHQ.
+
+Los marcadores se declaran en `biomarcadores.json`: alias (regex), campos a capturar en la
+misma línea después del alias (estado con vocabulario, porcentaje, puntaje, texto libre),
+secciones donde se buscan en orden de prioridad y plantillas de cada columna de salida.
+
+Todos los alias se compilan en UNA alternancia con grupos con nombre; la extracción recorre
+una sola vez la zona de resultados del informe y, en cada mención, prueba con `match` los
+campos del marcador solo sobre el resto de esa línea. Agregar un marcador (SOX10, WT1,
+MSH6...) es editar el archivo: no requiere código ni agrega otra pasada por el texto, y
+`database_manager.init_db` crea sus columnas. La versión de cada columna es el hash de la
+definición de su marcador: al editar un marcador solo sus columnas quedan desactualizadas.
+
+Uso por consola:
+    python biomarker_rules.py            # lista marcadores, alias y columnas
+    python biomarker_rules.py informe.txt  # extrae los biomarcadores de un texto
+"""
+
+import hashlib
+import json
+import re
+import string
+import sys
+from pathlib import Path
+
+import pattern_registry
+import report_sections  # noqa: F401  (registra secciones.encabezados, parte de cada versión)
+
+RULES_FILE = Path(__file__).with_name("biomarcadores.json")
+DEFAULT_SECTIONS = ("resultados",)
+
+
+class _Field:
+    """Campo de un marcador: patrón anclado al final del alias y, opcionalmente, vocabulario."""
+
+    def __init__(self, marker: str, name: str, spec: dict, vocabularies: dict):
+        values = spec.get("valores")
+        if isinstance(values, str):
+            if values not in vocabularies:
+                raise ValueError(f"Marcador {marker}: vocabulario '{values}' no declarado.")
+            values = vocabularies[values]
+        pattern = spec["patron"]
+        self.canonical = None
+        if values:
+            self.canonical = list(values)
+            options = "|".join(f"(?P<v{i}>{'|'.join(variants)})"
+                               for i, variants in enumerate(values.values()))
+            pattern = pattern.replace("{valores}", f"(?:{options})")
+        self.pattern = pattern_registry.register(f"biomarcadores.{marker}.{name}", pattern, re.IGNORECASE)
+
+    def value(self, m) -> str:
+        if self.canonical is not None:
+            return self.canonical[int(m.lastgroup[1:])]
+        return m.group(1).strip()
+
+
+class BiomarkerRules:
+    """Reglas compiladas: una expresión combinada de alias y los campos de cada marcador."""
+
+    def __init__(self, spec: dict):
+        vocabularies = spec.get("vocabularios", {})
+        self.markers = []
+        self.columns = {}      # columna → (marcador, [(plantilla, campos requeridos)])
+        self._digests = {}     # marcador → hash de su definición (con los vocabularios que usa)
+        self._anchors = {}     # grupo del alias → (marcador, [(campo, _Field)])
+        self._sections = {}    # marcador → secciones en orden de prioridad
+        alternatives = []
+
+        def anchor(marker: str, aliases: list, fields: list):
+            group = f"a{len(self._anchors)}"
+            self._anchors[group] = (marker, fields)
+            alternatives.append(f"(?P<{group}>{'|'.join(aliases)})")
+
+        for m in spec["marcadores"]:
+            name = m["nombre"]
+            if name in self._sections:
+                raise ValueError(f"Marcador duplicado en las reglas: {name}")
+            self.markers.append(name)
+            self._sections[name] = tuple(m.get("secciones", DEFAULT_SECTIONS))
+            used = {f["valores"]: vocabularies.get(f["valores"]) for f in m["campos"].values()
+                    if isinstance(f.get("valores"), str)}
+            self._digests[name] = hashlib.sha256(json.dumps(
+                {"marcador": m, "vocabularios": used}, sort_keys=True, ensure_ascii=False).encode("utf-8")).hexdigest()
+            main_fields = []
+            for field_name, field_spec in m["campos"].items():
+                field = (field_name, _Field(name, field_name, field_spec, vocabularies))
+                # Un campo con alias propios (p. ej. ISH para HER2) ancla en su propia mención
+                if "alias" in field_spec:
+                    anchor(name, field_spec["alias"], [field])
+                else:
+                    main_fields.append(field)
+            if main_fields:
+                anchor(name, m["alias"], main_fields)
+            for column, templates in m["columnas"].items():
+                if column in self.columns:
+                    raise ValueError(f"Columna '{column}' declarada por dos marcadores.")
+                self.columns[column] = (name, [
+                    (t, {f for _, f, _, _ in string.Formatter().parse(t) if f}) for t in templates])
+
+        self.pattern = pattern_registry.register("biomarcadores.reglas", "|".join(alternatives), re.IGNORECASE)
+        self.scopes = tuple(dict.fromkeys(s for secs in self._sections.values() for s in secs))
+
+    def column_versions(self) -> dict:
+        """Versión de cada columna: hash de la definición de su marcador y del índice de secciones."""
+        sections = pattern_registry.version("secciones.encabezados")
+        return {column: hashlib.sha256(f"{self._digests[marker]}:{sections}".encode()).hexdigest()[:12]
+                for column, (marker, _) in self.columns.items()}
+
+    def extract(self, doc) -> dict:
+        """
+        Columnas de biomarcadores de un `ReportDocument`. Cada campo toma la primera mención
+        que lo contiene dentro de la sección de mayor prioridad de su marcador; si el informe
+        no tiene ninguna de esas secciones, se busca en todo el texto.
+        """
+        text, sections = doc.text, doc.sections
+        spans = {name: sections.scope(name) for name in self.scopes}
+        present = [s for s in spans.values() if s]
+        start, end = (min(s[0] for s in present), max(s[1] for s in present)) if present else (0, len(text))
+
+        best = {}   # (marcador, campo) → (prioridad, valor)
+        for m in self.pattern.finditer(text, start, end):
+            marker, fields = self._anchors[m.lastgroup]
+            rank = self._rank(marker, m.start(), spans)
+            if rank is None:
+                continue
+            line_end = text.find("\n", m.end(), end)
+            line_end = end if line_end == -1 else line_end
+            for field_name, field in fields:
+                key = (marker, field_name)
+                if key in best and best[key][0] <= rank:
+                    continue
+                fm = field.pattern.match(text, m.end(), line_end)
+                if fm:
+                    best[key] = (rank, field.value(fm))
+
+        out = {}
+        for column, (marker, templates) in self.columns.items():
+            values = {f: v for (mk, f), (_, v) in best.items() if mk == marker}
+            out[column] = next((t.format(**values) for t, needed in templates if needed <= values.keys()), "")
+        return out
+
+    def extract_batch(self, texts):
+        """
+        Versión por lotes de `extract` para miles de informes: recibe una Serie de pandas (o un
+        arreglo Arrow / lista) con los textos y devuelve un DataFrame con una columna `string`
+        por columna de salida, con el mismo índice y exactamente los mismos valores que
+        `extract(ReportDocument(texto))` fila a fila.
+
+        El índice de secciones se calcula por texto (una búsqueda); el resto son operaciones
+        de texto de pandas sobre toda la serie: colapso de espacios, UNA `str.extractall` de
+        la alternancia de alias (la cola de línea se captura en un lookahead, de modo que las
+        menciones son las mismas que en `finditer`), `str.extract` de cada campo sobre las colas
+        de su marcador y las plantillas armadas por concatenación con máscaras.
+        """
+        import pandas as pd
+        from report_sections import SectionIndex
+
+        if not isinstance(texts, pd.Series):
+            texts = texts.to_pandas() if hasattr(texts, "to_pandas") else pd.Series(list(texts))
+        index = texts.index
+        text = texts.reset_index(drop=True).fillna("").astype(str)
+        # Mismo colapso de espacios que ReportDocument.text, solo en las filas que lo necesitan
+        runs = text.str.contains("  ", regex=False) | text.str.contains("\t", regex=False)
+        text[runs] = text[runs].str.replace(r"[ \t]+", " ", regex=True)
+
+        # Rangos por fila: ámbitos declarados y rango de búsqueda (igual que en extract)
+        sections = [SectionIndex(t) for t in text]
+        spans = {name: [ix.scope(name) for ix in sections] for name in self.scopes}
+        has_section = {marker: pd.Series([any(spans[n][i] for n in secs) for i in text.index], index=text.index)
+                       for marker, secs in self._sections.items()}
+        scan = []
+        for i, t in enumerate(text):
+            present = [spans[name][i] for name in self.scopes if spans[name][i]]
+            scan.append((min(s[0] for s in present), max(s[1] for s in present)) if present else (0, len(t)))
+
+        # Una vista por ámbito declarado y "*" (rango de búsqueda) para las filas donde algún
+        # marcador no tiene ninguna de sus secciones
+        need_scan = ~pd.concat(has_section, axis=1).all(axis=1)
+        views = dict(spans)
+        views["*"] = [sp if need_scan[i] else None for i, sp in enumerate(scan)]
+        fields = {view: self._batch_fields(text, view_spans) for view, view_spans in views.items()}
+
+        out = {}
+        for column, (marker, templates) in self.columns.items():
+            values = {}
+            for field_name in {f for _, needed in templates for f in needed}:
+                key = (marker, field_name)
+                # Prioridad: primera sección declarada con valor; sin ninguna de sus secciones, el rango completo
+                value = pd.Series(pd.NA, index=text.index, dtype="object")
+                for name in self._sections[marker]:
+                    if key in fields[name]:
+                        value = value.combine_first(fields[name][key]).reindex(text.index)
+                scan_value = fields["*"].get(key, pd.Series(dtype="object")).reindex(text.index)
+                values[field_name] = value.where(has_section[marker], scan_value)
+            result = pd.Series("", index=text.index, dtype="object")
+            for template, needed in reversed(templates):
+                built = pd.Series("", index=text.index, dtype="object")
+                mask = pd.Series(True, index=text.index)
+                for literal, field_name, _, _ in string.Formatter().parse(template):
+                    built = built + literal
+                    if field_name:
+                        built = built + values[field_name].fillna("")
+                        mask &= values[field_name].notna()
+                result = built.where(mask, result)
+            out[column] = result
+        return pd.DataFrame(out, index=text.index).astype("string").set_axis(index)
+
+    def _batch_fields(self, text, spans) -> dict:
+        """{(marcador, campo): Serie con el primer valor por fila} dentro de los rangos `spans`."""
+        import pandas as pd
+
+        # Cada región lleva el carácter previo (o un salto de línea) para que los \b del inicio
+        # vean el mismo contexto que `finditer(texto, inicio, fin)`; el lookbehind impide
+        # que una mención empiece en él.
+        regions = pd.Series([
+            ((t[sp[0] - 1] if sp[0] else "\n") + t[sp[0]:sp[1]]) if sp else ""
+            for t, sp in zip(text, spans)], index=text.index)
+        mentions = regions.str.extractall(rf"(?<=[\s\S])(?:{self.pattern.pattern})(?=(?P<cola>[^\n]*))",
+                                          flags=re.IGNORECASE)
+        found = {}
+        if mentions.empty:
+            return found
+        groups = list(self._anchors)
+        present = mentions[groups].notna()
+        anchor = present.idxmax(axis=1)
+        alias = mentions[groups].bfill(axis=1).iloc[:, 0]
+        # Cada campo se prueba anclado al final del alias, con su último carácter como contexto
+        subject = alias.str[-1] + mentions["cola"]
+        for group, (marker, group_fields) in self._anchors.items():
+            sub = subject[anchor == group]
+            if sub.empty:
+                continue
+            for field_name, field in group_fields:
+                got = sub.str.extract(rf"^[\s\S](?:{field.pattern.pattern})", flags=re.IGNORECASE)
+                if field.canonical is None:
+                    value = got.iloc[:, 0].str.strip()
+                else:
+                    hit = got.notna()
+                    value = hit.idxmax(axis=1).str[1:].astype(int).map(dict(enumerate(field.canonical)))
+                    value = value.where(hit.any(axis=1))
+                # Primera mención (en orden de aparición) que trae el campo, por fila
+                found[(marker, field_name)] = value.dropna().groupby(level=0).first()
+        return found
+
+    def _rank(self, marker: str, pos: int, spans: dict):
+        """Índice de la primera sección del marcador que contiene `pos`; None si ninguna."""
+        declared = [spans[s] for s in self._sections[marker]]
+        if not any(declared):
+            return 0
+        return next((i for i, s in enumerate(declared) if s and s[0] <= pos < s[1]), None)
+
+
+def load_rules(path=RULES_FILE) -> BiomarkerRules:
+    try:
+        spec = json.loads(Path(path).read_text(encoding="utf-8"))
+    except (OSError, json.JSONDecodeError) as e:
+        raise ValueError(f"No se pudieron leer las reglas de biomarcadores ({path}): {e}") from e
+    return BiomarkerRules(spec)
+
+
+RULES = load_rules()
+
+
+def main():
+    if len(sys.argv) > 1:
+        from report_sections import ReportDocument
+        doc = ReportDocument(Path(sys.argv[1]).read_text(encoding="utf-8"))
+        for column, value in RULES.extract(doc).items():
+            print(f"   {column:<28} {value}")
+        return
+    print(f"🧩 {len(RULES.markers)} marcadores en {RULES_FILE.name}, secciones: {', '.join(RULES.scopes)}")
+    for column, (marker, templates) in RULES.columns.items():
+        print(f"   {marker:<8} {column:<28} {' | '.join(t for t, _ in templates)}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,198 @@
 # database_manager.py
+import configparser
+import json
+import os
+import re
 import sqlite3
+import threading
+from datetime import date, datetime
 from pathlib import Path
 
-DB_FILE = "huv_oncologia.db"
+from biomarker_rules import RULES
+from huv_constants import app_dir
+from keyword_matcher import fold
+
+# ─────────────────────────── CONFIGURACIÓN ─────────────────────────────
+_config = configparser.ConfigParser(interpolation=None)
+_config.read(Path(__file__).resolve().parent / "config.ini", encoding="utf-8")
+
+# Ruta absoluta: no depende del directorio desde el que se lance la aplicación. Una ruta
+# relativa en [DATABASE] PATH se toma respecto a la carpeta del programa (o del ejecutable).
+DB_FILE = str((app_dir() /
+               (_config.get("DATABASE", "PATH", fallback="").strip() or "huv_oncologia.db")).resolve())
+JOURNAL_MODE = _config.get("DATABASE", "JOURNAL_MODE", fallback="WAL").strip() or "WAL"
+SYNCHRONOUS = _config.get("DATABASE", "SYNCHRONOUS", fallback="NORMAL").strip() or "NORMAL"
+MMAP_SIZE_MB = _config.getint("DATABASE", "MMAP_SIZE_MB", fallback=256)
+CACHE_SIZE_MB = _config.getint("DATABASE", "CACHE_SIZE_MB", fallback=64)
+BUSY_TIMEOUT_MS = _config.getint("DATABASE", "BUSY_TIMEOUT_MS", fallback=10000)
 TABLE_NAME = "informes_ihq"
+TEXT_TABLE = "textos_ihq"
+KEY_COLUMN = "N. peticion (0. Numero de biopsia)"
+KEY_INDEX = "ux_informes_peticion"
+# Máximo de parámetros por consulta en versiones antiguas de SQLite
+_MAX_PARAMS = 900
+# Columnas de la tabla de informes por archivo de BD (init_db las invalida al migrar)
+_columns_cache = {}
+# ─────────────────────────── COLUMNAS TIPADAS ──────────────────────────
+# Copias tipadas de columnas de texto, calculadas al guardar: fechas ISO (YYYY-MM-DD, se
+# comparan y ordenan como texto), enteros, HER2/RE/RP normalizados y petición/nombre/apellido
+# plegados para buscar. El texto original no cambia; estas columnas sirven para filtrar,
+# agregar y buscar en SQL sin convertir toda la tabla.
+_DATE_DMY_RE = re.compile(r'(\d{1,2})[/-](\d{1,2})[/-](\d{4})')
+_DATE_ISO_RE = re.compile(r'(\d{4})-(\d{1,2})-(\d{1,2})')
+_PERCENT_RE = re.compile(r'(\d{1,3})(?:[.,]\d+)?\s*%')
+_DIGITS_RE = re.compile(r'\d{1,3}')
+_INTEGER_RE = re.compile(r'^\s*<?\s*(\d{1,3})(?:[.,]\d+)?\s*$')
+_HER2_SCORE_RE = re.compile(r'\b([0-3])\s*\+|(?<![\d.,])(0)(?![\d.,%+])')
+
+
+def _iso_date(value):
+    """'dd/mm/YYYY', 'dd-mm-YYYY' (con hora o sin ella) o ISO → 'YYYY-MM-DD'; None si no es fecha."""
+    text = str(value or '')
+    m = _DATE_ISO_RE.search(text)
+    year, month, day = (m.group(1), m.group(2), m.group(3)) if m else (None, None, None)
+    if not m:
+        m = _DATE_DMY_RE.search(text)
+        if not m:
+            return None
+        day, month, year = m.groups()
+    try:
+        return date(int(year), int(month), int(day)).isoformat()
+    except ValueError:
+        return None
+
+
+def _integer(value):
+    """Primer entero de un texto como 'Edad' ('33', '33 años'); None si no hay."""
+    m = _DIGITS_RE.search(str(value or ''))
+    return int(m.group(0)) if m else None
+
+
+def _percent(value):
+    """'15%', '<1%', 'POSITIVO 90%' o '15' → entero 0-100; None si no hay porcentaje."""
+    text = str(value or '')
+    m = _PERCENT_RE.search(text) or _INTEGER_RE.match(text)
+    if not m:
+        return None
+    pct = int(m.group(1))
+    return pct if pct <= 100 else None
+
+
+def _her2_score(value):
+    """Puntaje HER2 normalizado: '0', '1+', '2+', '3+', o 'POSITIVO'/'NEGATIVO' sin puntaje."""
+    text = str(value or '').upper()
+    m = _HER2_SCORE_RE.search(text)
+    if m:
+        return f"{m.group(1)}+" if m.group(1) else "0"
+    if "POSITIV" in text:
+        return "POSITIVO"
+    if "NEGATIV" in text:
+        return "NEGATIVO"
+    return None
+
+
+def _length(value):
+    """Número de caracteres del texto (0 si está vacío)."""
+    return len(str(value or ''))
+
+
+def _receptor_state(value):
+    """'POSITIVO' o 'NEGATIVO' según el texto de RE/RP; None si no se indica."""
+    text = str(value or '').upper()
+    if "NEGATIV" in text:
+        return "NEGATIVO"
+    if "POSITIV" in text:
+        return "POSITIVO"
+    return None
+
+
+def _folded(value):
+    """Texto sin acentos y en mayúsculas (keyword_matcher.fold, Ñ → N); None si queda vacío."""
+    return fold(str(value or '')) or None
+
+
+# Columna tipada → (tipo SQL, columna de texto de origen, conversión)
+TYPED_COLUMNS = {
+    "fecha_informe": ("TEXT", "Fecha finalizacion (3. Fecha del informe)", _iso_date),
+    "fecha_ingreso": ("TEXT", "Fecha de ingreso (2. Fecha de la muestra)", _iso_date),
+    "edad_anios": ("INTEGER", "Edad", _integer),
+    "ki67_pct": ("INTEGER", "IHQ_KI-67", _percent),
+    "her2_puntaje": ("TEXT", "IHQ_HER2", _her2_score),
+    "re_estado": ("TEXT", "IHQ_RECEPTOR_ESTROGENO", _receptor_state),
+    "re_pct": ("INTEGER", "IHQ_RECEPTOR_ESTROGENO", _percent),
+    "rp_estado": ("TEXT", "IHQ_RECEPTOR_PROGESTAGENOS", _receptor_state),
+    "rp_pct": ("INTEGER", "IHQ_RECEPTOR_PROGESTAGENOS", _percent),
+    "largo_diagnostico": ("INTEGER", "Descripcion Diagnostico (5,6,7 Tipo histológico, subtipo histológico, "
+                                     "margenes tumorales)", _length),
+    # LIKE solo pliega mayúsculas ASCII: la búsqueda del listado compara estas copias plegadas
+    "peticion_busqueda": ("TEXT", KEY_COLUMN, _folded),
+    "nombre_busqueda": ("TEXT", "Primer nombre", _folded),
+    "apellido_busqueda": ("TEXT", "Primer apellido", _folded),
+}
+# Índices secundarios para los filtros del dashboard: nombre → columnas
+SECONDARY_INDEXES = {
+    "ix_informes_fecha_informe": ("fecha_informe",),
+    "ix_informes_servicio": ("Servicio",),
+    "ix_informes_malignidad": ("Malignidad",),
+    "ix_informes_usuario_finalizacion": ("Usuario finalizacion",),
+    # Índice de cobertura con todo lo que leen los agregados del dashboard: se recorre este
+    # índice angosto en lugar de filas con textos de varios KB (las columnas tipadas, agregadas
+    # al final de la fila, quedan en páginas de desbordamiento)
+    "ix_informes_dashboard": ("fecha_informe", "Servicio", "Malignidad", "Usuario finalizacion", "fecha_ingreso",
+                              "Organo (1. Muestra enviada a patología)", "IHQ_HER2", "IHQ_KI-67", "IHQ_PDL-1",
+                              "edad_anios", "ki67_pct", "her2_puntaje", "re_estado", "rp_estado",
+                              "largo_diagnostico"),
+    # Orden del listado de Visualizar (la petición ya tiene el índice único)
+    "ix_informes_primer_nombre": ("Primer nombre",),
+    "ix_informes_primer_apellido": ("Primer apellido",),
+    "ix_informes_organo": ("Organo (1. Muestra enviada a patología)",),
+}
+
+
+def _typed_values(record: dict, only_present: bool = False) -> dict:
+    """
+    {columna tipada: valor} calculado desde las columnas de texto de `record`. Con
+    `only_present` solo las columnas tipadas cuyo origen está en `record` (actualizaciones parciales).
+    """
+    return {col: convert(record.get(source)) for col, (_, source, convert) in TYPED_COLUMNS.items()
+            if not only_present or source in record}
+
+# Conexiones abiertas del hilo actual: {ruta de BD: conexión}
+_local = threading.local()
+
+
+def get_connection() -> sqlite3.Connection:
+    """
+    Conexión de larga vida del hilo actual a DB_FILE, abierta una sola vez con WAL (las
+    lecturas del dashboard no esperan a una ingesta en curso), synchronous, E/S mapeada en
+    memoria y caché según [DATABASE] de config.ini. Cada hilo (UI, procesamiento) y cada
+    proceso tiene la suya; si cambia DB_FILE (p. ej. una BD temporal) se abre otra.
+    """
+    if getattr(_local, "pid", None) != os.getpid():
+        # Un proceso hijo no reutiliza las conexiones heredadas del padre
+        _local.pid, _local.connections = os.getpid(), {}
+    conn = _local.connections.get(DB_FILE)
+    if conn is None:
+        Path(DB_FILE).parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(DB_FILE, timeout=BUSY_TIMEOUT_MS / 1000)
+        conn.execute(f"PRAGMA journal_mode = {JOURNAL_MODE}")
+        conn.execute(f"PRAGMA synchronous = {SYNCHRONOUS}")
+        conn.execute(f"PRAGMA mmap_size = {MMAP_SIZE_MB * 1024 * 1024}")
+        conn.execute(f"PRAGMA cache_size = {-CACHE_SIZE_MB * 1024}")   # negativo = KiB
+        conn.execute(f"PRAGMA busy_timeout = {BUSY_TIMEOUT_MS}")
+        _local.connections[DB_FILE] = conn
+    return conn
+
+
+def close_connections():
+    """Cierra las conexiones del hilo actual (se reabren en el siguiente uso)."""
+    for conn in getattr(_local, "connections", {}).values():
+        conn.close()
+    _local.connections = {}
 
 def init_db():
     """Crea la base de datos y la tabla si no existen."""
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     cursor = conn.cursor()
     # Usamos TEXT para todas las columnas por simplicidad, SQLite es flexible.
     # Podríamos ser más estrictos con los tipos (INTEGER, REAL) si fuera necesario.
@@ -42,45 +227,468 @@ def init_db():
         fecha_procesado TIMESTAMP DEFAULT CURRENT_TIMESTAMP
     )
     """)
+    # Columnas de marcadores declarados en biomarcadores.json que la tabla aún no tenga
+    cursor.execute(f"PRAGMA table_info({TABLE_NAME})")
+    existing = {col[1] for col in cursor.fetchall()}
+    for column in RULES.columns:
+        if column not in existing:
+            cursor.execute(f'ALTER TABLE {TABLE_NAME} ADD COLUMN "{column}" TEXT')
+    # Índice único por número de petición: la detección de duplicados deja de recorrer la tabla.
+    # Bases anteriores pueden traer duplicados; se conserva el primero, como hacía save_records,
+    # y antes se respalda el archivo. Los informes sin número no son duplicados entre sí: quedan
+    # con NULL, que el índice único admite repetido.
+    cursor.execute(f"PRAGMA index_list({TABLE_NAME})")
+    if KEY_INDEX not in {idx[1] for idx in cursor.fetchall()}:
+        duplicates = (f'FROM {TABLE_NAME} WHERE "{KEY_COLUMN}" <> \'\' AND id NOT IN '
+                      f'(SELECT MIN(id) FROM {TABLE_NAME} WHERE "{KEY_COLUMN}" <> \'\' GROUP BY "{KEY_COLUMN}")')
+        if cursor.execute(f"SELECT COUNT(*) {duplicates}").fetchone()[0]:
+            backup = backup_db("antes_dedup")
+            cursor.execute(f"DELETE {duplicates}")
+            print(f"⚠️ Se eliminaron {cursor.rowcount} registros duplicados por número de petición "
+                  f"(respaldo en {backup}).")
+        cursor.execute(f'UPDATE {TABLE_NAME} SET "{KEY_COLUMN}" = NULL WHERE "{KEY_COLUMN}" = \'\'')
+        cursor.execute(f'CREATE UNIQUE INDEX {KEY_INDEX} ON {TABLE_NAME} ("{KEY_COLUMN}")')
+    # Columnas tipadas: al agregarlas se completan desde el texto de los registros existentes
+    added_typed = [col for col in TYPED_COLUMNS if col not in existing]
+    for col in added_typed:
+        cursor.execute(f'ALTER TABLE {TABLE_NAME} ADD COLUMN {col} {TYPED_COLUMNS[col][0]}')
+    for name, columns in SECONDARY_INDEXES.items():
+        indexed = ', '.join(f'"{col}"' for col in columns)
+        cursor.execute(f'CREATE INDEX IF NOT EXISTS {name} ON {TABLE_NAME} ({indexed})')
+    _columns_cache.pop(DB_FILE, None)
+    if added_typed:
+        filled = backfill_typed_columns(added_typed)
+        if filled:
+            print(f"🧩 Columnas tipadas completadas en {filled} registros existentes.")
+    # Texto OCR de cada informe, para re-extraer sin volver a hacer OCR (ver reextraccion_ihq.py)
+    cursor.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TEXT_TABLE} (
+        peticion TEXT PRIMARY KEY,
+        texto TEXT NOT NULL,
+        versiones TEXT NOT NULL DEFAULT '{{}}',
+        fecha_ocr TIMESTAMP DEFAULT CURRENT_TIMESTAMP
+    )
+    """)
+    # Columnas agregadas después de la tabla: 'versiones' ({columna: hash de sus reglas}) y
+    # el PDF y las páginas (base 1) de donde salió el informe
+    cursor.execute(f"PRAGMA table_info({TEXT_TABLE})")
+    text_columns = {col[1] for col in cursor.fetchall()}
+    for column, definition in (("versiones", "TEXT NOT NULL DEFAULT '{}'"), ("pdf", "TEXT"),
+                               ("pagina_inicio", "INTEGER"), ("pagina_fin", "INTEGER")):
+        if column not in text_columns:
+            cursor.execute(f"ALTER TABLE {TEXT_TABLE} ADD COLUMN {column} {definition}")
     conn.commit()
-    conn.close()
 
-def save_records(records: list[dict]):
-    """Guarda una lista de registros (diccionarios) en la base de datos."""
+def backup_db(label: str) -> str:
+    """Copia consistente de DB_FILE (API de respaldo de SQLite) junto al original; devuelve su ruta."""
+    path = Path(DB_FILE)
+    target = path.with_name(f"{path.stem}.{label}-{datetime.now():%Y%m%d-%H%M%S}{path.suffix}")
+    copy = sqlite3.connect(target)
+    try:
+        get_connection().backup(copy)
+    finally:
+        copy.close()
+    return str(target)
+
+def backfill_typed_columns(columns: list = None) -> int:
+    """
+    Recalcula las columnas tipadas (todas o las indicadas) de todos los registros desde sus
+    columnas de texto, en una transacción. Devuelve el número de registros recorridos.
+    """
+    columns = list(columns or TYPED_COLUMNS)
+    sources = list(dict.fromkeys(TYPED_COLUMNS[col][1] for col in columns))
+    conn = get_connection()
+    select = ', '.join(f'"{source}"' for source in sources)
+    rows = conn.execute(f'SELECT id, {select} FROM {TABLE_NAME}').fetchall()
+    updates = []
+    for row_id, *values in rows:
+        typed = _typed_values(dict(zip(sources, values)), only_present=True)
+        updates.append([typed[col] for col in columns] + [row_id])
+    assignments = ', '.join(f'{col} = ?' for col in columns)
+    with conn:
+        conn.executemany(f'UPDATE {TABLE_NAME} SET {assignments} WHERE id = ?', updates)
+    return len(rows)
+
+def _table_columns(conn) -> list:
+    """Columnas de datos de la tabla de informes (sin id ni fecha_procesado), en orden."""
+    columns = _columns_cache.get(DB_FILE)
+    if columns is None:
+        columns = _columns_cache[DB_FILE] = [
+            col[1] for col in conn.execute(f"PRAGMA table_info({TABLE_NAME})")
+            if col[1] not in ('id', 'fecha_procesado')]
+    return columns
+
+def _existing_keys(conn, keys: list) -> set:
+    """Números de petición de `keys` que ya están en la tabla (búsqueda por el índice único)."""
+    found = set()
+    for i in range(0, len(keys), _MAX_PARAMS):
+        chunk = keys[i:i + _MAX_PARAMS]
+        placeholders = ', '.join('?' * len(chunk))
+        found.update(row[0] for row in conn.execute(
+            f'SELECT "{KEY_COLUMN}" FROM {TABLE_NAME} WHERE "{KEY_COLUMN}" IN ({placeholders})', chunk))
+    return found
+
+def _row_values(record: dict, table_columns: list) -> list:
+    """
+    Valores de `record` en el orden de la tabla, con las columnas tipadas calculadas. Un número
+    de petición vacío se guarda como NULL: no choca con el índice único ni con otro informe sin número.
+    """
+    typed = _typed_values(record)
+    typed[KEY_COLUMN] = record.get(KEY_COLUMN) or None
+    return [typed[col] if col in typed else record.get(col, '') for col in table_columns]
+
+def save_records(records: list[dict], update: bool = False) -> dict:
+    """
+    Guarda una lista de registros (diccionarios) en la base de datos, en una sola transacción.
+    Un registro cuyo número de petición ya existe se omite o, con `update=True`, reemplaza los
+    valores guardados; uno sin número siempre se inserta. Devuelve {"insertados", "actualizados",
+    "omitidos", "guardados"}; "guardados" son las posiciones en `records` de los registros que se
+    escribieron (para guardar junto a ellos texto y versiones, y no junto a los omitidos).
+    """
+    counts = {"insertados": 0, "actualizados": 0, "omitidos": 0, "guardados": []}
     if not records:
-        return
-    
-    conn = sqlite3.connect(DB_FILE)
-    cursor = conn.cursor()
-    
-    # Obtenemos las columnas de la tabla para asegurar el orden correcto
-    cursor.execute(f"PRAGMA table_info({TABLE_NAME})")
-    table_columns = [col[1] for col in cursor.fetchall() if col[1] not in ('id', 'fecha_procesado')]
-    
-    for record in records:
-        # Evitamos duplicados basados en el número de petición
-        peticion = record.get("N. peticion (0. Numero de biopsia)", "")
-        cursor.execute(f"SELECT id FROM {TABLE_NAME} WHERE \"N. peticion (0. Numero de biopsia)\" = ?", (peticion,))
-        if cursor.fetchone():
-            print(f"Registro {peticion} ya existe. Omitiendo.")
+        return counts
+
+    conn = get_connection()
+    # Columnas de la tabla en orden, con nombres entre comillas para que sean seguros en SQL
+    table_columns = _table_columns(conn)
+    column_names = ', '.join(f'"{col}"' for col in table_columns)
+    placeholders = ', '.join('?' * len(table_columns))
+    if update:
+        assignments = ', '.join(f'"{col}" = excluded."{col}"' for col in table_columns if col != KEY_COLUMN)
+        on_conflict = f"DO UPDATE SET {assignments}, fecha_procesado = CURRENT_TIMESTAMP"
+    else:
+        on_conflict = "DO NOTHING"
+
+    # Conteo por clave: las ya guardadas y las repetidas dentro del mismo lote chocan con el índice
+    keys = [record.get(KEY_COLUMN, '') for record in records]
+    seen = _existing_keys(conn, list(dict.fromkeys(key for key in keys if key)))
+    skipped = []
+    for i, key in enumerate(keys):
+        if not key:
+            counts["insertados"] += 1
+        elif key not in seen:
+            counts["insertados"] += 1
+            seen.add(key)
+        elif update:
+            counts["actualizados"] += 1
+        else:
+            skipped.append(key)
             continue
+        counts["guardados"].append(i)
+    counts["omitidos"] = len(skipped)
 
-        # Creamos una tupla de valores en el orden correcto
-        values = [record.get(col, '') for col in table_columns]
-        placeholders = ', '.join(['?'] * len(table_columns))
-        
-        # Formateamos los nombres de columna para que sean seguros en SQL
-        column_names = ', '.join([f'"{col}"' for col in table_columns])
-        
-        cursor.execute(f"INSERT INTO {TABLE_NAME} ({column_names}) VALUES ({placeholders})", values)
+    with conn:
+        conn.executemany(
+            f'INSERT INTO {TABLE_NAME} ({column_names}) VALUES ({placeholders}) '
+            f'ON CONFLICT ("{KEY_COLUMN}") {on_conflict}',
+            (_row_values(record, table_columns) for record in records))
 
-    conn.commit()
-    conn.close()
+    if skipped:
+        shown = ', '.join(str(k) for k in skipped[:5]) + (' ...' if len(skipped) > 5 else '')
+        print(f"Registros ya existentes omitidos ({len(skipped)}): {shown}")
+    return counts
+
+def save_report_text(peticion: str, text: str, versions: dict = None, pdf: str = None, pages: tuple = None):
+    """
+    Guarda (o reemplaza) el texto OCR de un informe, la versión de las reglas de cada campo y,
+    si se conocen, el PDF y las páginas (primera, última; base 1) de donde salió.
+    """
+    save_report_texts([(peticion, text, versions, pdf, pages)])
+
+def save_report_texts(entries: list[tuple], replace: bool = True):
+    """
+    Igual que `save_report_text` para una lista de (peticion, texto, versiones, pdf, paginas), en una
+    transacción. Con `replace=False` solo se guardan los informes que aún no tienen texto.
+    """
+    rows = []
+    for peticion, text, versions, pdf, pages in entries:
+        if not peticion:
+            continue
+        first_page, last_page = pages or (None, None)
+        rows.append((peticion, text, json.dumps(versions or {}, ensure_ascii=False),
+                     str(pdf) if pdf else None, first_page, last_page))
+    if not rows:
+        return
+    conn = get_connection()
+    with conn:
+        conn.executemany(f"INSERT OR {'REPLACE' if replace else 'IGNORE'} INTO {TEXT_TABLE} "
+                         f"(peticion, texto, versiones, pdf, pagina_inicio, pagina_fin) "
+                         f"VALUES (?, ?, ?, ?, ?, ?)", rows)
+
+def get_report_source(peticion: str):
+    """(pdf, primera página, última página) de un informe, o None si no se registró su origen."""
+    conn = get_connection()
+    row = conn.execute(f"SELECT pdf, pagina_inicio, pagina_fin FROM {TEXT_TABLE} WHERE peticion = ?",
+                       (peticion,)).fetchone()
+    return tuple(row) if row and row[0] else None
+
+def get_report_texts() -> list[tuple]:
+    """Lista de (peticion, texto, {columna: version}) de todos los informes con texto guardado."""
+    conn = get_connection()
+    rows = conn.execute(f"SELECT peticion, texto, versiones FROM {TEXT_TABLE} ORDER BY peticion").fetchall()
+    return [(peticion, text, json.loads(versions or '{}')) for peticion, text, versions in rows]
+
+def set_field_versions(versions: dict):
+    """Reemplaza la versión de las reglas por campo: {peticion: {columna: version}}."""
+    if not versions:
+        return
+    conn = get_connection()
+    with conn:
+        conn.executemany(f"UPDATE {TEXT_TABLE} SET versiones = ? WHERE peticion = ?",
+                         [(json.dumps(v, ensure_ascii=False), p) for p, v in versions.items()])
+
+def get_records_by_peticion() -> dict:
+    """Registros actuales como {peticion: {columna: valor}} (sin id ni fecha_procesado)."""
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row     # solo en este cursor: la conexión es compartida
+    records = {}
+    for row in cursor.execute(f"SELECT * FROM {TABLE_NAME}"):
+        record = {k: row[k] for k in row.keys() if k not in ('id', 'fecha_procesado')}
+        records.setdefault(record[KEY_COLUMN], record)
+    return records
+
+def update_fields(changes: dict):
+    """
+    Actualiza solo las columnas indicadas: {peticion: {columna: valor}}, en una transacción,
+    junto con las columnas tipadas que dependen de ellas.
+    """
+    if not changes:
+        return
+    conn = get_connection()
+    with conn:
+        for peticion, fields in changes.items():
+            # Las columnas tipadas siguen a sus columnas de texto de origen
+            fields = {**fields, **_typed_values(fields, only_present=True)}
+            assignments = ', '.join(f'"{col}" = ?' for col in fields)
+            conn.execute(f'UPDATE {TABLE_NAME} SET {assignments} WHERE "{KEY_COLUMN}" = ?',
+                         [*fields.values(), peticion])
 
 def get_all_records_as_dataframe():
     """Obtiene todos los registros de la BD y los devuelve como un DataFrame de Pandas."""
     import pandas as pd
-    conn = sqlite3.connect(DB_FILE)
+    conn = get_connection()
     df = pd.read_sql_query(f"SELECT * FROM {TABLE_NAME}", conn)
-    conn.close()
-    return df
\ No newline at end of file
+    return df
+
+
+# ─────────────────────────── CONSULTAS DEL DASHBOARD ───────────────────
+# Los filtros y agregados del dashboard se resuelven en SQL sobre las columnas tipadas y
+# los índices secundarios: a la UI solo llegan los conteos que dibuja cada gráfico, no la tabla.
+ORGAN_COLUMN = "Organo (1. Muestra enviada a patología)"
+# Dimensiones y métricas del comparador (se interpolan en el SQL: solo estas)
+COMPARE_DIMENSIONS = ("Servicio", "Usuario finalizacion", "Malignidad", ORGAN_COLUMN)
+COMPARE_METRICS = ("ki67_pct", "re_pct", "rp_pct", "edad_anios")
+MISSING_COLUMNS = ("Servicio", "Malignidad", "Usuario finalizacion", ORGAN_COLUMN, "IHQ_HER2", "IHQ_KI-67")
+# Todos los agregados leen el índice de cobertura: plan fijo, sin tocar las filas anchas
+_DASHBOARD_SOURCE = f"{TABLE_NAME} INDEXED BY ix_informes_dashboard"
+# Cortes (inclusive) de la longitud del diagnóstico y su etiqueta; lo que pase del último es "1200+"
+_LENGTH_BINS = ((50, "<50"), (150, "50–150"), (300, "150–300"), (600, "300–600"), (1200, "600–1200"))
+
+
+def _filter_clauses(filters: dict) -> tuple:
+    """
+    Condiciones SQL y parámetros del estado de filtros del dashboard: fecha_desde/fecha_hasta
+    (dd/mm/aaaa o ISO; una fecha inválida se ignora), servicio, malignidad y responsable.
+    """
+    filters = filters or {}
+    clauses, params = [], []
+    for key, op in (("fecha_desde", ">="), ("fecha_hasta", "<=")):
+        iso = _iso_date(filters.get(key))
+        if iso:
+            clauses.append(f"fecha_informe {op} ?")
+            params.append(iso)
+    for key, column in (("servicio", "Servicio"), ("malignidad", "Malignidad"),
+                        ("responsable", "Usuario finalizacion")):
+        value = str(filters.get(key) or '').strip()
+        if value:
+            clauses.append(f'"{column}" = ?')
+            params.append(value.upper() if key == "malignidad" else value)
+    return clauses, params
+
+
+def _where(clauses: list, *extra: str) -> str:
+    conditions = [*clauses, *extra]
+    return f" WHERE {' AND '.join(conditions)}" if conditions else ""
+
+
+def _counts(conn, expr: str, clauses: list, params: list, *extra: str, limit: int = None, order: str = "n DESC, k"):
+    """Serie {valor de `expr`: número de informes} con los filtros aplicados."""
+    import pandas as pd
+    sql = (f"SELECT {expr} AS k, COUNT(*) AS n FROM {_DASHBOARD_SOURCE}{_where(clauses, *extra)} "
+           f"GROUP BY k ORDER BY {order}" + (f" LIMIT {int(limit)}" if limit else ""))
+    rows = conn.execute(sql, params).fetchall()
+    return pd.Series([n for _, n in rows], index=[k for k, _ in rows], dtype="int64")
+
+
+def get_kpis() -> dict:
+    """Totales de la tabla completa: {"total", "malignos", "ultima_fecha" (ISO o None)}."""
+    row = get_connection().execute(
+        f"SELECT COUNT(*), SUM(\"Malignidad\" = 'PRESENTE'), MAX(fecha_informe) FROM {TABLE_NAME}").fetchone()
+    return {"total": row[0], "malignos": row[1] or 0, "ultima_fecha": row[2]}
+
+
+def get_distinct_values(column: str) -> list:
+    """Valores distintos y no vacíos de una columna, ordenados (combos de filtros)."""
+    rows = get_connection().execute(
+        f'SELECT DISTINCT "{column}" FROM {TABLE_NAME} WHERE TRIM(COALESCE("{column}", \'\')) != \'\' '
+        f'ORDER BY 1').fetchall()
+    return [row[0] for row in rows]
+
+
+def get_dashboard_aggregates(filters: dict = None) -> dict:
+    """
+    Agregados de todos los gráficos del dashboard para el estado de filtros dado, leídos en
+    una sola transacción de lectura. Los conteos se devuelven como Series {categoría: informes}:
+    total, fecha_min, fecha_max, por_mes y por_semana (índice de fechas, como `resample`), malignidad,
+    servicios, organos, responsables, ki67 ({%: n}), her2, re, rp, pdl1, dias_proceso
+    ({días: n}), edad_ki67 (DataFrame edad/ki67/n), vacios ({columna: fracción}) y largo_diagnostico.
+    """
+    import pandas as pd
+    clauses, params = _filter_clauses(filters)
+    conn = get_connection()
+    # Mismas filas para todos los agregados aunque haya una ingesta en curso. Si el hilo ya
+    # tiene una transacción abierta se lee dentro de ella y no se cierra aquí.
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        total, fecha_min, fecha_max = conn.execute(
+            f"SELECT COUNT(*), MIN(fecha_informe), MAX(fecha_informe) FROM {_DASHBOARD_SOURCE}{_where(clauses)}",
+            params).fetchone()
+        data = {"total": total, "fecha_min": fecha_min, "fecha_max": fecha_max}
+        has_date = "fecha_informe IS NOT NULL"
+        # Conteo por día (sigue el orden del índice); meses y semanas se arman sobre esos pocos miles
+        per_day = _counts(conn, "fecha_informe", clauses, params, has_date, order="k")
+        per_day.index = pd.to_datetime(per_day.index, format="%Y-%m-%d")
+        data["por_mes"] = per_day.resample("MS").sum()
+        data["por_semana"] = per_day.resample("W-MON").sum()
+        data["malignidad"] = _counts(conn, "COALESCE(NULLIF(UPPER(\"Malignidad\"), ''), 'DESCONOCIDO')", clauses, params)
+        data["servicios"] = _counts(conn, "COALESCE(\"Servicio\", '')", clauses, params, limit=12)
+        data["organos"] = _counts(conn, f"COALESCE(NULLIF(\"{ORGAN_COLUMN}\", ''), 'No especificado')",
+                                  clauses, params, limit=12)
+        data["responsables"] = _counts(conn, "COALESCE(\"Usuario finalizacion\", '')", clauses, params, limit=10)
+        data["ki67"] = _counts(conn, "ki67_pct", clauses, params, "ki67_pct IS NOT NULL", order="k")
+        data["her2"] = _counts(conn, "her2_puntaje", clauses, params, "her2_puntaje IS NOT NULL")
+        data["re"] = _counts(conn, "COALESCE(re_estado, 'ND')", clauses, params, order="k")
+        data["rp"] = _counts(conn, "COALESCE(rp_estado, 'ND')", clauses, params, order="k")
+        data["pdl1"] = _counts(conn, "COALESCE(NULLIF(\"IHQ_PDL-1\", ''), 'ND')", clauses, params)
+        data["dias_proceso"] = _counts(
+            conn, "CAST(julianday(fecha_informe) - julianday(fecha_ingreso) AS INTEGER)", clauses, params,
+            has_date, "fecha_ingreso IS NOT NULL", order="k")
+        rows = conn.execute(
+            f"SELECT edad_anios, ki67_pct, COUNT(*) FROM {_DASHBOARD_SOURCE}"
+            f"{_where(clauses, 'edad_anios IS NOT NULL', 'ki67_pct IS NOT NULL')} GROUP BY 1, 2", params).fetchall()
+        data["edad_ki67"] = pd.DataFrame(rows, columns=["edad", "ki67", "n"])
+        # Vacío = NULL, como el isna() del dashboard anterior (un texto '' cuenta como dato)
+        empty = ', '.join(f'AVG("{col}" IS NULL)' for col in MISSING_COLUMNS)
+        row = conn.execute(f"SELECT {empty} FROM {_DASHBOARD_SOURCE}{_where(clauses)}", params).fetchone()
+        data["vacios"] = pd.Series([v or 0.0 for v in row], index=list(MISSING_COLUMNS)).sort_values(ascending=False)
+        bins = ' '.join(f"WHEN largo_diagnostico <= {limit} THEN {i}" for i, (limit, _) in enumerate(_LENGTH_BINS))
+        by_bin = _counts(conn, f"CASE {bins} ELSE {len(_LENGTH_BINS)} END", clauses, params, order="k")
+        labels = [label for _, label in _LENGTH_BINS] + ["1200+"]
+        data["largo_diagnostico"] = pd.Series([int(by_bin.get(i, 0)) for i in range(len(labels))], index=labels)
+    finally:
+        if own_transaction:
+            conn.commit()
+    return data
+
+
+def get_comparison(filters: dict, dimension: str, metric: str = None):
+    """
+    Serie por `dimension` (una de COMPARE_DIMENSIONS): número de informes o, con `metric`
+    (una de COMPARE_METRICS), su promedio.
+    """
+    if dimension not in COMPARE_DIMENSIONS or (metric and metric not in COMPARE_METRICS):
+        raise ValueError(f"Dimensión o métrica no permitida: {dimension!r}, {metric!r}")
+    clauses, params = _filter_clauses(filters)
+    conn = get_connection()
+    if not metric:
+        return _counts(conn, f"COALESCE(\"{dimension}\", '')", clauses, params)
+    import pandas as pd
+    rows = conn.execute(
+        f'SELECT "{dimension}", AVG({metric}) FROM {_DASHBOARD_SOURCE}{_where(clauses, f"{metric} IS NOT NULL")} '
+        f'GROUP BY 1 ORDER BY 1', params).fetchall()
+    return pd.Series([v for _, v in rows], index=[k for k, _ in rows], dtype="float64")
+
+
+# ─────────────────────────── LISTADO DE REGISTROS ──────────────────────
+# La vista Visualizar pide ventanas del listado (solo estas columnas, paginadas por cursor)
+# y el registro completo por id al seleccionarlo: nunca carga la tabla entera ni sus textos.
+LISTING_COLUMNS = (KEY_COLUMN, "Primer nombre", "Primer apellido", "Fecha finalizacion (3. Fecha del informe)",
+                   "Malignidad", ORGAN_COLUMN)
+# Columna del listado → expresión de orden, cada una con índice (la fecha, por su columna ISO)
+LISTING_ORDER = {col: f'"{col}"' for col in LISTING_COLUMNS}
+LISTING_ORDER["Fecha finalizacion (3. Fecha del informe)"] = "fecha_informe"
+# Copias plegadas (TYPED_COLUMNS) de petición, primer nombre y primer apellido
+SEARCH_COLUMNS = ("peticion_busqueda", "nombre_busqueda", "apellido_busqueda")
+PAGE_SIZE = 200
+
+
+def _search_clause(search: str) -> tuple:
+    """
+    Condición LIKE sobre petición, nombre y apellido, sin distinguir mayúsculas ni acentos: el
+    texto buscado se pliega con `fold` y se compara con las copias plegadas de SEARCH_COLUMNS
+    ('estupiñan' encuentra 'ESTUPIÑAN').
+    """
+    search = fold((search or '').strip())
+    if not search:
+        return [], []
+    pattern = '%' + search.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%'
+    condition = ' OR '.join(f'{col} LIKE ? ESCAPE \'\\\'' for col in SEARCH_COLUMNS)
+    return [f"({condition})"], [pattern] * len(SEARCH_COLUMNS)
+
+
+def _listing_segments(expr: str, after: tuple, descending: bool) -> list:
+    """
+    Tramos (condición, parámetros) del listado que quedan después del cursor (clave de orden, id),
+    en orden. SQLite ordena los NULL primero en ascendente y al final en descendente; cada tramo
+    es un rango del índice de la columna (el par con id se compara como valor de fila).
+    """
+    op = '<' if descending else '>'
+    in_nulls = after is not None and after[0] is None
+    nulls = (f"{expr} IS NULL AND id {op} ?", [after[1]]) if in_nulls else (f"{expr} IS NULL", [])
+    if after is None or in_nulls:
+        values = (f"{expr} IS NOT NULL", [])
+    else:
+        values = (f"({expr}, id) {op} (?, ?)", list(after))
+    if descending:
+        return [nulls] if in_nulls else [values, nulls]
+    return [values] if after is not None and not in_nulls else [nulls, values]
+
+
+def get_listing_page(order_by: str = KEY_COLUMN, descending: bool = False, after: tuple = None,
+                     limit: int = PAGE_SIZE, search: str = "") -> tuple:
+    """
+    Una ventana del listado ordenada por `order_by` (una de LISTING_COLUMNS) y luego por id:
+    devuelve (filas, cursor). Cada fila es (id, *LISTING_COLUMNS). El cursor se pasa como
+    `after` para pedir la ventana siguiente; es None cuando no quedan filas. Sin OFFSET: cada
+    ventana empieza con una búsqueda en el índice, cueste lo mismo la primera que la última.
+    """
+    if order_by not in LISTING_ORDER:
+        raise ValueError(f"Columna de orden no permitida: {order_by!r}")
+    expr = LISTING_ORDER[order_by]
+    search_clauses, search_params = _search_clause(search)
+    direction = "DESC" if descending else "ASC"
+    columns = ', '.join(f'"{col}"' for col in LISTING_COLUMNS)
+    conn = get_connection()
+    rows = []
+    for condition, params in _listing_segments(expr, after, descending):
+        rows += conn.execute(
+            f"SELECT id, {expr}, {columns} FROM {TABLE_NAME}{_where(search_clauses, condition)} "
+            f"ORDER BY {expr} {direction}, id {direction} LIMIT ?",
+            [*search_params, *params, limit + 1 - len(rows)]).fetchall()
+        if len(rows) > limit:
+            break
+    cursor = (rows[limit - 1][1], rows[limit - 1][0]) if len(rows) > limit else None
+    return [(row[0], *row[2:]) for row in rows[:limit]], cursor
+
+
+def get_record(record_id: int):
+    """Registro completo por id como {columna: valor} (sin id, fecha_procesado ni columnas tipadas)."""
+    cursor = get_connection().cursor()
+    cursor.row_factory = sqlite3.Row     # solo en este cursor: la conexión es compartida
+    row = cursor.execute(f"SELECT * FROM {TABLE_NAME} WHERE id = ?", (record_id,)).fetchone()
+    if row is None:
+        return None
+    return {k: row[k] for k in row.keys() if k not in ('id', 'fecha_procesado') and k not in TYPED_COLUMNS}
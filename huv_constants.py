@@ -3,6 +3,22 @@
 # -*- coding: utf-8 -*-
 """Constantes compartidas para el sistema OCR HUV."""
 
+import sys
+from pathlib import Path
+
+
+# ─────────────────────── CARPETA DEL PROGRAMA ───────────────────────
+def app_dir() -> Path:
+    """Carpeta donde viven los datos persistentes (base de datos, caché OCR, plantillas).
+
+    En el ejecutable de PyInstaller (--onefile) __file__ apunta a la carpeta temporal
+    _MEIPASS, que se borra al cerrar; ahí se usa la carpeta del ejecutable.
+    """
+    if getattr(sys, "frozen", False):
+        return Path(sys.executable).resolve().parent
+    return Path(__file__).resolve().parent
+
+
 # ─────────────────────── CONFIGURACIÓN HOSPITALARIA ───────────────────────
 HUV_CONFIG = {
     'hospital_name': 'HOSPITAL UNIVERSITARIO DEL VALLE',
@@ -68,7 +84,8 @@ PATTERNS_HUV = {
     'certificado_defuncion': r'No\.\s*Certificado\s*de\s*defunción\s*([0-9]+)',
 
     # Responsables
-    'responsable_analisis': r'([A-ZÁÉÍÓÚÑ\s]+)\s*\n\s*Responsable del análisis',
+    # El lookbehind evita reintentar desde cada letra de un bloque en mayúsculas (costo cuadrático)
+    'responsable_analisis': r'(?<![A-ZÁÉÍÓÚÑ\s])([A-ZÁÉÍÓÚÑ\s]+)\s*\n\s*Responsable del análisis',
     'usuario_finalizacion': r'(\d{4}-\d{2}-\d{2}\s+\d{2}:\d{2}:\d{2}),\s*([A-ZÁÉÍÓÚÑ\s]+)',
 
     # --- SECCIÓN CORREGIDA ---
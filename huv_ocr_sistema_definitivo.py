@@ -9,6 +9,7 @@ Este script se encarga de:
 """
 
 import configparser
+import multiprocessing
 import os
 import sys
 import pytesseract
@@ -65,5 +66,7 @@ def main():
 
 
 if __name__ == "__main__":
+    # Necesario para el pool de OCR por página dentro del ejecutable (PyInstaller/Windows).
+    multiprocessing.freeze_support()
     # Este es el único punto de ejecución del programa.
     main()
\ No newline at end of file
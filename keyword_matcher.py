@@ -0,0 +1,80 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Búsqueda de varias palabras clave en una sola pasada.
+
+Las palabras se pliegan igual que el texto (sin acentos, en mayúsculas) y se unen en una
+alternancia con límites de palabra, de la más larga a la más corta, registrada en
+`pattern_registry`. Cada coincidencia informa el término, el texto donde apareció y su
+posición en el texto ORIGINAL (antes de plegar), para poder auditar la decisión y, más
+adelante, mirar el contexto (p. ej. negaciones) sin volver a recorrer el texto.
+"""
+
+import re
+import unicodedata
+
+import pattern_registry
+
+
+def fold(text: str) -> str:
+    """Quita acentos y símbolos no ASCII y pasa a mayúsculas."""
+    return unicodedata.normalize('NFKD', text or '').encode('ASCII', 'ignore').decode().upper()
+
+
+def fold_with_offsets(text: str):
+    """
+    Texto plegado y, si cambió de largo o posiciones, la lista posición plegada → posición
+    original. Para texto ASCII el mapa es la identidad y se devuelve None.
+    """
+    if text.isascii():
+        return text.upper(), None
+    chars, offsets = [], []
+    for i, ch in enumerate(text):
+        folded = ch.upper() if ch.isascii() else fold(ch)
+        chars.append(folded)
+        offsets.extend([i] * len(folded))
+    return "".join(chars), offsets
+
+
+class KeywordMatcher:
+    """Encuentra todas las palabras clave de una lista con una sola expresión compilada."""
+
+    def __init__(self, name: str, keywords):
+        self.keywords = list(dict.fromkeys(fold(k) for k in keywords if k))
+        alternation = "|".join(re.escape(k) for k in sorted(self.keywords, key=len, reverse=True))
+        self.pattern = pattern_registry.register(name, rf'\b(?:{alternation})\b')
+
+    def find(self, *texts: str) -> list:
+        """
+        Coincidencias en orden de aparición: [{"termino", "texto", "inicio", "fin"}], donde
+        "texto" es el índice del argumento y (inicio, fin) la posición en ese texto original.
+        """
+        found = []
+        for index, text in enumerate(texts):
+            if not text:
+                continue
+            folded, offsets = fold_with_offsets(text)
+            for m in self.pattern.finditer(folded):
+                start, end = m.start(), m.end()
+                if offsets is not None:
+                    start, end = offsets[start], offsets[end - 1] + 1
+                found.append({"termino": m.group(0), "texto": index, "inicio": start, "fin": end})
+        return found
+
+    def find_in(self, doc, start: int = 0, end: int = None) -> list:
+        """
+        Coincidencias dentro del rango (start, end) de `doc.text` de un ReportDocument,
+        buscadas en su vista plegada (ya calculada una vez por informe):
+        [{"termino", "inicio", "fin", "linea"}] con la posición en `doc.raw`.
+        """
+        end = len(doc.text) if end is None else end
+        found = []
+        for m in self.pattern.finditer(doc.folded, *doc.folded_span(start, end)):
+            first, last = doc.folded_to_text(m.start()), doc.folded_to_text(m.end() - 1)
+            found.append({"termino": m.group(0), "inicio": doc.to_raw(first),
+                          "fin": doc.to_raw(last) + 1, "linea": doc.line_of(first)})
+        return found
+
+    def any(self, *texts: str) -> bool:
+        """¿Aparece alguna palabra clave? Se detiene en la primera coincidencia."""
+        return any(text and self.pattern.search(fold(text)) for text in texts)
@@ -0,0 +1,195 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Caché en disco del texto OCR por página.
+
+Cada página se indexa por el SHA-256 del PDF, el número de página y los
+parámetros de OCR que influyen en el resultado. Reprocesar un PDF ya visto
+devuelve el texto desde la caché sin renderizar ni invocar Tesseract.
+El tamaño total está acotado (MAX_SIZE_MB) y se expulsan primero las
+entradas usadas hace más tiempo (LRU).
+
+Uso por consola:
+    python ocr_cache.py stats
+    python ocr_cache.py purge [--pdf ruta.pdf]
+"""
+
+import argparse
+import configparser
+import hashlib
+import json
+import sqlite3
+import time
+from pathlib import Path
+
+from huv_constants import app_dir
+
+# ─────────────────────────── CONFIGURACIÓN ─────────────────────────────
+_config = configparser.ConfigParser(interpolation=None)
+_config.read(Path(__file__).resolve().parent / "config.ini", encoding="utf-8")
+
+CACHE_ENABLED = _config.getboolean("CACHE", "ENABLED", fallback=True)
+# Una ruta relativa se toma respecto a la carpeta del programa (o del ejecutable)
+CACHE_DIR = (app_dir() /
+             (_config.get("CACHE", "DIR", fallback="").strip() or "ocr_cache")).resolve()
+MAX_SIZE_MB = _config.getint("CACHE", "MAX_SIZE_MB", fallback=200)
+
+CACHE_DB = CACHE_DIR / "ocr_cache.db"
+TABLE_NAME = "paginas_ocr"
+
+
+def _connect() -> sqlite3.Connection:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    conn = sqlite3.connect(CACHE_DB)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+        key TEXT PRIMARY KEY,
+        pdf_sha256 TEXT NOT NULL,
+        page INTEGER NOT NULL,
+        text TEXT NOT NULL,
+        size INTEGER NOT NULL,
+        last_access REAL NOT NULL,
+        info TEXT
+    )
+    """)
+    # Cachés creadas antes de registrar el nivel de resolución por página
+    columns = [col[1] for col in conn.execute(f"PRAGMA table_info({TABLE_NAME})")]
+    if "info" not in columns:
+        conn.execute(f"ALTER TABLE {TABLE_NAME} ADD COLUMN info TEXT")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_access ON {TABLE_NAME}(last_access)")
+    conn.execute(f"CREATE INDEX IF NOT EXISTS idx_{TABLE_NAME}_pdf ON {TABLE_NAME}(pdf_sha256)")
+    return conn
+
+
+def pdf_sha256(pdf_path: str) -> str:
+    """SHA-256 del contenido del PDF (leído por bloques)."""
+    h = hashlib.sha256()
+    with open(pdf_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def page_key(pdf_hash: str, page_num: int, settings: dict) -> str:
+    """Clave de una página: hash del PDF + página + parámetros de OCR."""
+    payload = json.dumps(settings, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(f"{pdf_hash}:{page_num}:{payload}".encode("utf-8")).hexdigest()
+
+
+def get_pages(keys: dict) -> dict:
+    """
+    Busca varias páginas a la vez. `keys` mapea número de página → clave.
+    Devuelve {página: (texto, info)} solo para las encontradas y actualiza su último acceso.
+    """
+    if not CACHE_ENABLED or not keys:
+        return {}
+    by_key = {k: p for p, k in keys.items()}
+    conn = _connect()
+    try:
+        placeholders = ", ".join(["?"] * len(by_key))
+        rows = conn.execute(
+            f"SELECT key, text, info FROM {TABLE_NAME} WHERE key IN ({placeholders})", list(by_key)
+        ).fetchall()
+        if rows:
+            now = time.time()
+            conn.executemany(
+                f"UPDATE {TABLE_NAME} SET last_access = ? WHERE key = ?", [(now, k) for k, _, _ in rows]
+            )
+            conn.commit()
+        return {by_key[k]: (text, json.loads(info) if info else {}) for k, text, info in rows}
+    finally:
+        conn.close()
+
+
+def put_pages(pdf_hash: str, entries: dict) -> None:
+    """Guarda {clave: (página, texto, info)} y aplica la expulsión LRU por tamaño."""
+    if not CACHE_ENABLED or not entries:
+        return
+    now = time.time()
+    conn = _connect()
+    try:
+        conn.executemany(
+            f"INSERT OR REPLACE INTO {TABLE_NAME} (key, pdf_sha256, page, text, size, last_access, info) "
+            f"VALUES (?, ?, ?, ?, ?, ?, ?)",
+            [(k, pdf_hash, page, text, len(text.encode("utf-8")), now, json.dumps(info, ensure_ascii=False))
+             for k, (page, text, info) in entries.items()],
+        )
+        _evict(conn, MAX_SIZE_MB * 1024 * 1024)
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def _evict(conn: sqlite3.Connection, max_bytes: int) -> int:
+    """Elimina las entradas menos recientes hasta quedar bajo `max_bytes`. Devuelve cuántas borró."""
+    total = conn.execute(f"SELECT COALESCE(SUM(size), 0) FROM {TABLE_NAME}").fetchone()[0]
+    if total <= max_bytes:
+        return 0
+    victims = []
+    for key, size in conn.execute(f"SELECT key, size FROM {TABLE_NAME} ORDER BY last_access ASC"):
+        if total <= max_bytes:
+            break
+        victims.append((key,))
+        total -= size
+    conn.executemany(f"DELETE FROM {TABLE_NAME} WHERE key = ?", victims)
+    return len(victims)
+
+
+def cache_stats() -> dict:
+    """Resumen de la caché: entradas, PDFs distintos y tamaño ocupado."""
+    conn = _connect()
+    try:
+        entries, pdfs, size, oldest, newest = conn.execute(
+            f"SELECT COUNT(*), COUNT(DISTINCT pdf_sha256), COALESCE(SUM(size), 0), "
+            f"MIN(last_access), MAX(last_access) FROM {TABLE_NAME}"
+        ).fetchone()
+    finally:
+        conn.close()
+    return {
+        "ruta": str(CACHE_DB),
+        "habilitada": CACHE_ENABLED,
+        "entradas": entries,
+        "pdfs": pdfs,
+        "bytes": size,
+        "limite_bytes": MAX_SIZE_MB * 1024 * 1024,
+        "ultimo_acceso_min": oldest,
+        "ultimo_acceso_max": newest,
+    }
+
+
+def purge_cache(pdf_path: str = None) -> int:
+    """Vacía la caché completa, o solo las páginas de `pdf_path`. Devuelve las entradas borradas."""
+    conn = _connect()
+    try:
+        if pdf_path:
+            cur = conn.execute(f"DELETE FROM {TABLE_NAME} WHERE pdf_sha256 = ?", (pdf_sha256(pdf_path),))
+        else:
+            cur = conn.execute(f"DELETE FROM {TABLE_NAME}")
+        conn.commit()
+        deleted = cur.rowcount
+        conn.execute("VACUUM")
+        return deleted
+    finally:
+        conn.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Inspección y limpieza de la caché OCR")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Muestra entradas y tamaño de la caché")
+    p_purge = sub.add_parser("purge", help="Vacía la caché (o solo un PDF)")
+    p_purge.add_argument("--pdf", help="Borra solo las páginas de este PDF")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        stats = cache_stats()
+        print(f"📁 Caché OCR: {stats['ruta']} ({'habilitada' if stats['habilitada'] else 'deshabilitada'})")
+        print(f"   Páginas: {stats['entradas']} de {stats['pdfs']} PDF(s)")
+        print(f"   Tamaño: {stats['bytes'] / 1024 / 1024:.2f} MB de {stats['limite_bytes'] / 1024 / 1024:.0f} MB")
+    elif args.command == "purge":
+        deleted = purge_cache(args.pdf)
+        print(f"🧹 {deleted} página(s) eliminadas de la caché.")
+
+
+if __name__ == "__main__":
+    main()
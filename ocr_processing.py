@@ -3,31 +3,48 @@
 # -*- coding: utf-8 -*-
 """Funciones relacionadas con el procesamiento OCR."""
 
-import io
 import os
 import re
 import sys
+import threading
+import time
 import configparser
+import importlib.util
+import multiprocessing
+from abc import ABC, abstractmethod
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 
 import fitz  # PyMuPDF
 from PIL import Image
 import pytesseract
 
+import ocr_cache
+import ocr_templates
+import pattern_registry
+
 # ─────────────────────────── CONFIGURACIÓN ─────────────────────────────
 _config = configparser.ConfigParser(interpolation=None)
 _config.read(Path(__file__).resolve().parent / "config.ini", encoding="utf-8")
 
+_CLEANUP_RE = pattern_registry.register_group("ocr", {
+    'ihq_separado': r'I\s*H\s*Q\s*(\d{5,7})',
+    'ihq_confundido': r'IH[O0lI]\s*(\d{5,7})',
+    'peticion': r'(N[°.\s]*|No\.\s*|Nº\s*|N\s*)petici[oó]n\s*[:\-]?',
+}, re.IGNORECASE)
+_CLEANUP_RE['espacios'] = pattern_registry.register("ocr.espacios", r'[ \t]+')
+
+
 def _post_ocr_cleanup(txt: str) -> str:
     """Normaliza errores comunes del OCR que afectan la segmentación por IHQ."""
     # Une 'I H Q 250006' o 'IHQ 250006' → 'IHQ250006'
-    txt = re.sub(r'I\s*H\s*Q\s*(\d{5,7})', r'IHQ\1', txt, flags=re.IGNORECASE)
+    txt = _CLEANUP_RE['ihq_separado'].sub(r'IHQ\1', txt)
     # Corrige IHO/IH0/lHQ → IHQ solo si van seguidos de 6–7 dígitos
-    txt = re.sub(r'IH[O0lI]\s*(\d{5,7})', r'IHQ\1', txt, flags=re.IGNORECASE)
+    txt = _CLEANUP_RE['ihq_confundido'].sub(r'IHQ\1', txt)
     # Variantes de “N. petición”
-    txt = re.sub(r'(N[°.\s]*|No\.\s*|Nº\s*|N\s*)petici[oó]n\s*[:\-]?', 'N. peticion :', txt, flags=re.IGNORECASE)
+    txt = _CLEANUP_RE['peticion'].sub('N. peticion :', txt)
     # Colapsa espacios múltiples, conserva saltos de línea
-    txt = re.sub(r'[ \t]+', ' ', txt)
+    txt = _CLEANUP_RE['espacios'].sub(' ', txt)
     return txt
 
 if sys.platform.startswith("win"):
@@ -56,61 +73,557 @@ _extra_config = re.sub(r"--psm\s*\d+", "", _extra_config).strip()
 FIRST_PAGE = _config.getint("PROCESSING", "FIRST_PAGE", fallback=1)
 LAST_PAGE = _config.getint("PROCESSING", "LAST_PAGE", fallback=0)
 MIN_WIDTH = _config.getint("PROCESSING", "MIN_WIDTH", fallback=1000)
+# 1 = secuencial; 0 = tantos procesos como núcleos disponibles.
+OCR_WORKERS = _config.getint("PROCESSING", "OCR_WORKERS", fallback=1)
 
+# Resolución adaptativa: primer intento barato a ADAPTIVE_DPI (0 = desactivado) y
+# re-render a DPI solo si la página no supera los controles de calidad.
+ADAPTIVE_DPI = _config.getint("OCR_SETTINGS", "ADAPTIVE_DPI", fallback=0)
+MIN_CONFIDENCE = _config.getfloat("OCR_SETTINGS", "MIN_CONFIDENCE", fallback=70.0)
+# OCR solo de las regiones de interés del layout registrado (código, encabezado, estudios, cuerpo)
+ROI_MODE = _config.getboolean("OCR_SETTINGS", "ROI_MODE", fallback=False)
 
-def pdf_to_text_enhanced(pdf_path: str) -> str:
-    """Convierte PDF a texto con OCR optimizado"""
+_IHQ_CODE_RE = re.compile(r'IHQ\s*\d{5,7}', flags=re.IGNORECASE)
+# Una página útil supera este largo aunque no traiga código IHQ
+_MIN_PAGE_CHARS = 200
+_PAGE_OF_RE = re.compile(r'Pag\.?\s*(\d+)\s*de\s*\d+', flags=re.IGNORECASE)
+# Clasificación previa: una página es digital si su capa de texto tiene al menos estos
+# caracteres y las imágenes cubren menos de esta fracción de su área
+_DIGITAL_MIN_CHARS = 20
+_SCANNED_IMAGE_RATIO = 0.5
+# Resolución del render de sondeo que recorta el cuerpo a la zona con tinta
+_INK_PROBE_DPI = 36
+
+
+def _ocr_lang() -> str:
+    # Idioma por defecto: español+inglés (mejor para siglas)
+    return LANGUAGE if LANGUAGE else "spa+eng"
+
+
+def _tesseract_config(psm: int) -> str:
+    return f"--oem 1 --psm {psm} {_extra_config}".strip()
+
+
+# ─────────────────────── MOTORES (BACKENDS) DE OCR ───────────────────────
+# API C de Tesseract: motor residente en el proceso (opcional). Se importa al crear el primer
+# motor y no aquí: OpenMP lee OMP_THREAD_LIMIT al cargar la librería, y los procesos del pool
+# lo fijan en _init_page_worker, después de importar este módulo.
+tesserocr = None
+
+
+def tesserocr_available() -> bool:
+    """True si tesserocr está instalado (sin cargarlo)."""
+    return tesserocr is not None or importlib.util.find_spec("tesserocr") is not None
+
+
+def _import_tesserocr():
+    global tesserocr
+    if tesserocr is None:
+        import tesserocr as module
+        tesserocr = module
+    return tesserocr
+
+# auto = tesserocr si está instalado, si no pytesseract
+OCR_BACKEND = _config.get("OCR_SETTINGS", "BACKEND", fallback="auto").strip().lower()
+
+
+class OCRBackend(ABC):
+    """Interfaz de un motor OCR sobre imágenes PIL en escala de grises."""
+    name = "base"
+
+    @abstractmethod
+    def image_to_string(self, img, psm: int) -> str:
+        ...
+
+    @abstractmethod
+    def image_to_data(self, img, psm: int) -> dict:
+        """Columnas por palabra al estilo TSV de Tesseract: text, conf, block_num, par_num, line_num."""
+
+    def close(self) -> None:
+        pass
+
+
+class PytesseractBackend(OCRBackend):
+    """Lanza un proceso `tesseract` por llamada (recarga el traineddata cada vez). Respaldo universal."""
+    name = "pytesseract"
+
+    def image_to_string(self, img, psm: int) -> str:
+        return pytesseract.image_to_string(img, lang=_ocr_lang(), config=_tesseract_config(psm))
+
+    def image_to_data(self, img, psm: int) -> dict:
+        return pytesseract.image_to_data(img, lang=_ocr_lang(), config=_tesseract_config(psm),
+                                         output_type=pytesseract.Output.DICT)
+
+
+class TesserocrBackend(OCRBackend):
+    """Motor Tesseract residente: carga el modelo una vez por PSM y lo reutiliza en cada página."""
+    name = "tesserocr"
+
+    def __init__(self):
+        self._apis = {}
+        # Las banderas '-c nombre=valor' de OCR_CONFIG se aplican como variables del motor
+        self._variables = re.findall(r"-c\s+([^=\s]+)=(\S+)", _extra_config)
+
+    def _api(self, psm: int):
+        api = self._apis.get(psm)
+        if api is None:
+            tesserocr = _import_tesserocr()
+            kwargs = {"lang": _ocr_lang(), "psm": psm, "oem": tesserocr.OEM.LSTM_ONLY}
+            tessdata = _tessdata_path()
+            if tessdata:
+                kwargs["path"] = tessdata
+            api = tesserocr.PyTessBaseAPI(**kwargs)
+            for name, value in self._variables:
+                api.SetVariable(name, value)
+            self._apis[psm] = api
+        return api
+
+    def image_to_string(self, img, psm: int) -> str:
+        api = self._api(psm)
+        api.SetImage(img)
+        return api.GetUTF8Text()
+
+    def image_to_data(self, img, psm: int) -> dict:
+        api = self._api(psm)
+        api.SetImage(img)
+        api.Recognize()
+        data = {"block_num": [], "par_num": [], "line_num": [], "conf": [], "text": []}
+        for row in api.GetTSVText(0).splitlines():
+            cols = row.split("\t")
+            if len(cols) < 12:
+                continue
+            data["block_num"].append(int(cols[2]))
+            data["par_num"].append(int(cols[3]))
+            data["line_num"].append(int(cols[4]))
+            data["conf"].append(float(cols[10]))
+            data["text"].append(cols[11])
+        return data
+
+    def close(self) -> None:
+        for api in self._apis.values():
+            api.End()
+        self._apis.clear()
+
+
+def _tessdata_path():
+    """Carpeta tessdata junto al ejecutable configurado (Windows); None = la del sistema/TESSDATA_PREFIX."""
+    if os.getenv("TESSDATA_PREFIX") or not tesseract_cmd:
+        return None
+    candidate = Path(tesseract_cmd).parent / "tessdata"
+    return str(candidate) if candidate.is_dir() else None
+
+
+def _resolved_backend_name() -> str:
+    if OCR_BACKEND in ("auto", "tesserocr") and tesserocr_available():
+        return "tesserocr"
+    return "pytesseract"
+
+
+def create_ocr_backend(name: str = None) -> OCRBackend:
+    """Crea el motor pedido (o el de config.ini); si tesserocr no está disponible usa pytesseract."""
+    name = (name or OCR_BACKEND).lower()
+    if name in ("auto", "tesserocr"):
+        if not tesserocr_available():
+            if name == "tesserocr":
+                print("ADVERTENCIA: tesserocr no está instalado; se usará pytesseract.")
+        else:
+            backend = TesserocrBackend()
+            try:
+                backend._api(PSM_MODE)  # Carga el modelo ahora para detectar fallos de instalación
+                return backend
+            except Exception as e:
+                print(f"ADVERTENCIA: no se pudo iniciar tesserocr ({e}); se usará pytesseract.")
+    return PytesseractBackend()
+
+
+# Un motor por hilo: la API de Tesseract no es segura entre hilos
+_backend_local = threading.local()
+
+
+def _backend() -> OCRBackend:
+    backend = getattr(_backend_local, "backend", None)
+    if backend is None:
+        backend = _backend_local.backend = create_ocr_backend()
+    return backend
+
+
+def _render_zoom(page, dpi: int, min_width: int = 0) -> float:
+    zoom = dpi / 72
+    if min_width and page.rect.width * zoom < min_width:
+        zoom = min_width / page.rect.width
+    return zoom
+
+
+def _render_gray(page, dpi: int, min_width: int = 0, clip=None) -> Image.Image:
+    """
+    Renderiza la página directamente en escala de grises a la resolución final.
+    Si el ancho a `dpi` queda por debajo de `min_width`, se aumenta el zoom del render
+    en lugar de reescalar la imagen después. El buffer del pixmap se envuelve sin copiarlo.
+    Con `clip` solo se rasteriza esa caja (el zoom sigue calculándose sobre la página completa).
+    """
+    zoom = _render_zoom(page, dpi, min_width)
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), clip=clip, colorspace=fitz.csGRAY, alpha=False)
+    samples = getattr(pix, "samples_mv", None) or pix.samples
+    img = Image.frombuffer("L", (pix.width, pix.height), samples, "raw", "L", pix.stride, 1)
+    # La imagen comparte memoria con el pixmap: se mantiene vivo mientras exista la imagen
+    img._pixmap = pix
+    return img
+
+
+def _ocr_page(page, template: str = None) -> tuple:
+    """
+    Renderiza una página y aplica Tesseract. Se intenta primero el PSM aprendido para la
+    plantilla de la página; si no hay o falla, el PSM declarado y los alternos.
+    Devuelve (texto, info de PSM).
+    """
+    img = _render_gray(page, DPI, MIN_WIDTH)
+    backend = _backend()
+    if template is None:
+        template = ocr_templates.template_key(ocr_templates.page_features(page, img))
+    learned = ocr_templates.learned_psm(template)
+
+    # Aprendido primero; luego PSM declarado y alternos (6 y 4 cubren la mayoría de layouts)
+    tried_psm = []
+    candidates = ([learned] if learned else []) + [PSM_MODE] + [m for m in (6, 4) if m != PSM_MODE]
+    page_text, page_type = "", "desconocida"
+    for psm in candidates:
+        if psm in tried_psm:
+            continue
+        tried_psm.append(psm)
+        page_text = backend.image_to_string(img, psm)
+        # Las páginas de continuación son válidas aunque no traigan el código IHQ
+        page_type = ocr_templates.classify_page_text(_post_ocr_cleanup(page_text))
+        ok = ocr_templates.is_acceptable(page_text, page_type)
+        ocr_templates.record_psm(template, psm, ok)
+        if ok:
+            break
+    return page_text, {"plantilla": template, "tipo_pagina": page_type,
+                       "psm": tried_psm[-1], "intentos_psm": len(tried_psm)}
+
+
+def _ocr_page_low_res(page) -> tuple:
+    """
+    Primer nivel de la resolución adaptativa: render en grises a ADAPTIVE_DPI, sin reescalar
+    a MIN_WIDTH y con una sola pasada de Tesseract (PSM aprendido para la plantilla o PSM_MODE).
+    Devuelve (texto, confianza media, plantilla, psm).
+    """
+    img = _render_gray(page, ADAPTIVE_DPI)
+    template = ocr_templates.template_key(ocr_templates.page_features(page, img))
+    psm = ocr_templates.learned_psm(template) or PSM_MODE
+
+    data = _backend().image_to_data(img, psm)
+
+    # Reconstruye el texto por línea (bloque/párrafo/línea) a partir de las palabras
+    lines, confs, current = [], [], None
+    for i, word in enumerate(data["text"]):
+        if not word or not word.strip():
+            continue
+        line_id = (data["block_num"][i], data["par_num"][i], data["line_num"][i])
+        if line_id != current:
+            if current is not None and line_id[:2] != current[:2]:
+                lines.append("")
+            lines.append(word)
+            current = line_id
+        else:
+            lines[-1] += " " + word
+        conf = float(data["conf"][i])
+        if conf >= 0:
+            confs.append(conf)
+
+    text = "\n".join(lines) + "\n" if lines else ""
+    mean_conf = sum(confs) / len(confs) if confs else 0.0
+    return text, mean_conf, template, psm
+
+
+def _ink_clip(page, rect):
+    """Reduce `rect` a la zona con tinta según un render de sondeo; None si la caja está en blanco."""
+    probe = _render_gray(page, _INK_PROBE_DPI, clip=rect)
+    bbox = probe.point(lambda v: 255 if v < 128 else 0).getbbox()
+    if bbox is None:
+        return None
+    scale = 72 / _INK_PROBE_DPI
+    margin = 4
+    ink = fitz.Rect(rect.x0 + bbox[0] * scale - margin, rect.y0 + bbox[1] * scale - margin,
+                    rect.x0 + bbox[2] * scale + margin, rect.y0 + bbox[3] * scale + margin)
+    return ink & rect
+
+
+def _ocr_page_regions(page, layout: dict, template: str = None):
+    """
+    OCR por regiones de interés del layout: el código (con 'Pag. n de m') decide si la página
+    es la primera del informe; luego se leen las filas del encabezado y las regiones de esa
+    posición, cada una con su PSM. El cuerpo se recorta a la zona con tinta.
+    Devuelve (texto, info) o None si el resultado no es aceptable y hay que leer la página completa.
+    """
+    backend = _backend()
+    zoom = _render_zoom(page, DPI, MIN_WIDTH)
+    body_psm = (ocr_templates.learned_psm(template) if template else None) or PSM_MODE
+    pixels, names = 0, []
+
+    def read(region):
+        nonlocal pixels
+        rect = fitz.Rect(region["caja"]) & page.rect
+        if region.get("recortar"):
+            rect = _ink_clip(page, rect)
+        if rect is None or rect.is_empty:
+            return ""
+        img = _render_gray(page, DPI, MIN_WIDTH, clip=rect)
+        pixels += img.width * img.height
+        names.append(region["nombre"])
+        return backend.image_to_string(img, region.get("psm") or body_psm).rstrip()
+
+    parts = [read(layout["codigo"])]
+    page_of = _PAGE_OF_RE.search(parts[0])
+    position = "siguiente" if page_of and page_of.group(1) != "1" else "primera"
+    parts += [read(region) for region in layout["encabezado"]]
+    parts += [read(region) for region in layout[position]]
+
+    text = "\n".join(p for p in parts if p) + "\n"
+    page_type = ocr_templates.classify_page_text(_post_ocr_cleanup(text))
+    if not ocr_templates.is_acceptable(text, page_type):
+        return None
+    full_pixels = round(page.rect.width * zoom) * round(page.rect.height * zoom)
+    return text, {"plantilla": template, "tipo_pagina": page_type, "psm": body_psm, "intentos_psm": 1,
+                  "roi": position, "regiones": names, "fraccion_pixeles": round(pixels / full_pixels, 3)}
+
+
+def _passes_quality(text: str, page_type: str, mean_conf: float) -> bool:
+    """
+    Controles para aceptar el primer nivel: confianza media y, según el tipo de página,
+    código IHQ completo con largo mínimo (encabezado) o 'Pag. n de m' con n > 1 (continuación).
+    Una página 'sin_codigo' o 'desconocida' escala al DPI completo.
+    """
+    if mean_conf < MIN_CONFIDENCE:
+        return False
+    if page_type == "encabezado":
+        return len(text) > _MIN_PAGE_CHARS
+    return page_type == "continuacion"
+
+
+def _extract_page(doc, page_num: int) -> tuple:
+    """
+    Devuelve (texto limpio, info) de una página: nativo si es confiable, OCR si no.
+    `info` registra la fuente y el nivel de resolución que necesitó la página
+    (0 = texto nativo, 1 = ADAPTIVE_DPI, 2 = DPI completo, por regiones si ROI_MODE), más
+    plantilla y PSM si hubo OCR.
+    """
+    page = doc.load_page(page_num)
+    start = time.perf_counter()
+
+    # 1) Intento texto nativo (mucho más limpio si el PDF no es escaneado)
+    native = page.get_text("text") or ""
+    if _IHQ_CODE_RE.search(native) and len(native) > 100:
+        page_text = native
+        info = {"fuente": "nativo", "nivel": 0, "dpi": None, "confianza": None}
+    else:
+        info, template = None, None
+        # 2) OCR barato a baja resolución; solo se acepta si supera los controles de calidad
+        if 0 < ADAPTIVE_DPI < DPI:
+            page_text, mean_conf, template, psm = _ocr_page_low_res(page)
+            page_type = ocr_templates.classify_page_text(_post_ocr_cleanup(page_text))
+            ocr_templates.record_psm(template, psm, ocr_templates.is_acceptable(page_text, page_type))
+            if _passes_quality(page_text, page_type, mean_conf):
+                info = {"fuente": "ocr", "nivel": 1, "dpi": ADAPTIVE_DPI, "confianza": round(mean_conf, 1),
+                        "plantilla": template, "tipo_pagina": page_type, "psm": psm, "intentos_psm": 1}
+        # 3) A DPI completo, solo las regiones de interés si la página tiene un layout registrado
+        if info is None and ROI_MODE:
+            layout = ocr_templates.layout_for(page)
+            result = _ocr_page_regions(page, layout, template) if layout else None
+            if result is not None:
+                page_text, roi_info = result
+                info = {"fuente": "ocr", "nivel": 2, "dpi": DPI, "confianza": None, **roi_info}
+        # 4) Escalamiento a OCR completo con preprocesamiento + PSM aprendido o reintentos
+        if info is None:
+            page_text, psm_info = _ocr_page(page, template)
+            info = {"fuente": "ocr", "nivel": 2, "dpi": DPI, "confianza": None, **psm_info}
+        info["segundos"] = round(time.perf_counter() - start, 3)
+
+    # Limpieza post-OCR / nativo para estabilizar tokens de corte
+    return _post_ocr_cleanup(page_text), info
+
+
+# ─────────────────────── OCR PARALELO POR PÁGINA ───────────────────────
+_worker_doc = None
+
+
+def _init_page_worker(pdf_path: str, learned: dict) -> None:
+    """
+    Inicializa un proceso del pool: abre el PDF una sola vez, limita hilos de Tesseract y fija
+    el aprendizaje de PSM leído al empezar el documento.
+    """
+    global _worker_doc
+    # Cada proceso ya ocupa un núcleo; evita que Tesseract lance sus propios hilos OpenMP.
+    # Se fija antes de cargar tesserocr (al crear el motor) y lo heredan los procesos de pytesseract.
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+    _worker_doc = fitz.open(pdf_path)
+    ocr_templates.use_snapshot(learned)
+
+
+def _extract_page_in_worker(page_num: int) -> tuple:
+    return _extract_page(_worker_doc, page_num)
+
+
+def _resolve_workers(n_pages: int) -> int:
+    workers = OCR_WORKERS if OCR_WORKERS > 0 else (os.cpu_count() or 1)
+    return max(1, min(workers, n_pages))
+
+
+def _page_range(doc) -> range:
+    start_page = max(0, FIRST_PAGE - 1)
+    end_page = LAST_PAGE if LAST_PAGE > 0 else len(doc)
+    return range(start_page, min(end_page, len(doc)))
+
+
+def _ocr_settings() -> dict:
+    """Parámetros que alteran el texto de una página; forman parte de la clave de caché."""
+    return {
+        "DPI": DPI,
+        "PSM_MODE": PSM_MODE,
+        "LANGUAGE": LANGUAGE,
+        "OCR_CONFIG": _extra_config,
+        "MIN_WIDTH": MIN_WIDTH,
+        "RENDER": "gris-directo",
+        "BACKEND": _resolved_backend_name(),
+        "ADAPTIVE_DPI": ADAPTIVE_DPI,
+        "MIN_CONFIDENCE": MIN_CONFIDENCE if ADAPTIVE_DPI else None,
+        "ROI": ocr_templates.layouts_fingerprint() if ROI_MODE else None,
+    }
+
+
+def _iter_extract_pages(pdf_path: str, page_nums: list):
+    """Extrae las páginas indicadas en orden, en paralelo si OCR_WORKERS lo permite. Genera (página, (texto, info))."""
+    if not page_nums:
+        return
+    # Un solo aprendizaje de PSM para todo el documento, en ambos modos: lo aprendido en PDFs
+    # anteriores queda disponible y lo que se aprenda en este se aplica desde el siguiente
+    learned = ocr_templates.snapshot()
+    workers = _resolve_workers(len(page_nums))
+    if workers > 1:
+        # Si tesserocr ya está cargado aquí, un proceso bifurcado (fork) heredaría OpenMP ya
+        # iniciado sin el límite de hilos: esos procesos se lanzan desde cero (spawn).
+        context = multiprocessing.get_context("spawn") if tesserocr is not None else None
+        pool = ProcessPoolExecutor(max_workers=workers, initializer=_init_page_worker,
+                                   initargs=(pdf_path, learned), mp_context=context)
+        try:
+            # map() entrega en orden de página aunque los procesos terminen desordenados
+            yield from zip(page_nums, pool.map(_extract_page_in_worker, page_nums))
+        finally:
+            pool.shutdown(wait=True, cancel_futures=True)
+        return
+
+    doc = fitz.open(pdf_path)
     try:
-        full_text = ""
-        doc = fitz.open(pdf_path)
+        for page_num in page_nums:
+            yield page_num, _extract_page(doc, page_num)
+    finally:
+        doc.close()
 
-        start_page = max(0, FIRST_PAGE - 1)
-        end_page = LAST_PAGE if LAST_PAGE > 0 else len(doc)
 
-        for page_num in range(start_page, min(end_page, len(doc))):
-            page = doc.load_page(page_num)
+# ─────────────────────── CLASIFICACIÓN PREVIA DEL PDF ───────────────────────
+# Segundos de OCR y páginas OCR de la sesión, para estimar el tiempo evitado
+_ocr_totals = {"segundos": 0.0, "paginas": 0}
+
+
+def classify_pdf(doc, page_nums) -> dict:
+    """
+    Clasifica el documento como 'digital', 'escaneado' o 'mixto' según cobertura de la capa
+    de texto y fracción del área ocupada por imágenes en cada página.
+    Devuelve {"tipo", "digitales": {página: texto nativo}, "escaneadas": [páginas]}.
+    """
+    digital, scanned = {}, []
+    for page_num in page_nums:
+        page = doc.load_page(page_num)
+        native = page.get_text("text") or ""
+        area = page.rect.get_area() or 1
+        image_area = sum((fitz.Rect(img["bbox"]) & page.rect).get_area() for img in page.get_image_info())
+        if len(native.strip()) >= _DIGITAL_MIN_CHARS and image_area / area < _SCANNED_IMAGE_RATIO:
+            digital[page_num] = native
+        else:
+            scanned.append(page_num)
+    kind = "digital" if not scanned else ("escaneado" if not digital else "mixto")
+    return {"tipo": kind, "digitales": digital, "escaneadas": scanned}
 
-            # 1) Intento texto nativo (mucho más limpio si el PDF no es escaneado)
-            native = page.get_text("text") or ""
-            native_ok = bool(re.search(r'IHQ\s*\d{5,7}', native, flags=re.IGNORECASE))
-            if native_ok and len(native) > 100:
-                page_text = native
-            else:
-                # 2) Fallback a OCR con preprocesamiento + reintento de PSM
-                pix = page.get_pixmap(matrix=fitz.Matrix(DPI / 72, DPI / 72))
-                img_bytes = pix.tobytes("ppm")
-                img = Image.open(io.BytesIO(img_bytes))
-
-                if img.mode != "L":
-                    img = img.convert("L")
-
-                if img.width < MIN_WIDTH:
-                    scale = MIN_WIDTH / img.width
-                    new_size = (int(img.width * scale), int(img.height * scale))
-                    img = img.resize(new_size, Image.LANCZOS)
-
-                # Idioma por defecto: español+inglés (mejor para siglas)
-                lang = LANGUAGE if LANGUAGE else "spa+eng"
-
-                # Probamos PSM declarado y un alterno (6 y 4 cubren la mayoría de layouts)
-                tried_psm = []
-                candidates = [PSM_MODE] + [m for m in (6, 4) if m != PSM_MODE]
-                page_text = ""
-                for psm in candidates:
-                    if psm in tried_psm:
-                        continue
-                    tried_psm.append(psm)
-                    config_str = f"--oem 1 --psm {psm} {_extra_config}".strip()
-                    page_text = pytesseract.image_to_string(img, lang=lang, config=config_str)
-                    if re.search(r'IHQ\s*\d{5,7}', page_text, flags=re.IGNORECASE) or len(page_text) > 200:
-                        break
-
-            # Limpieza post-OCR / nativo para estabilizar tokens de corte
-            page_text = _post_ocr_cleanup(page_text)
-            full_text += f"\n--- PÁGINA {page_num + 1} ---\n" + page_text
 
+def _log_classification(pdf_path: str, classification: dict, ocr_seconds: float, ocr_pages: int) -> None:
+    """Registra la clase del PDF, las páginas que no se rasterizaron y el tiempo de OCR evitado."""
+    # Páginas digitales que la regla por página (código IHQ y > 100 caracteres) habría mandado a OCR
+    avoided = sum(1 for text in classification["digitales"].values()
+                  if not (_IHQ_CODE_RE.search(text) and len(text) > 100))
+    _ocr_totals["segundos"] += ocr_seconds
+    _ocr_totals["paginas"] += ocr_pages
+    if _ocr_totals["paginas"]:
+        per_page = _ocr_totals["segundos"] / _ocr_totals["paginas"]
+        estimate = f"~{avoided * per_page:.1f} s de OCR evitados"
+    else:
+        estimate = "sin OCR medido en la sesión para estimar el tiempo"
+    n_digital = len(classification["digitales"])
+    total = n_digital + len(classification["escaneadas"])
+    ocr_part = f"; OCR de {ocr_pages} pág. en {ocr_seconds:.1f} s" if ocr_pages else ""
+    print(f"📄 {Path(pdf_path).name}: {classification['tipo']} ({n_digital}/{total} páginas digitales; "
+          f"{avoided} página(s) que antes iban a OCR no se rasterizaron, {estimate}{ocr_part})")
+
+
+def iter_pdf_pages(pdf_path: str, with_info: bool = False, pages=None):
+    """
+    Genera (número de página base 0, texto limpio) en orden, a medida que cada página termina.
+    Permite que la segmentación y extracción empiecen antes de que acabe el OCR del documento.
+    Con `with_info=True` genera (página, texto, info), donde `info` indica fuente, nivel de
+    resolución, DPI y confianza de la página, y si salió de la caché.
+    Con `pages` (números base 0, p. ej. `ReportSpan.pages`) se leen solo esas páginas en
+    lugar del rango FIRST_PAGE/LAST_PAGE.
+    """
+    doc = fitz.open(pdf_path)
+    try:
+        pages = _page_range(doc) if pages is None else [p for p in pages if 0 <= p < len(doc)]
+        # Las páginas digitales usan su capa de texto sin rasterizar ni pasar por la caché
+        classification = classify_pdf(doc, pages)
+    finally:
         doc.close()
-        return full_text
+    digital = classification["digitales"]
+
+    # Páginas ya procesadas con los mismos parámetros salen de la caché
+    keys = {}
+    if ocr_cache.CACHE_ENABLED and classification["escaneadas"]:
+        pdf_hash = ocr_cache.pdf_sha256(pdf_path)
+        settings = _ocr_settings()
+        keys = {page_num: ocr_cache.page_key(pdf_hash, page_num, settings)
+                for page_num in classification["escaneadas"]}
+    cached = ocr_cache.get_pages(keys)
+
+    extracted = _iter_extract_pages(pdf_path, [p for p in classification["escaneadas"] if p not in cached])
+    ocr_seconds, ocr_pages = 0.0, 0
+    try:
+        for page_num in pages:
+            if page_num in digital:
+                page_text = _post_ocr_cleanup(digital[page_num])
+                info = {"fuente": "nativo", "nivel": 0, "dpi": None, "confianza": None,
+                        "clase_pdf": classification["tipo"], "cache": False}
+            elif page_num in cached:
+                page_text, info = cached[page_num]
+                info = dict(info, cache=True)
+            else:
+                _, (page_text, info) = next(extracted)
+                if info["fuente"] == "ocr":
+                    ocr_seconds += info["segundos"]
+                    ocr_pages += 1
+                if keys:
+                    ocr_cache.put_pages(pdf_hash, {keys[page_num]: (page_num, page_text, info)})
+                info = dict(info, cache=False)
+            yield (page_num, page_text, info) if with_info else (page_num, page_text)
+        _log_classification(pdf_path, classification, ocr_seconds, ocr_pages)
+    finally:
+        extracted.close()
+
+
+def format_page(page_num: int, page_text: str) -> str:
+    """Antepone el separador '--- PÁGINA n ---' usado en el texto de documento completo."""
+    return f"\n--- PÁGINA {page_num + 1} ---\n" + page_text
+
+
+def pdf_to_text_enhanced(pdf_path: str) -> str:
+    """Convierte PDF a texto con OCR optimizado"""
+    try:
+        return "".join(format_page(page_num, page_text)
+                       for page_num, page_text in iter_pdf_pages(pdf_path))
     except Exception as e:
         raise Exception(f"Error procesando PDF {pdf_path}: {str(e)}")
-
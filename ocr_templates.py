@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro de plantillas de página para el OCR.
+
+Clasifica cada página escaneada por rasgos de layout (tamaño, posición en el PDF,
+densidad de tinta) en una plantilla, y aprende qué PSM de Tesseract funciona para
+cada una. Cuando una plantilla acumula suficientes aciertos con un PSM, las
+corridas siguientes lo usan directamente y se omiten los reintentos.
+
+El texto de la primera pasada se clasifica como 'encabezado' (trae el código IHQ
+completo), 'sin_codigo' (trae el campo 'N. peticion' pero el código no se leyó),
+'continuacion' ('Pag. n de m' con n > 1 y sin campo 'N. peticion': páginas que
+legítimamente no traen el código) o 'desconocida'.
+
+También registra las regiones de interés (ROI) de cada layout de informe: código,
+filas del encabezado, tabla 'Estudios solicitados' y cuerpo. Las cajas por defecto se
+midieron sobre los informes IHQ nativos de muestra y pueden aprenderse de otro PDF
+nativo del mismo layout con `learn`.
+
+Uso por consola:
+    python ocr_templates.py stats
+    python ocr_templates.py reset
+    python ocr_templates.py learn informe_nativo.pdf
+"""
+
+import argparse
+import hashlib
+import json
+import re
+import sqlite3
+
+import fitz  # PyMuPDF
+
+from ocr_cache import CACHE_DIR
+
+TEMPLATES_DB = CACHE_DIR / "ocr_plantillas.db"
+TABLE_NAME = "psm_por_plantilla"
+REGIONS_TABLE = "regiones_por_layout"
+
+# Un PSM se considera aprendido con este mínimo de aciertos y esta tasa de éxito
+_MIN_ACIERTOS = 3
+_MIN_TASA = 0.8
+# Una página 'desconocida' se acepta si supera este largo (mismo criterio que el OCR)
+_MIN_PAGE_CHARS = 200
+
+_IHQ_CODE_RE = re.compile(r'IHQ\s*\d{6}', re.IGNORECASE)
+_PETICION_RE = re.compile(r'N\.\s*petici[oó]n\s*:', re.IGNORECASE)
+_PAGE_OF_RE = re.compile(r'Pag\.?\s*(\d+)\s*de\s*\d+', re.IGNORECASE)
+
+# Aprendizaje vigente para el documento en curso: {plantilla: psm}
+_learned = None
+
+
+def _connect() -> sqlite3.Connection:
+    CACHE_DIR.mkdir(parents=True, exist_ok=True)
+    # Varios procesos del pool pueden registrar resultados a la vez
+    conn = sqlite3.connect(TEMPLATES_DB, timeout=30)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {TABLE_NAME} (
+        plantilla TEXT NOT NULL,
+        psm INTEGER NOT NULL,
+        intentos INTEGER NOT NULL DEFAULT 0,
+        aciertos INTEGER NOT NULL DEFAULT 0,
+        PRIMARY KEY (plantilla, psm)
+    )
+    """)
+    conn.execute(f"""
+    CREATE TABLE IF NOT EXISTS {REGIONS_TABLE} (
+        tamano TEXT PRIMARY KEY,
+        layout TEXT NOT NULL
+    )
+    """)
+    return conn
+
+
+# ─────────────────────── CLASIFICACIÓN DE PÁGINAS ───────────────────────
+
+def page_features(page, img) -> dict:
+    """Rasgos de layout baratos: tamaño de página, posición en el PDF y densidad de tinta del render."""
+    small = img.reduce(8) if min(img.size) >= 64 else img
+    hist = small.histogram()
+    dark = sum(hist[:128])
+    ink = dark / max(1, small.width * small.height)
+    return {
+        "ancho": round(page.rect.width),
+        "alto": round(page.rect.height),
+        "primera": page.number == 0,
+        "tinta": ink,
+    }
+
+
+def template_key(features: dict) -> str:
+    """Plantilla de layout: tamaño + primera/siguiente + nivel de tinta (baja/media/alta)."""
+    ink = features["tinta"]
+    nivel = "baja" if ink < 0.03 else ("media" if ink < 0.08 else "alta")
+    posicion = "primera" if features["primera"] else "siguiente"
+    return f"{features['ancho']}x{features['alto']}|{posicion}|tinta-{nivel}"
+
+
+def classify_page_text(text: str) -> str:
+    """
+    'encabezado', 'sin_codigo', 'continuacion' o 'desconocida' según el texto de la primera pasada.
+    Los títulos de sección (DIAGNÓSTICO, firma) también aparecen en la primera página, así que
+    solo el número de página decide la continuación: una primera página con el código mal leído
+    queda como 'sin_codigo' y debe pasar al siguiente nivel de resolución o de PSM.
+    """
+    if _IHQ_CODE_RE.search(text):
+        return "encabezado"
+    if _PETICION_RE.search(text):
+        return "sin_codigo"
+    page_of = _PAGE_OF_RE.search(text)
+    if page_of and int(page_of.group(1)) > 1:
+        return "continuacion"
+    return "desconocida"
+
+
+def is_acceptable(text: str, page_type: str) -> bool:
+    """
+    Una página de encabezado o de continuación reconocida es válida; la que trae el campo
+    'N. peticion' sin código legible nunca lo es, por largo que sea el texto.
+    """
+    if page_type in ("encabezado", "continuacion"):
+        return True
+    if page_type == "sin_codigo":
+        return False
+    return len(text) > _MIN_PAGE_CHARS
+
+
+# ─────────────────────── APRENDIZAJE DE PSM ───────────────────────
+
+def _load_learned() -> dict:
+    conn = _connect()
+    try:
+        rows = conn.execute(
+            f"SELECT plantilla, psm, intentos, aciertos FROM {TABLE_NAME} ORDER BY aciertos DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+    learned = {}
+    for plantilla, psm, intentos, aciertos in rows:
+        if plantilla not in learned and aciertos >= _MIN_ACIERTOS and aciertos / intentos >= _MIN_TASA:
+            learned[plantilla] = psm
+    return learned
+
+
+def reload() -> None:
+    """Vuelve a leer el aprendizaje desde disco."""
+    global _learned
+    _learned = _load_learned()
+
+
+def snapshot() -> dict:
+    """
+    Lee el aprendizaje al empezar un documento y lo devuelve para los procesos del pool.
+    Lo que se registre durante el documento (record_psm) se aplica desde el siguiente, así
+    el modo secuencial y el paralelo usan el mismo PSM para cada página.
+    """
+    reload()
+    return dict(_learned)
+
+
+def use_snapshot(learned: dict) -> None:
+    """Fija el aprendizaje leído por snapshot() (al iniciar un proceso del pool)."""
+    global _learned
+    _learned = dict(learned)
+
+
+def learned_psm(template: str):
+    """PSM aprendido para la plantilla, o None si aún no hay evidencia suficiente."""
+    if _learned is None:
+        reload()
+    return _learned.get(template)
+
+
+def record_psm(template: str, psm: int, ok: bool) -> None:
+    """Registra el resultado de un intento de OCR con `psm` sobre una página de la plantilla."""
+    conn = _connect()
+    try:
+        conn.execute(
+            f"INSERT INTO {TABLE_NAME} (plantilla, psm, intentos, aciertos) VALUES (?, ?, 1, ?) "
+            f"ON CONFLICT(plantilla, psm) DO UPDATE SET intentos = intentos + 1, aciertos = aciertos + excluded.aciertos",
+            (template, psm, int(ok)),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def template_stats() -> list:
+    """Filas (plantilla, psm, intentos, aciertos) ordenadas por plantilla."""
+    conn = _connect()
+    try:
+        return conn.execute(
+            f"SELECT plantilla, psm, intentos, aciertos FROM {TABLE_NAME} ORDER BY plantilla, aciertos DESC"
+        ).fetchall()
+    finally:
+        conn.close()
+
+
+def reset_templates() -> None:
+    """Olvida todo lo aprendido."""
+    global _learned
+    conn = _connect()
+    try:
+        conn.execute(f"DELETE FROM {TABLE_NAME}")
+        conn.commit()
+    finally:
+        conn.close()
+    _learned = {}
+
+
+# ─────────────────────── REGIONES POR LAYOUT (ROI) ───────────────────────
+# Cajas en puntos PDF (x0, y0, x1, y1). psm None = PSM aprendido de la plantilla o PSM_MODE.
+# Los dos layouts de PATTERNS_IHQ ('Informe de Estudios…' y 'Se recibe orden…') comparten
+# esta geometría; solo cambia el contenido del cuerpo.
+DEFAULT_LAYOUTS = {
+    "595x842": {
+        # Código IHQ y 'Final Pag. n de m' arriba a la derecha
+        "codigo": {"nombre": "codigo", "caja": [480, 44, 545, 78], "psm": 6},
+        # Una fila por línea del encabezado (dos columnas clave : valor)
+        "encabezado": [
+            {"nombre": "fila_1", "caja": [19, 116, 591, 133], "psm": 7},
+            {"nombre": "fila_2", "caja": [19, 129, 591, 146], "psm": 7},
+            {"nombre": "fila_3", "caja": [19, 141, 591, 158], "psm": 7},
+            {"nombre": "fila_4", "caja": [19, 154, 591, 171], "psm": 7},
+            {"nombre": "fila_5", "caja": [19, 166, 591, 183], "psm": 7},
+        ],
+        # Primera página del informe: tabla de estudios + cuerpo desde 'INFORME DE ANATOMÍA'
+        "primera": [
+            {"nombre": "estudios_solicitados", "caja": [19, 222, 595, 275], "psm": 6},
+            {"nombre": "cuerpo", "caja": [19, 275, 591, 788], "psm": None, "recortar": True},
+        ],
+        # Páginas siguientes: cuerpo (diagnóstico, firma, nota) bajo el encabezado
+        "siguiente": [
+            {"nombre": "cuerpo", "caja": [19, 185, 591, 788], "psm": None, "recortar": True},
+        ],
+    },
+}
+
+_layouts = None
+
+
+def _load_layouts() -> dict:
+    layouts = json.loads(json.dumps(DEFAULT_LAYOUTS))
+    conn = _connect()
+    try:
+        for tamano, layout in conn.execute(f"SELECT tamano, layout FROM {REGIONS_TABLE}"):
+            layouts[tamano] = json.loads(layout)
+    finally:
+        conn.close()
+    return layouts
+
+
+def page_size_key(page) -> str:
+    return f"{round(page.rect.width)}x{round(page.rect.height)}"
+
+
+def layout_for(page):
+    """Layout ROI registrado para el tamaño de la página, o None si no hay."""
+    global _layouts
+    if _layouts is None:
+        _layouts = _load_layouts()
+    return _layouts.get(page_size_key(page))
+
+
+def layouts_fingerprint() -> str:
+    """Huella de los layouts vigentes (forma parte de la clave de caché en modo ROI)."""
+    global _layouts
+    if _layouts is None:
+        _layouts = _load_layouts()
+    payload = json.dumps(_layouts, sort_keys=True)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()[:12]
+
+
+def learn_layout(pdf_path: str) -> str:
+    """
+    Aprende las cajas ROI de un PDF nativo (con capa de texto) de un layout de informe:
+    ubica el código, las filas del encabezado, 'Estudios solicitados', 'INFORME DE
+    ANATOMÍA' y el pie 'Todos los análisis'. Guarda el layout y devuelve su tamaño.
+    """
+    global _layouts
+    doc = fitz.open(pdf_path)
+    try:
+        page = doc[0]
+        lines = []
+        for block in page.get_text("dict")["blocks"]:
+            for line in block.get("lines", []):
+                text = "".join(span["text"] for span in line["spans"]).strip()
+                if text:
+                    lines.append((fitz.Rect(line["bbox"]), text))
+
+        def find(pattern):
+            for rect, text in lines:
+                if re.match(pattern, text, re.IGNORECASE):
+                    return rect
+            return None
+
+        code = find(r'IHQ\d{6}$')
+        pag = find(r'Final\s+Pag')
+        rows = [find(label) for label in (r'Nombre$', r'N\.Identificaci', r'Edad$', r'M[ée]dico tratante', r'Fecha Ingreso')]
+        estudios = find(r'Estudios solicitados')
+        informe = find(r'INFORME DE ANATOM')
+        footer = find(r'Todos los an[aá]lisis')
+        if not all(rows) or not (code and estudios and informe and footer):
+            raise ValueError("El PDF no tiene texto nativo con los encabezados esperados del informe IHQ.")
+
+        width = page.rect.width
+        left = min(r.x0 for r in rows) - 4
+        top_code = code | pag if pag else code
+        layout = {
+            "codigo": {"nombre": "codigo", "caja": [round(v) for v in (top_code.x0 - 4, top_code.y0 - 4,
+                                                                       top_code.x1 + 8, top_code.y1 + 4)], "psm": 6},
+            "encabezado": [
+                {"nombre": f"fila_{i}", "caja": [round(left), round(r.y0 - 2), round(width - 4), round(r.y1 + 1)], "psm": 7}
+                for i, r in enumerate(rows, 1)
+            ],
+            "primera": [
+                {"nombre": "estudios_solicitados",
+                 "caja": [round(left), round(estudios.y0 - 4), round(width), round(informe.y0 - 2)], "psm": 6},
+                {"nombre": "cuerpo",
+                 "caja": [round(left), round(informe.y0 - 2), round(width - 4), round(footer.y0 - 2)],
+                 "psm": None, "recortar": True},
+            ],
+            "siguiente": [
+                {"nombre": "cuerpo",
+                 "caja": [round(left), round(rows[-1].y1 + 3), round(width - 4), round(footer.y0 - 2)],
+                 "psm": None, "recortar": True},
+            ],
+        }
+        tamano = page_size_key(page)
+    finally:
+        doc.close()
+
+    conn = _connect()
+    try:
+        conn.execute(f"INSERT OR REPLACE INTO {REGIONS_TABLE} (tamano, layout) VALUES (?, ?)",
+                     (tamano, json.dumps(layout)))
+        conn.commit()
+    finally:
+        conn.close()
+    _layouts = None
+    return tamano
+
+
+def main():
+    parser = argparse.ArgumentParser(description="PSM aprendido por plantilla de página")
+    sub = parser.add_subparsers(dest="command", required=True)
+    sub.add_parser("stats", help="Muestra intentos y aciertos por plantilla y PSM")
+    sub.add_parser("reset", help="Olvida lo aprendido")
+    p_learn = sub.add_parser("learn", help="Aprende las regiones ROI de un PDF nativo")
+    p_learn.add_argument("pdf")
+    args = parser.parse_args()
+
+    if args.command == "stats":
+        learned = _load_learned()
+        rows = template_stats()
+        if not rows:
+            print("ℹ️  Aún no hay plantillas registradas.")
+        for plantilla, psm, intentos, aciertos in rows:
+            mark = "✅" if learned.get(plantilla) == psm else "  "
+            print(f"{mark} {plantilla:<36} psm {psm:<3} {aciertos}/{intentos} aciertos")
+    elif args.command == "reset":
+        reset_templates()
+        print("🧹 Aprendizaje de PSM reiniciado.")
+    elif args.command == "learn":
+        tamano = learn_layout(args.pdf)
+        print(f"✅ Regiones ROI registradas para páginas de {tamano} puntos.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,292 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Registro central de expresiones regulares de extracción.
+
+Cada módulo registra sus patrones una sola vez al importarse, con sus banderas, y
+usa los objetos compilados en lugar de `re.search(patron_crudo, ...)`. Así ningún
+patrón depende de la caché interna (pequeña) del módulo `re`, y el registro sabe
+cuánto tardó en compilarse cada uno.
+
+Cada patrón tiene una `version` (hash de su texto y banderas); `version(*nombres)` combina
+las de varios patrones y sirve para saber qué campos extraídos quedaron desactualizados.
+
+Con `enable_profiling()` cada patrón acumula llamadas y tiempo de búsqueda; `stats()`
+devuelve ambos para perfilar la extracción (ver `scripts/bench_pipeline.py --regex`).
+
+Presupuesto de tiempo: ninguna búsqueda puede tardar más de `[PROCESSING] REGEX_BUDGET_MS`
+(config.ini). Si se excede, la búsqueda se interrumpe y devuelve vacío (None, [] o el texto
+sin cambios) en lugar de colgar al proceso; el campo queda sin dato y se cuenta en `stats()`.
+El motor es siempre `re`, cortado con SIGALRM, que solo interrumpe en el hilo principal de
+sistemas POSIX. Donde no se puede (el hilo de trabajo de la interfaz, Windows) y el módulo
+`regex` está instalado (requirements.txt), la búsqueda corre en su motor con `timeout=`; los
+patrones registrados dan los mismos resultados en ambos (test_sistema.py lo comprueba sobre
+los informes de muestra). Sin `regex`, la búsqueda termina igual y se cuenta como excedida.
+`scripts/bench_regex.py` detecta los patrones superlineales.
+
+Uso por consola:
+    python pattern_registry.py
+"""
+
+import configparser
+import hashlib
+import re
+import signal
+import threading
+import time
+from pathlib import Path
+
+try:
+    import regex  # motor con timeout por búsqueda, válido fuera del hilo principal (opcional)
+except ImportError:
+    regex = None
+
+_config = configparser.ConfigParser(interpolation=None)
+_config.read(Path(__file__).resolve().parent / "config.ini", encoding="utf-8")
+
+# Nombre completo ('grupo.clave') → Pattern
+_registry = {}
+_profiling = False
+
+# ───────────────────────── Presupuesto de tiempo ─────────────────────────
+_budget_s = _config.getint("PROCESSING", "REGEX_BUDGET_MS", fallback=500) / 1000
+_CAN_INTERRUPT = hasattr(signal, "setitimer")
+_MAIN_THREAD = threading.main_thread().ident
+_armed = False
+_PENDING = object()
+
+
+class RegexTimeout(Exception):
+    """Una búsqueda superó el tiempo disponible."""
+
+
+def _on_alarm(signum, frame):
+    # Una alarma que llega después de desarmar (ya terminó la búsqueda) se ignora
+    if _armed:
+        raise RegexTimeout()
+
+
+def set_budget(ms: float) -> None:
+    """Tiempo máximo por búsqueda en milisegundos (0 = sin límite)."""
+    global _budget_s
+    _budget_s = max(0.0, ms) / 1000
+
+
+def get_budget_ms() -> float:
+    return 1000 * _budget_s
+
+
+def _regex_flags(flags: int) -> int:
+    """Banderas de `re` en el módulo `regex` (los valores coinciden salvo ASCII)."""
+    return sum(getattr(regex, flag.name) for flag in re.RegexFlag if flags & flag and hasattr(regex, flag.name))
+
+
+def _interruptible() -> bool:
+    """True si SIGALRM puede cortar una búsqueda de `re` en este hilo."""
+    return _CAN_INTERRUPT and threading.get_ident() == _MAIN_THREAD
+
+
+def run_with_limit(func, *args, seconds: float):
+    """
+    Ejecuta `func(*args)` interrumpiéndolo con RegexTimeout si pasa de `seconds`. Devuelve
+    (resultado, interrumpible): fuera del hilo principal o sin SIGALRM no se puede cortar
+    y la llamada corre completa.
+    """
+    global _armed
+    if _armed or not _interruptible():
+        return func(*args), False
+    previous = signal.signal(signal.SIGALRM, _on_alarm)
+    result = _PENDING
+    _armed = True
+    signal.setitimer(signal.ITIMER_REAL, seconds)
+    try:
+        result = func(*args)
+        # Se desarma antes de salir del try: una alarma posterior ya no descarta el resultado
+        _armed = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+    except RegexTimeout:
+        # La alarma llegó justo después de terminar: el resultado calculado vale
+        if result is _PENDING:
+            raise
+    finally:
+        _armed = False
+        signal.setitimer(signal.ITIMER_REAL, 0)
+        signal.signal(signal.SIGALRM, previous)
+    return result, True
+
+
+class Pattern:
+    """Patrón compilado con nombre; mide tiempo por llamada cuando el perfilado está activo."""
+
+    __slots__ = ("name", "regex", "compile_s", "calls", "seconds", "timeouts", "over_budget", "_guarded")
+
+    def __init__(self, name: str, pattern: str, flags: int = 0):
+        self.name = name
+        start = time.perf_counter()
+        self.regex = re.compile(pattern, flags)
+        self.compile_s = time.perf_counter() - start
+        self.calls = 0
+        self.seconds = 0.0
+        self.timeouts = 0       # búsquedas interrumpidas por presupuesto
+        self.over_budget = 0    # búsquedas que lo excedieron sin poder interrumpirse
+        self._guarded = None    # el mismo patrón en el motor `regex` (respaldo), compilado al primer uso
+
+    @property
+    def pattern(self) -> str:
+        return self.regex.pattern
+
+    @property
+    def flags(self) -> int:
+        return self.regex.flags
+
+    @property
+    def version(self) -> str:
+        """Hash del contenido del patrón: cambia solo si cambian su texto o sus banderas."""
+        return hashlib.sha256(f"{self.regex.pattern}\0{self.regex.flags}".encode("utf-8")).hexdigest()[:12]
+
+    def guarded(self):
+        """El patrón compilado en el motor `regex` (None si no está instalado)."""
+        if self._guarded is None and regex is not None:
+            self._guarded = regex.compile(self.regex.pattern, _regex_flags(self.regex.flags))
+        return self._guarded
+
+    def _run(self, name, empty, *args):
+        """
+        Ejecuta el método `name` del patrón con presupuesto (y medición si el perfilado está
+        activo). `finditer` se materializa: el recorrido es lo costoso y se mide (y corta) completo.
+        Con SIGALRM disponible corre en `re`; si no, en el respaldo `regex` con `timeout=`.
+        """
+        def call(method, **timeout):
+            result = method(*args, **timeout)
+            return list(result) if name == "finditer" else result
+
+        method = getattr(self.regex, name)
+        if not _profiling and not _budget_s:
+            return method(*args)
+        start = time.perf_counter()
+        try:
+            if not _budget_s:
+                return call(method)
+            if not _interruptible() and self.guarded() is not None:
+                return call(getattr(self._guarded, name), timeout=_budget_s)
+            result, interruptible = run_with_limit(call, method, seconds=_budget_s)
+            if not interruptible and time.perf_counter() - start > _budget_s:
+                self.over_budget += 1
+            return result
+        except (RegexTimeout, TimeoutError):
+            self.timeouts += 1
+            print(f"⚠️ Patrón '{self.name}' superó {get_budget_ms():.0f} ms: se devuelve vacío")
+            return empty
+        finally:
+            if _profiling:
+                self.seconds += time.perf_counter() - start
+                self.calls += 1
+
+    def search(self, text, *args):
+        return self._run("search", None, text, *args)
+
+    def match(self, text, *args):
+        return self._run("match", None, text, *args)
+
+    def findall(self, text, *args):
+        return self._run("findall", [], text, *args)
+
+    def finditer(self, text, *args):
+        if not _profiling and not _budget_s:
+            return self.regex.finditer(text, *args)
+        return iter(self._run("finditer", [], text, *args))
+
+    def sub(self, repl, text, count: int = 0):
+        return self._run("sub", text, repl, text, count)
+
+    def split(self, text, maxsplit: int = 0):
+        return self._run("split", [text], text, maxsplit)
+
+    def __repr__(self) -> str:
+        return f"Pattern({self.name!r}, {self.regex.pattern!r})"
+
+
+def register(name: str, pattern: str, flags: int = 0) -> Pattern:
+    """Compila y registra un patrón. Registrar dos veces el mismo nombre devuelve el existente."""
+    existing = _registry.get(name)
+    if existing is not None:
+        if existing.pattern != pattern or existing.flags != re.compile(pattern, flags).flags:
+            raise ValueError(f"El patrón '{name}' ya está registrado con otra definición.")
+        return existing
+    compiled = _registry[name] = Pattern(name, pattern, flags)
+    return compiled
+
+
+def register_group(group: str, patterns: dict, flags: int = 0) -> dict:
+    """Registra un diccionario {clave: patrón} bajo 'grupo.clave'; devuelve {clave: Pattern}."""
+    return {key: register(f"{group}.{key}", pattern, flags) for key, pattern in patterns.items()}
+
+
+def get(name: str) -> Pattern:
+    return _registry[name]
+
+
+def version(*names: str) -> str:
+    """
+    Hash combinado de los patrones indicados ('grupo.clave' o 'grupo.*' para todo un grupo).
+    Un nombre no registrado es un error: la versión de un campo no puede omitir una regla.
+    """
+    digest = hashlib.sha256()
+    for name in names:
+        if name.endswith(".*"):
+            matched = sorted(k for k in _registry if k.startswith(name[:-1]))
+        else:
+            matched = [name] if name in _registry else []
+        if not matched:
+            raise KeyError(name)
+        for key in matched:
+            digest.update(f"{key}={_registry[key].version};".encode("utf-8"))
+    return digest.hexdigest()[:12]
+
+
+def enable_profiling(enabled: bool = True) -> None:
+    """Activa o desactiva la medición de tiempo por llamada."""
+    global _profiling
+    _profiling = enabled
+
+
+def reset_stats() -> None:
+    """Pone en cero llamadas y tiempos de búsqueda (no los de compilación)."""
+    for p in _registry.values():
+        p.calls = 0
+        p.seconds = 0.0
+        p.timeouts = 0
+        p.over_budget = 0
+
+
+def stats() -> list:
+    """Una fila por patrón, ordenadas por tiempo total de búsqueda (desc.)."""
+    rows = [{
+        "patron": p.name,
+        "compilacion_ms": round(1000 * p.compile_s, 3),
+        "llamadas": p.calls,
+        "total_ms": round(1000 * p.seconds, 3),
+        "media_us": round(1e6 * p.seconds / p.calls, 1) if p.calls else None,
+        "interrumpidas": p.timeouts,
+        "excedidas": p.over_budget,
+    } for p in _registry.values()]
+    return sorted(rows, key=lambda r: (-r["total_ms"], r["patron"]))
+
+
+def total_compile_seconds() -> float:
+    return sum(p.compile_s for p in _registry.values())
+
+
+def main():
+    # Importar los extractores registra sus patrones (en el módulo importado, no en __main__)
+    import procesador_ihq_biomarcadores  # noqa: F401
+    import pattern_registry as registry
+
+    rows = sorted(registry.stats(), key=lambda r: -r["compilacion_ms"])
+    print(f"🧩 {len(rows)} patrones registrados, compilados en {1000 * registry.total_compile_seconds():.1f} ms")
+    for r in rows:
+        print(f"   {r['compilacion_ms']:>8.3f} ms  {r['patron']}")
+
+
+if __name__ == "__main__":
+    main()
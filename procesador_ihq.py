@@ -11,7 +11,6 @@ de los PDFs de IHQ, garantizando precisión al no depender de constantes genéri
 import os
 import re
 import sys
-import unicodedata
 from pathlib import Path
 from datetime import datetime, date
 from dateutil.relativedelta import relativedelta
@@ -32,8 +31,12 @@ try:
     from ocr_processing import pdf_to_text_enhanced
     # Importamos solo las configuraciones y constantes GENÉRICAS que sí aplican
     from huv_constants import HUV_CONFIG, CUPS_CODES, PROCEDIMIENTOS, PATTERNS_HUV
+    import pattern_registry
+    from report_sections import ReportDocument, search_in
+    from keyword_matcher import KeywordMatcher
 except ImportError:
-    print("ERROR: Asegúrese de que 'ocr_processing.py' y 'huv_constants.py' estén accesibles.")
+    print("ERROR: Asegúrese de que 'ocr_processing.py', 'huv_constants.py', 'pattern_registry.py', "
+          "'report_sections.py' y 'keyword_matcher.py' estén accesibles.")
     sys.exit(1)
 
 # ─────────────────────── CONSTANTES ESPECIALIZADAS PARA IHQ ─────────────────────────
@@ -61,6 +64,92 @@ PATTERNS_IHQ = {
     # Patrón más genérico para el responsable, busca un nombre encima de su título.
     'responsable_ihq': r'([A-Z\s]+)\n\s*(?:Médica Patóloga|Responsable del análisis)',
 }
+
+# ─────────────────────── PATRONES COMPILADOS (una vez al importar) ─────────────────────────
+_HUV_RE = pattern_registry.register_group("huv", PATTERNS_HUV, re.IGNORECASE | re.DOTALL)
+_IHQ_RE = pattern_registry.register_group("ihq", PATTERNS_IHQ, re.IGNORECASE | re.DOTALL)
+# Ámbito de búsqueda de cada patrón (ver report_sections.SectionIndex.scope); sin ámbito = texto completo.
+# Si el ámbito no trae coincidencia se busca en todo el texto, como antes.
+_HUV_SCOPES = {
+    **{key: 'encabezado' for key in (
+        'nombre_completo', 'numero_peticion', 'identificacion_completa', 'identificacion_numero',
+        'tipo_documento', 'genero', 'edad', 'eps', 'medico_tratante', 'servicio',
+        'fecha_ingreso', 'fecha_informe',
+    )},
+    'responsable_analisis': 'firma',
+}
+_IHQ_SCOPES = {
+    'descripcion_macroscopica_ihq': 'macroscopica',
+    'descripcion_microscopica_ihq': 'microscopica',
+    'diagnostico_final_ihq': 'diagnostico',
+    'fecha_diagnostico_ihq': 'macroscopica',
+    'responsable_ihq': 'firma',
+}
+# Todas las palabras de malignidad en una sola alternancia (una pasada por texto)
+_MALIGNIDAD = KeywordMatcher("ihq.malignidad", MALIGNIDAD_KEYWORDS_IHQ)
+_EDAD_RE = pattern_registry.register_group("ihq.edad", {
+    'anios': r'(\d+)\s*a[ñn]os',
+    'meses': r'(\d+)\s*mes(es)?',
+    'dias': r'(\d+)\s*d[ií]as',
+}, re.IGNORECASE)
+_ORGANO_RE = pattern_registry.register_group("ihq.organo", {
+    'rotulo': r'ROTULO\s+CORRESPONDIENTE\s+A\s*["“]?([^"”\n]+)',
+    'correspondiente': r'CORRESPONDIENTE\s+A\s*["“]?([^"”\n]+)',
+    'corresponde': r'CORRESPONDE\s+A\s*["“]?([^"”\n]+)',
+    'con_diagnostico': r'["“]([^"”\n]+)["”]\s+CON\s+DIAGN[OÓ]STICO',  # “... ” con diagnóstico ...
+}, re.IGNORECASE)
+_AUX_RE = pattern_registry.register_group("ihq.aux", {
+    'espacios': r'\s+',
+    'no_digitos': r'[^\d]',
+    'numero': r'(\d+)',
+    'ruido_diagnostico': r'\s*\.?\s*Nanty T“M a U',
+    'fila_organo': r'(?i)ALMACENAMIENTO[^\n]*ORGANO[^\n]*\n([^\n]+)',
+    'columnas': r'\s{2,}',
+})
+
+# ─────────────────────── VERSIÓN DE CADA CAMPO ─────────────────────────
+# Patrones (nombres del registro) de los que depende cada columna de map_to_excel_format.
+# El hash combinado es la versión del campo: si no cambia, re-extraer no puede cambiar el
+# valor y reextraccion_ihq.py lo salta. Las columnas constantes (HUV_CONFIG, CUPS) no figuran.
+_BASE_RULES = ("secciones.encabezados", "ihq.aux.espacios")
+_RESPONSABLE_RULES = _BASE_RULES + ("ihq.responsable_ihq", "huv.responsable_analisis")
+COLUMN_RULES = {
+    "N. peticion (0. Numero de biopsia)": _BASE_RULES + ("huv.numero_peticion",),
+    "N. muestra": _BASE_RULES + ("huv.numero_peticion",),
+    "EPS": _BASE_RULES + ("huv.eps",),
+    "Servicio": _BASE_RULES + ("huv.servicio",),
+    "Ubicación": _BASE_RULES + ("huv.servicio",),
+    "Especialidad": _BASE_RULES + ("huv.servicio",),
+    "Médico tratante": _BASE_RULES + ("huv.medico_tratante",),
+    "Datos Clinicos": _BASE_RULES + ("ihq.descripcion_macroscopica_ihq",),
+    "Fecha ordenamiento": _BASE_RULES + ("ihq.fecha_diagnostico_ihq",),
+    "Tipo de documento": _BASE_RULES + ("huv.tipo_documento",),
+    "N. de identificación": _BASE_RULES + ("huv.identificacion_numero", "ihq.aux.no_digitos"),
+    "Primer nombre": _BASE_RULES + ("huv.nombre_completo",),
+    "Segundo nombre": _BASE_RULES + ("huv.nombre_completo",),
+    "Primer apellido": _BASE_RULES + ("huv.nombre_completo",),
+    "Segundo apellido": _BASE_RULES + ("huv.nombre_completo",),
+    "Fecha de nacimiento": _BASE_RULES + ("huv.edad", "huv.fecha_ingreso", "ihq.edad.*"),
+    "Edad": _BASE_RULES + ("huv.edad", "ihq.aux.numero"),
+    "Genero": _BASE_RULES + ("huv.genero",),
+    "Organo (1. Muestra enviada a patología)": _BASE_RULES + (
+        "ihq.descripcion_macroscopica_ihq", "ihq.organo.*", "ihq.aux.fila_organo", "ihq.aux.columnas"),
+    "Fecha de ingreso (2. Fecha de la muestra)": _BASE_RULES + ("huv.fecha_ingreso",),
+    "Fecha finalizacion (3. Fecha del informe)": _BASE_RULES + ("huv.fecha_informe",),
+    "Usuario finalizacion": _RESPONSABLE_RULES,
+    "Responsable macro": _RESPONSABLE_RULES,
+    "Malignidad": _BASE_RULES + ("ihq.diagnostico_final_ihq", "ihq.malignidad"),
+    "Descripcion macroscopica": _BASE_RULES + ("ihq.descripcion_macroscopica_ihq",),
+    "Descripcion microscopica (8,9, 10,12,. Invasión linfovascular y perineural, indice mitótico/Ki67, Inmunohistoquímica, tamaño tumoral)":
+        _BASE_RULES + ("ihq.descripcion_microscopica_ihq",),
+    "Descripcion Diagnostico (5,6,7 Tipo histológico, subtipo histológico, margenes tumorales)":
+        _BASE_RULES + ("ihq.diagnostico_final_ihq", "ihq.aux.ruido_diagnostico"),
+}
+
+
+def column_versions() -> dict:
+    """Versión (hash de sus patrones) de cada columna base: {columna: version}."""
+    return {column: pattern_registry.version(*names) for column, names in COLUMN_RULES.items()}
 # (En la sección de FUNCIONES DE UTILIDAD)
 
 def split_full_name(full_name: str) -> dict:
@@ -82,9 +171,9 @@ def split_full_name(full_name: str) -> dict:
 def calculate_birth_date(edad_str: str, fecha_referencia_str: str = None) -> str:
     """CORREGIDO: Implementación precisa que usa años, meses y días."""
     try:
-        years_match = re.search(r'(\d+)\s*a[ñn]os', edad_str, re.IGNORECASE)
-        months_match = re.search(r'(\d+)\s*mes(es)?', edad_str, re.IGNORECASE)
-        days_match = re.search(r'(\d+)\s*d[ií]as', edad_str, re.IGNORECASE)
+        years_match = _EDAD_RE['anios'].search(edad_str)
+        months_match = _EDAD_RE['meses'].search(edad_str)
+        days_match = _EDAD_RE['dias'].search(edad_str)
         
         years = int(years_match.group(1)) if years_match else 0
         months = int(months_match.group(1)) if months_match else 0
@@ -111,16 +200,16 @@ def convert_date_format(date_str: str) -> str:
         except ValueError: pass
     return date_str
 
-def _normalize_text(u: str) -> str:
-    return unicodedata.normalize('NFKD', u or '').encode('ASCII', 'ignore').decode().upper()
+def find_malignancy_terms(*texts: str) -> list:
+    """
+    Términos de malignidad presentes en los textos, en una sola pasada por texto:
+    [{"termino", "texto", "inicio", "fin"}] con la posición en el texto original.
+    """
+    return _MALIGNIDAD.find(*texts)
 
 def detect_malignancy_ihq(*texts: str) -> str:
     """CORREGIDO: Usa la lista de palabras clave específica de IHQ."""
-    text_to_check = " ".join(_normalize_text(t) for t in texts if t)
-    for keyword in MALIGNIDAD_KEYWORDS_IHQ:
-        if re.search(r'\b' + keyword + r'\b', text_to_check):
-            return 'PRESENTE'
-    return 'AUSENTE'
+    return 'PRESENTE' if _MALIGNIDAD.any(*texts) else 'AUSENTE'
 
 def deduce_specialty_ihq(servicio: str) -> str:
     # Lógica de especialidad, puede ser tan específica como se necesite
@@ -184,19 +273,28 @@ Validación
 - Registrar vacío cuando no se mencione explícitamente en el texto.
 """
 
-def extract_ihq_data(text: str) -> dict:
-    """Función orquestadora mejorada para la extracción de datos de AMBOS tipos de IHQ."""
+def extract_ihq_data(report) -> dict:
+    """
+    Función orquestadora mejorada para la extracción de datos de AMBOS tipos de IHQ.
+    Recibe el texto del informe o un `ReportDocument` (cuyas vistas en caché comparte con
+    el extractor de biomarcadores); cada patrón busca en su sección del informe.
+    """
+    doc = ReportDocument.of(report)
+    text, sections = doc.text, doc.sections
     data = {}
-    
+    spans = {}    # posición (en doc.text) de cada bloque de IHQ encontrado
+
     # 1. Extracción básica con patrones comunes
-    for key, pattern in PATTERNS_HUV.items():
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
-        data[key] = re.sub(r'\s+', ' ', match.group(1).strip()) if match else ''
+    for key, pattern in _HUV_RE.items():
+        match = search_in(pattern, text, sections, _HUV_SCOPES.get(key))
+        data[key] = _AUX_RE['espacios'].sub(' ', match.group(1).strip()) if match else ''
 
     # 2. Extracción de bloques con los patrones flexibles de IHQ
-    for key, pattern in PATTERNS_IHQ.items():
-        match = re.search(pattern, text, re.IGNORECASE | re.DOTALL)
+    for key, pattern in _IHQ_RE.items():
+        match = search_in(pattern, text, sections, _IHQ_SCOPES.get(key))
         data[key] = match.group(1).strip() if match else ''
+        if match:
+            spans[key] = match.span(1)
 
     # 3. Normalización y Lógica de Negocio Adaptativa
     data['tipo_informe'] = 'INMUNOHISTOQUIMICA'
@@ -207,15 +305,15 @@ def extract_ihq_data(text: str) -> dict:
         data.update(split_full_name(data['nombre_completo']))
         
     if data.get('identificacion_numero'):
-        data['identificacion_numero'] = re.sub(r'[^\d]', '', data['identificacion_numero'])
+        data['identificacion_numero'] = _AUX_RE['no_digitos'].sub('', data['identificacion_numero'])
         
     if data.get('edad'):
         data['fecha_nacimiento'] = calculate_birth_date(data['edad'], convert_date_format(data.get('fecha_ingreso')))
-        data['edad'] = re.search(r'(\d+)', data['edad']).group(1) if re.search(r'(\d+)', data['edad']) else ''
+        edad_match = _AUX_RE['numero'].search(data['edad'])
+        data['edad'] = edad_match.group(1) if edad_match else ''
     
     # Lógica para encontrar al responsable (funciona para ambos casos)
-    resp_name_match = re.search(PATTERNS_IHQ['responsable_ihq'], text, re.IGNORECASE)
-    resp_name = resp_name_match.group(1).strip() if resp_name_match else data.get('responsable_analisis', '')
+    resp_name = data.get('responsable_ihq') or data.get('responsable_analisis', '')
     
     if 'NANCY MEJIA' in resp_name.upper():
         data['responsable_final'] = 'NANCY MEJIA'
@@ -228,7 +326,10 @@ def extract_ihq_data(text: str) -> dict:
     data['n_autorizacion'] = 'COEX'
     data['identificador_unico'] = '0'
     data['especialidad_deducida'] = deduce_specialty_ihq(data.get('servicio', ''))
-    data['malignidad'] = detect_malignancy_ihq(data.get('diagnostico_final_ihq', ''))
+    # Términos, posiciones (en el texto del informe) y línea que sustentan la decisión, para auditoría
+    diag_span = spans.get('diagnostico_final_ihq')
+    data['malignidad_terminos'] = _MALIGNIDAD.find_in(doc, *diag_span) if diag_span else []
+    data['malignidad'] = 'PRESENTE' if data['malignidad_terminos'] else 'AUSENTE'
     
     # Lógica para prefijos de descripción
     if "Se recibe orden" in text:
@@ -241,42 +342,37 @@ def extract_ihq_data(text: str) -> dict:
     data['descripcion_microscopica_final'] = data.get('descripcion_microscopica_ihq', '').strip()
     data['diagnostico_final'] = data.get('diagnostico_final_ihq', '').strip()
     # Elimina específicamente el texto basura del OCR y cualquier línea vacía resultante.
-    data['diagnostico_final'] = re.sub(r'\s*\.?\s*Nanty T“M a U', '', data['diagnostico_final']).strip()
+    data['diagnostico_final'] = _AUX_RE['ruido_diagnostico'].sub('', data['diagnostico_final']).strip()
 
     # Lógica para encontrar el órgano (tolerante a OCR y variantes de redacción)
     organo_final = ''
 
-    macro_txt = data.get('descripcion_macroscopica_final', '') or ''
-    macro_norm = _normalize_text(macro_txt)
-
-    # 1) “RÓTULO CORRESPONDIENTE A "..."” o “CORRESPONDE/ CORRESPONDIENTE A "..."”
-    for pat in [
-        r'ROTULO\s+CORRESPONDIENTE\s+A\s*["“]?([^"”\n]+)',
-        r'CORRESPONDIENTE\s+A\s*["“]?([^"”\n]+)',
-        r'CORRESPONDE\s+A\s*["“]?([^"”\n]+)',
-        r'["“]([^"”\n]+)["”]\s+CON\s+DIAGN[OÓ]STICO'  # “... ” con diagnóstico ...
-    ]:
-        m = re.search(pat, macro_norm, re.IGNORECASE)
-        if m:
-            organo_final = m.group(1).strip(' ."”')
-            break
+    # 1) “RÓTULO CORRESPONDIENTE A "..."” o “CORRESPONDE/ CORRESPONDIENTE A "..."”,
+    #    sobre la vista plegada del informe acotada a la descripción macroscópica
+    macro_span = spans.get('descripcion_macroscopica_ihq')
+    if macro_span:
+        macro_folded = doc.folded_span(*macro_span)
+        for pat in _ORGANO_RE.values():
+            m = pat.search(doc.folded, *macro_folded)
+            if m:
+                organo_final = m.group(1).strip(' ."”')
+                break
 
     # 2) Fallback: tabla “Estudios solicitados …  Organo”
     if not organo_final:
         # Captura la línea inmediatamente posterior al encabezado con la palabra ORGANO
-        mrow = re.search(r'(?i)ALMACENAMIENTO[^\n]*ORGANO[^\n]*\n([^\n]+)', text)
+        mrow = _AUX_RE['fila_organo'].search(text)
         if mrow:
             # Divide por grandes espacios entre columnas y toma la celda de órgano
-            parts = re.split(r'\s{2,}', mrow.group(1).strip())
+            parts = _AUX_RE['columnas'].split(mrow.group(1).strip())
             if len(parts) >= 2:
                 organo_final = parts[1].strip()
 
     data['organo_final'] = organo_final if organo_final else 'No especificado'
 
     # Lógica para encontrar la fecha de ordenamiento
-    fecha_diag_match = re.search(PATTERNS_IHQ['fecha_diagnostico_ihq'], text, re.IGNORECASE)
-    if fecha_diag_match:
-        data['fecha_ordenamiento'] = convert_date_format(fecha_diag_match.group(1))
+    if data.get('fecha_diagnostico_ihq'):
+        data['fecha_ordenamiento'] = convert_date_format(data['fecha_diagnostico_ihq'])
     else:
         # Valor por defecto o buscar otra fecha si es necesario. Para el primer caso, se usaba un valor fijo.
         # Aquí puedes decidir qué hacer si no se encuentra. Por ahora, lo dejamos vacío si no lo halla.
@@ -1,21 +1,21 @@
 #!/usr/bin/env python3
 # -*- coding: utf-8 -*-
 """
-Extractor dedicado de biomarcadores IHQ (HER2, Ki-67, ER/PR, PD-L1, P16, Estudios Solicitados).
+Extractor dedicado de biomarcadores IHQ (HER2, Ki-67, ER/PR, PD-L1, P16 y los demás
+declarados en biomarcadores.json, más Estudios Solicitados).
 No modifica el esquema operativo estándar ni otros procesadores.
 Guarda los resultados en una base de datos SQLite para análisis posterior.
 Capaz de procesar PDFs con múltiples informes, generando una fila por cada uno.
 """
 
-import re
-from datetime import datetime
-from pathlib import Path
-import pandas as pd
-
 # Se asume que estos módulos están en el mismo directorio o en el PYTHONPATH
-from ocr_processing import pdf_to_text_enhanced
+from ocr_processing import iter_pdf_pages, format_page
 import procesador_ihq as ihq
 import database_manager  # Importamos el nuevo gestor de BD
+import pattern_registry
+from report_sections import ReportDocument, search_in
+from report_index import iter_report_spans
+from biomarker_rules import RULES
 
 
 # ---------------------------- Utilidades internas ----------------------------
@@ -24,9 +24,28 @@ _HDR_NEXT_STOPWORDS = (
     r'(?:\n\s*)(?:informe|descripci[oó]n|diagn[oó]stico|comentarios|responsable|nota)\b'
 )
 
-def _normalize_whitespace(text: str) -> str:
-    # Conserva saltos de línea pero colapsa espacios múltiples
-    return re.sub(r'[ \t]+', ' ', text)
+# Patrones del módulo, compilados una vez en el registro central (banderas en línea)
+_RE = pattern_registry.register_group("biomarcadores", {
+    # Utilidades
+    'espacios': r'\s+',
+    'espacios_multiples': r'\s{2,}',
+    # Estudios solicitados / órgano
+    'estudios_bloque': rf'(?is)estudios\s+solicitados\s*:?.*?\n(.*?)(?:\n{{2,}}|{_HDR_NEXT_STOPWORDS})',
+    'estudios_linea': r'(?i)estudios\s+solicitados\s*:?\s*([^\n]+)',
+    'vineta': r'^\s*[-–•]\s*',
+    'separadores_token': r'[,\s;/|]+',
+    'estudios_encabezado': r'(?is)estudios\s+solicitados.*?\n([^\n]+)\n([^\n]+)',
+    'organo_columna': r'(?i)ORGANO\s+([A-ZÁÉÍÓÚÑ0-9 .+/+-]+?)\s+(?:FECHA|TOMA|$)',
+    'diagnostico_primera_linea': r'(?is)\bDIAGN[ÓO]STICO\b\s*\n([^\n]+)',
+})
+
+
+def _iter_reports_stream(chunks):
+    """
+    Textos de los informes a medida que llegan los fragmentos (páginas). La segmentación
+    está en `report_index`; esta función conserva la interfaz de texto para scripts y pruebas.
+    """
+    return (span.text for span in iter_report_spans(chunks))
 
 def _iter_reports(full_text: str):
     """
@@ -34,32 +53,7 @@ def _iter_reports(full_text: str):
     Intenta primero '... peticion : IHQ######' en cualquier parte de la línea; si faltan códigos,
     completa con la primera aparición cruda de 'IHQ######'.
     """
-    # 1) Marcas por '... peticion : IHQ######' (sin anclar a inicio de línea)
-    pet_matches = list(re.finditer(r'(?i)(?:N[°.\s]*|No\.\s*|Nº\s*|N\s*)?petici[oó]n\s*:\s*(IHQ\d{6})', full_text))
-    starts, seen = [], set()
-    for m in pet_matches:
-        code = m.group(1).upper()
-        if code not in seen:
-            starts.append((code, m.start()))
-            seen.add(code)
-
-    # 2) Fallback: primeras apariciones crudas de IHQ###### que falten
-    for m in re.finditer(r'(?i)IHQ\d{6}', full_text):
-        code = m.group(0).upper()
-        if code not in seen:
-            starts.append((code, m.start()))
-            seen.add(code)
-
-    # 3) Si no hay nada, devuelve el texto completo
-    if not starts:
-        yield full_text
-        return
-
-    # 4) Ordena por posición y rinde bloques
-    starts.sort(key=lambda x: x[1])
-    for i, (_, start) in enumerate(starts):
-        end = starts[i + 1][1] if i + 1 < len(starts) else len(full_text)
-        yield full_text[start:end]
+    return _iter_reports_stream([full_text])
 
 def _clean_token(t: str) -> str:
     """
@@ -72,7 +66,7 @@ def _clean_token(t: str) -> str:
 
     # Elimina decoradores
     u = u.replace('·', '').replace('•', '').replace('–', '-').replace('_', '')
-    u = re.sub(r'\s+', '', u)
+    u = _RE['espacios'].sub('', u)
 
     # Correcciones típicas de OCR
     repl = {
@@ -99,19 +93,17 @@ def _clean_token(t: str) -> str:
         return ''
     return u
 
-def _extract_estudios_solicitados(text: str) -> str:
+def _extract_estudios_solicitados(doc: ReportDocument) -> str:
     """
     Extrae bloque multi-línea de 'Estudios solicitados' y retorna una lista
     deduplicada de marcadores en formato 'A, B, C'.
     """
+    text, sections = doc.text, doc.sections
     # Captura desde el encabezado hasta antes del siguiente bloque típico o doble salto de línea
-    m = re.search(
-        rf'(?is)estudios\s+solicitados\s*:?.*?\n(.*?)(?:\n{{2,}}|{_HDR_NEXT_STOPWORDS})',
-        text
-    )
+    m = search_in(_RE['estudios_bloque'], text, sections, 'estudios')
     if not m:
         # Fallback corto: lo que esté en la misma línea
-        m2 = re.search(r'(?i)estudios\s+solicitados\s*:?\s*([^\n]+)', text)
+        m2 = search_in(_RE['estudios_linea'], text, sections, 'estudios')
         if not m2:
             return ''
         raw_block = m2.group(1)
@@ -122,8 +114,8 @@ def _extract_estudios_solicitados(text: str) -> str:
     tokens = []
     for line in raw_block.splitlines():
         # Quita ruidos tipo columnas/guiones
-        line = re.sub(r'^\s*[-–•]\s*', '', line)
-        parts = re.split(r'[,\s;/|]+', line)
+        line = _RE['vineta'].sub('', line)
+        parts = _RE['separadores_token'].split(line)
         for p in parts:
             t = _clean_token(p)
             if t:
@@ -133,22 +125,23 @@ def _extract_estudios_solicitados(text: str) -> str:
     dedup = list(dict.fromkeys(tokens))
     return ', '.join(dedup)
 
-def _extract_organo_header(text: str) -> str:
+def _extract_organo_header(doc: ReportDocument) -> str:
     """
     Extrae el valor de la columna 'Organo' del bloque 'Estudios solicitados'.
     Soporta OCR con espacios irregulares y hace fallback si no hay encabezado limpio.
     """
-    hdr = re.search(r'(?is)estudios\s+solicitados.*?\n([^\n]+)\n([^\n]+)', text)
+    text, sections = doc.text, doc.sections
+    hdr = search_in(_RE['estudios_encabezado'], text, sections, 'estudios')
     if hdr:
-        header_line = re.sub(r'\s+', ' ', hdr.group(1)).strip().upper()
-        data_line   = re.sub(r'\s{2,}', '  ', hdr.group(2)).strip()
+        header_line = _RE['espacios'].sub(' ', hdr.group(1)).strip().upper()
+        data_line   = _RE['espacios_multiples'].sub('  ', hdr.group(2)).strip()
 
         # Intento directo por columnas: tomar lo que va entre 'ORGANO' y 'FECHA'
-        m = re.search(r'(?i)ORGANO\s+([A-ZÁÉÍÓÚÑ0-9 .+/+-]+?)\s+(?:FECHA|TOMA|$)', header_line + "\n" + data_line)
+        m = _RE['organo_columna'].search(header_line + "\n" + data_line)
         if m:
             cand = m.group(1)
             # En OCR el match puede arrastrar fragmentos; limpiemos tokens obvios
-            cand = re.sub(r'\s{2,}', ' ', cand).strip(' .-')
+            cand = _RE['espacios_multiples'].sub(' ', cand).strip(' .-')
             return cand
 
         # Si no funcionó por columnas, intenta un recorte por nombre de la columna
@@ -161,12 +154,12 @@ def _extract_organo_header(text: str) -> str:
                 # Mapear el mismo span sobre la línea de datos (heurístico de columnas monoespaciadas por OCR)
                 seg = data_line[span].strip()
                 if seg:
-                    return re.sub(r'\s{2,}', ' ', seg).strip(' .-')
+                    return _RE['espacios_multiples'].sub(' ', seg).strip(' .-')
             except Exception:
                 pass
 
     # Fallback: intenta inferir desde el primer renglón del DIAGNÓSTICO
-    m_diag = re.search(r'(?is)\bDIAGN[ÓO]STICO\b\s*\n([^\n]+)', text)
+    m_diag = _RE['diagnostico_primera_linea'].search(text)
     if m_diag:
         head = m_diag.group(1)
         # Tomar fragmento antes del primer punto si luce como "Pleura. Lesión. Biopsia ..."
@@ -178,191 +171,123 @@ def _extract_organo_header(text: str) -> str:
 
 # -------------------------- Extracción de biomarcadores -----------------------
 
-def _extract_biomarkers(text: str) -> dict:
+def _extract_biomarkers(report) -> dict:
     """
-    Función de extracción de biomarcadores mejorada y robustecida para manejar
-    múltiples variaciones de texto encontradas en los informes del HUV.
+    Extracción de biomarcadores de un informe del HUV. Los marcadores (alias, vocabulario
+    de estados, porcentajes/puntajes, secciones y columnas) se declaran en
+    `biomarcadores.json` y se buscan en las secciones de resultados (descripción
+    microscópica / resultado de IHQ, diagnóstico y comentarios); si el informe no tiene
+    esas secciones, en todo el texto. Acepta el texto o un `ReportDocument` ya construido.
     """
-    out = {
-        "IHQ_HER2": "",
-        "IHQ_KI-67": "",
-        "IHQ_RECEPTOR_ESTROGENO": "",
-        "IHQ_RECEPTOR_PROGESTAGENOS": "",
-        "IHQ_PDL-1": "",
-        "IHQ_ESTUDIOS_SOLICITADOS": "",
-        "IHQ_P16_ESTADO": "",
-        "IHQ_P16_PORCENTAJE": "",
-        "IHQ_ORGANO": "",
-    }
+    doc = ReportDocument.of(report)
 
-    # Estudios Solicitados (bloque multi-línea, tolerante a tabla)
-    out["IHQ_ESTUDIOS_SOLICITADOS"] = _extract_estudios_solicitados(text)
-    out["IHQ_ORGANO"] = _extract_organo_header(text)
-    # P16 (Patrones más flexibles)
-    m_p16_estado = re.search(r'(?i)\bP\s*16\b[^\n]*?\b(positiv[oa]|negativ[oa])\b', text)
-    if m_p16_estado:
-        out["IHQ_P16_ESTADO"] = m_p16_estado.group(1).upper()
-    elif re.search(r'(?i)\bP\s*16\b[^\n]*?\b(en\s+bloque|difus[ao])\b', text):
-        out["IHQ_P16_ESTADO"] = 'POSITIVO'
-
-    m_p16_pct = re.search(r'(?i)\bP\s*16\b[^\n%]*?(\d{1,3})\s*%', text)
-    if m_p16_pct:
-        out["IHQ_P16_PORCENTAJE"] = m_p16_pct.group(1)
-
-    # HER2 (score e ISH/FISH)
-    m_her2 = re.search(r'(?i)\bHER2(?:/NEU)?\b\s*[:\-(]?\s*(0|1\+|2\+|3\+|negativ[oa]|positiv[oa])', text)
-    her2_score = ''
-    if m_her2:
-        val = m_her2.group(1).upper()
-        if 'NEGATIVO' in val:
-            her2_score = 'NEGATIVO'
-        elif 'POSITIVO' in val:
-            # Si sólo dice "positivo", asumimos 3+ a menos que ISH diga algo distinto
-            her2_score = 'POSITIVO (3+)'
-        else:
-            her2_score = val
-
-    m_ish = re.search(r'(?i)\b(?:I?FISH|ISH)\b[^\n]*?\b(amplificad[oa]|no\s*amplificad[oa])\b', text)
-    her2_ish = m_ish.group(1).upper().replace(' ', '_') if m_ish else ''
-
-    her2_final = her2_score
-    if her2_ish:
-        ish_status = 'AMPLIFICADO' if 'AMPLIFICAD' in her2_ish else 'NO AMPLIFICADO'
-        her2_final = f"{her2_score} ({ish_status})" if her2_score else ish_status
-    out["IHQ_HER2"] = her2_final.strip()
-
-    # Ki-67 (tolerante a K167/KI 67 y "<1%")
-    m_ki = re.search(
-        r'(?i)\bK[IL]\s*[- ]?67\b[^\n%]*?(?:de|del|en|aproximadamente|menor\s+al|menor\s+del)?\s*<?\s*(\d{1,3})\s*%',
-        text
-    )
-    if m_ki:
-        out["IHQ_KI-67"] = f"{m_ki.group(1)}%"
-
-    # ER/RE (Receptor de Estrógeno)
-    m_re = re.search(
-        r'(?i)(?:receptor(?:es)?(?:\s+hormonal)?\s+de\s+estr[oó]geno|\bRE\b|\bER\b)'
-        r'[^\n]*?(positiv[oa]|negativ[oa])?\s*(?:en\s+el|de|del)?\s*\(?(\d{1,3})\s*%\)?',
-        text
-    )
-    re_estado, re_pct = '', ''
-    if m_re:
-        if m_re.group(1):
-            re_estado = m_re.group(1).upper()
-        if m_re.group(2):
-            re_pct = m_re.group(2) + "%"
-    else:
-        m_re_estado_fallback = re.search(
-            r'(?i)(?:receptor(?:es)?(?:\s+hormonal)?\s+de\s+estr[oó]geno|\bRE\b|\bER\b)[^\n]*?\b(positiv[oa]|negativ[oa])\b',
-            text
-        )
-        m_re_pct_fallback = re.search(
-            r'(?i)(?:receptor(?:es)?(?:\s+hormonal)?\s+de\s+estr[oó]geno|\bRE\b|\bER\b)[^\n%]*?(\d{1,3})\s*%',
-            text
-        )
-        if m_re_estado_fallback:
-            re_estado = m_re_estado_fallback.group(1).upper()
-        if m_re_pct_fallback:
-            re_pct = m_re_pct_fallback.group(1) + "%"
-    out["IHQ_RECEPTOR_ESTROGENO"] = f"{re_estado} {re_pct}".strip()
-
-    # PR/RP (Receptor de Progestágenos)
-    m_rp = re.search(
-        r'(?i)(?:receptor(?:es)?(?:\s+hormonal)?\s+de\s+progest(?:erona|ágenos)|\bRP\b|\bPR\b)'
-        r'[^\n]*?(positiv[oa]|negativ[oa])?\s*(?:en\s+el|de|del)?\s*\(?(\d{1,3})\s*%\)?',
-        text
-    )
-    rp_estado, rp_pct = '', ''
-    if m_rp:
-        if m_rp.group(1):
-            rp_estado = m_rp.group(1).upper()
-        if m_rp.group(2):
-            rp_pct = m_rp.group(2) + "%"
-    else:
-        m_rp_estado_fallback = re.search(
-            r'(?i)(?:receptor(?:es)?(?:\s+hormonal)?\s+de\s+progest(?:erona|ágenos)|\bRP\b|\bPR\b)[^\n]*?\b(positiv[oa]|negativ[oa])\b',
-            text
-        )
-        m_rp_pct_fallback = re.search(
-            r'(?i)(?:receptor(?:es)?(?:\s+hormonal)?\s+de\s+progest(?:erona|ágenos)|\bRP\b|\bPR\b)[^\n%]*?(\d{1,3})\s*%',
-            text
-        )
-        if m_rp_estado_fallback:
-            rp_estado = m_rp_estado_fallback.group(1).upper()
-        if m_rp_pct_fallback:
-            rp_pct = m_rp_pct_fallback.group(1) + "%"
-    out["IHQ_RECEPTOR_PROGESTAGENOS"] = f"{rp_estado} {rp_pct}".strip()
-
-    # PD-L1 (TPS y/o CPS)
-    m_tps = re.search(r'(?i)\bPD\s*-?L1\b[^\n]*?\bTPS\b[^\n%<]*?<?\s*(\d{1,3})\s*%', text)
-    m_cps = re.search(r'(?i)\bPD\s*-?L1\b[^\n]*?\bCPS\b[^\n\d<]*?<?\s*(\d{1,3})', text)
-    pdl1_parts = []
-    if m_tps:
-        pdl1_parts.append(f"TPS {m_tps.group(1)}%")
-    if m_cps:
-        pdl1_parts.append(f"CPS {m_cps.group(1)}")
-    out["IHQ_PDL-1"] = ' '.join(pdl1_parts)
-    if not out["IHQ_PDL-1"]:
-        m_pdl1_fallback = re.search(r'(?i)\bPD\s*-?L1\b\s*[:\-(]?\s*([^\n]+)', text)
-        if m_pdl1_fallback:
-            out["IHQ_PDL-1"] = m_pdl1_fallback.group(1).strip()
+    # Marcadores declarados en biomarcadores.json, en una sola pasada por los resultados
+    out = RULES.extract(doc)
 
+    # Estudios Solicitados (bloque multi-línea, tolerante a tabla)
+    out["IHQ_ESTUDIOS_SOLICITADOS"] = _extract_estudios_solicitados(doc)
+    out["IHQ_ORGANO"] = _extract_organo_header(doc)
     return out
 
 
+def extract_biomarkers_batch(texts):
+    """
+    Columnas de biomarcadores de muchos informes a la vez (Serie de pandas, arreglo Arrow o
+    lista de textos) como DataFrame tipado, idéntico a aplicar `_extract_biomarkers` fila a
+    fila en esas columnas. Pensado para reprocesos y exportaciones de investigación.
+    """
+    return RULES.extract_batch(texts)
+
+# Extractores que puede recalcular la re-extracción por separado
+EXTRACTOR_GROUPS = ("base", "biomarcadores")
+_ESTUDIOS_RULES = ("secciones.encabezados", "biomarcadores.estudios_bloque", "biomarcadores.estudios_linea",
+                   "biomarcadores.vineta", "biomarcadores.separadores_token")
+
+def field_versions() -> dict:
+    """
+    Versión de cada campo persistido, por grupo de extractor:
+    {"base": {columna: version}, "biomarcadores": {columna: version}}.
+    """
+    bio = RULES.column_versions()
+    bio["IHQ_ESTUDIOS_SOLICITADOS"] = pattern_registry.version(*_ESTUDIOS_RULES)
+    return {"base": ihq.column_versions(), "biomarcadores": bio}
+
+def build_record(doc: ReportDocument, groups=EXTRACTOR_GROUPS):
+    """
+    Fila (55 columnas + IHQ_*) de un informe, o None si no se reconoce como tal. Con
+    `groups` se ejecutan solo esos extractores (la re-extracción incremental usa uno solo).
+    """
+    row = {}
+    if "base" in groups:
+        base_rows = ihq.map_to_excel_format(ihq.extract_ihq_data(doc))
+        if not base_rows:
+            return None
+        row.update(base_rows[0])
+
+    # Biomarcadores y estudios solicitados
+    if "biomarcadores" in groups:
+        row.update(_extract_biomarkers(doc))
+    return row
+
+
 # --------------------------- Proceso principal (IO) ---------------------------
 
+# Informes por transacción: un PDF completo, salvo los muy grandes que se guardan por tramos
+SAVE_BATCH = 200
+
 def process_ihq_paths(pdf_paths: list[str], output_dir: str) -> int:
     """
     Procesa una lista de rutas de PDF, extrae los datos y los guarda en la BD.
+    Cada informe se extrae en cuanto su bloque está completo, mientras el OCR de las
+    páginas siguientes continúa; las filas se guardan en un solo lote por PDF (o cada
+    SAVE_BATCH informes si el PDF es muy grande).
     Devuelve el número de registros procesados.
     """
-    rows = []
-    extended_columns = None
+    saved = 0
+    database_manager.init_db()         # Se asegura que la DB y tabla existan
+    # Versión de las reglas que produjo cada campo, guardada junto al texto
+    versions = {col: v for group in field_versions().values() for col, v in group.items()}
+    rows, texts = [], []
+
+    def flush():
+        # --- Persistencia en Base de Datos: una transacción por lote ---
+        written = set(database_manager.save_records(rows)["guardados"])
+        # Texto y versiones actuales solo de las filas escritas. Una fila omitida (ya existía, o
+        # repetida en el lote) conserva el texto y las versiones con que se extrajo; si no tenía
+        # texto se guarda sin versiones, y reextraccion_ihq.py recalcula todos sus campos.
+        current = [text for i, text in enumerate(texts) if text and i in written]
+        previous = [(*text[:2], None, *text[3:]) for i, text in enumerate(texts) if text and i not in written]
+        database_manager.save_report_texts(current)
+        database_manager.save_report_texts(previous, replace=False)
+        rows.clear()
+        texts.clear()
 
     for pdf in pdf_paths:
-        full_text = pdf_to_text_enhanced(pdf)
-        if not isinstance(full_text, str):
-            # Por si el OCR retorna lista de páginas; unifícalas
-            try:
-                full_text = '\n'.join(full_text)
-            except Exception:
-                full_text = str(full_text)
-
-        full_text = _normalize_whitespace(full_text)
-
-        # Segmentación robusta por informe
-        for single_report_text in _iter_reports(full_text):
-            # Extrae datos base del encabezado/secciones estándar
-            base = ihq.extract_ihq_data(single_report_text)
-            base_rows = ihq.map_to_excel_format(base)
-            if not base_rows:
+        # Las páginas ya llegan con los espacios colapsados (_post_ocr_cleanup); el
+        # ReportDocument solo vuelve a colapsar si encuentra espacios múltiples
+        pages = (format_page(page_num, page_text) for page_num, page_text in iter_pdf_pages(pdf))
+
+        # Segmentación robusta por informe, a medida que llegan las páginas
+        for span in iter_report_spans(pages):
+            # Un documento por informe: vistas (plegado, secciones, líneas) calculadas una vez
+            doc = ReportDocument(span.text)
+            row = build_record(doc)
+            if row is None:
                 continue
 
-            row = dict(base_rows[0])
-
-            # Biomarcadores y estudios solicitados
-            biomarkers = _extract_biomarkers(single_report_text)
-            row.update(biomarkers)
             rows.append(row)
-
-            # Preparar columnas completas solo una vez
-            if extended_columns is None:
-                base_cols = list(base_rows[0].keys())
-                extra_cols = list(biomarkers.keys())
-                extended_columns = base_cols + extra_cols
-
-    if not rows:
+            # El texto fuente (y de qué páginas del PDF salió) queda guardado para re-extraer
+            # sin OCR o repetir el OCR solo de esas páginas (reextraccion_ihq.py). Un informe sin
+            # número de petición no tiene clave con qué volver a su fila: no se guarda su texto.
+            peticion = row.get(database_manager.KEY_COLUMN)
+            texts.append((peticion, doc.raw, versions, pdf, (span.first_page, span.last_page)) if peticion else None)
+            saved += 1
+            if len(rows) >= SAVE_BATCH:
+                flush()
+        flush()
+
+    if not saved:
         raise RuntimeError("No se pudo extraer información de los PDFs IHQ seleccionados.")
 
-    df = pd.DataFrame(rows)
-    if extended_columns:
-        df = df.reindex(columns=extended_columns)
-
-    # --- Persistencia en Base de Datos ---
-    records_to_save = df.to_dict('records')
-    database_manager.init_db()         # Se asegura que la DB y tabla existan
-    database_manager.save_records(records_to_save)
-
-    print(f"✅ {len(records_to_save)} registros guardados/actualizados en la base de datos.")
-    return len(records_to_save)
+    print(f"✅ {saved} registros guardados/actualizados en la base de datos.")
+    return saved
@@ -0,0 +1,199 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Re-extracción de informes IHQ a partir del texto OCR guardado en la base de datos.
+
+Cuando se corrige un patrón de `procesador_ihq.py`, `procesador_ihq_biomarcadores.py` o
+`biomarcadores.json`, este comando vuelve a ejecutar los extractores sobre los textos de la
+tabla `textos_ihq` (en paralelo, un proceso por núcleo) y actualiza en `informes_ihq` solo
+los campos que cambiaron. No abre PDFs ni invoca Tesseract.
+
+Es incremental: cada campo guarda la versión (hash) de las reglas que lo produjeron. Solo
+se recalculan los campos cuya versión cambió, y solo se ejecuta el extractor que los produce
+(`extract_ihq_data` + `map_to_excel_format`, o `_extract_biomarkers`); los informes al día
+no se tocan. Con --todo se recalcula todo (p. ej. tras cambiar lógica que no es un patrón).
+
+Con --reocr se repite el OCR de informes puntuales (p. ej. tras cambiar DPI o PSM), leyendo
+solo las páginas del PDF de donde salió cada uno (guardadas en `textos_ihq`).
+
+Uso por consola:
+    python reextraccion_ihq.py [--workers 0] [--dry-run] [--todo]
+    python reextraccion_ihq.py --reocr IHQ250001 [IHQ250002 ...] [--dry-run]
+"""
+
+import argparse
+import os
+from collections import Counter
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor
+
+import database_manager
+
+# Columnas que cambian en cada extracción aunque el texto sea el mismo
+VOLATILE_COLUMNS = {"Hora Desc. macro"}
+
+
+def _extract_fields(text: str, groups: tuple):
+    from procesador_ihq_biomarcadores import build_record
+    from report_sections import ReportDocument
+    return build_record(ReportDocument(text), groups)
+
+
+def _as_db_value(value) -> str:
+    return '' if value is None else str(value)
+
+
+def _changed_fields(row: dict, old: dict, columns) -> dict:
+    """{columna: valor nuevo} de las columnas cuyo valor cambió (sin las volátiles ni la clave)."""
+    return {col: _as_db_value(row.get(col)) for col in columns
+            if col in old and col not in VOLATILE_COLUMNS and col != database_manager.KEY_COLUMN
+            and _as_db_value(row.get(col)) != _as_db_value(old[col])}
+
+
+def _stale_fields(stored: dict, current: dict, full: bool) -> dict:
+    """{grupo: [columnas]} cuya versión guardada difiere de la actual."""
+    stale = {}
+    for group, versions in current.items():
+        cols = [col for col, v in versions.items() if full or stored.get(col) != v]
+        if cols:
+            stale[group] = cols
+    return stale
+
+
+def reextract_all(workers: int = 0, dry_run: bool = False, full: bool = False) -> dict:
+    """
+    Re-extrae los campos desactualizados de todos los textos guardados y actualiza los que
+    cambiaron de valor. Devuelve conteos: textos, al_dia, recalculados, campos_recalculados,
+    valores_cambiados, actualizados, nuevos, fallidos y cambios por columna.
+    """
+    from procesador_ihq_biomarcadores import field_versions
+
+    database_manager.init_db()
+    current = field_versions()
+    all_versions = {col: v for group in current.values() for col, v in group.items()}
+    records = database_manager.get_records_by_peticion()
+
+    pending = []   # (peticion, texto, {grupo: [columnas]})
+    summary = {"textos": 0, "al_dia": 0, "recalculados": 0, "campos_recalculados": 0,
+               "valores_cambiados": 0, "actualizados": 0, "nuevos": 0, "fallidos": 0}
+    for peticion, text, stored in database_manager.get_report_texts():
+        # Textos sin número de petición (bases anteriores) no tienen fila con qué compararse
+        if not peticion:
+            continue
+        summary["textos"] += 1
+        # Sin fila en informes_ihq: se extrae completo y se inserta
+        stale = (_stale_fields({}, current, True) if peticion not in records
+                 else _stale_fields(stored, current, full))
+        if stale:
+            pending.append((peticion, text, stale))
+        else:
+            summary["al_dia"] += 1
+
+    changes, new_rows, new_versions, per_column = {}, [], {}, Counter()
+    workers = workers if workers > 0 else (os.cpu_count() or 1)
+    with ProcessPoolExecutor(max_workers=max(1, min(workers, len(pending) or 1))) as pool:
+        rows = pool.map(_extract_fields, [t for _, t, _ in pending],
+                        [tuple(stale) for _, _, stale in pending], chunksize=8)
+        for (peticion, _, stale), row in zip(pending, rows):
+            if row is None:
+                summary["fallidos"] += 1
+                continue
+            new_versions[peticion] = all_versions
+            old = records.get(peticion)
+            if old is None:
+                new_rows.append(row)
+                continue
+            summary["recalculados"] += 1
+            # Con --todo se comparan todas las columnas (incluidas las constantes, sin versión)
+            columns = [col for col in (row if full else (c for cols in stale.values() for c in cols)) if col in old]
+            summary["campos_recalculados"] += len(columns)
+            diff = _changed_fields(row, old, columns)
+            if diff:
+                changes[peticion] = diff
+                per_column.update(diff.keys())
+
+    summary["actualizados"] = len(changes)
+    summary["valores_cambiados"] = sum(per_column.values())
+    summary["nuevos"] = len(new_rows)
+    summary["columnas"] = dict(per_column.most_common())
+    if not dry_run:
+        database_manager.update_fields(changes)
+        database_manager.save_records(new_rows)
+        database_manager.set_field_versions(new_versions)
+    return summary
+
+
+def reocr_reports(peticiones: list, dry_run: bool = False) -> dict:
+    """
+    Repite el OCR solo de las páginas de cada informe, lo vuelve a ubicar con el índice de
+    límites, re-extrae todos sus campos y actualiza texto y valores que cambiaron. Devuelve
+    conteos: informes, paginas, actualizados, valores_cambiados, sin_origen, no_encontrados.
+    """
+    from ocr_processing import format_page, iter_pdf_pages
+    from procesador_ihq_biomarcadores import build_record, field_versions
+    from report_index import iter_report_spans
+    from report_sections import ReportDocument
+
+    database_manager.init_db()
+    versions = {col: v for group in field_versions().values() for col, v in group.items()}
+    records = database_manager.get_records_by_peticion()
+    summary = {"informes": 0, "paginas": 0, "actualizados": 0, "valores_cambiados": 0,
+               "sin_origen": 0, "no_encontrados": 0}
+    for peticion in peticiones:
+        source = database_manager.get_report_source(peticion)
+        if source is None or not Path(source[0]).exists():
+            summary["sin_origen"] += 1
+            continue
+        pdf, first_page, last_page = source
+        pages = (format_page(n, text) for n, text in iter_pdf_pages(pdf, pages=range(first_page - 1, last_page)))
+        spans = list(iter_report_spans(pages))
+        # Informes sin código IHQ (p. ej. autopsias): las páginas traen un único bloque
+        span = next((s for s in spans if s.code == peticion), spans[0] if len(spans) == 1 else None)
+        summary["paginas"] += last_page - first_page + 1
+        row = build_record(ReportDocument(span.text)) if span else None
+        if row is None:
+            summary["no_encontrados"] += 1
+            continue
+        summary["informes"] += 1
+        old = records.get(peticion)
+        diff = _changed_fields(row, old, row) if old else {}
+        summary["valores_cambiados"] += len(diff)
+        summary["actualizados"] += bool(diff or old is None)
+        if dry_run:
+            continue
+        database_manager.save_report_text(peticion, span.text, versions, pdf, (span.first_page, span.last_page))
+        if old is None:
+            database_manager.save_records([row])
+        else:
+            database_manager.update_fields({peticion: diff} if diff else {})
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Re-extrae los informes IHQ desde el texto OCR guardado")
+    parser.add_argument("--workers", type=int, default=0, help="Procesos paralelos (0 = todos los núcleos)")
+    parser.add_argument("--dry-run", action="store_true", help="Solo informa los cambios, sin escribir")
+    parser.add_argument("--todo", action="store_true", help="Recalcula todos los campos aunque su versión no cambió")
+    parser.add_argument("--reocr", nargs="+", metavar="PETICION",
+                        help="Repite el OCR solo de las páginas de estos informes")
+    args = parser.parse_args()
+
+    if args.reocr:
+        summary = reocr_reports(args.reocr, args.dry_run)
+        verb = "se actualizarían" if args.dry_run else "actualizados"
+        print(f"🧩 {summary['informes']} informes releídos ({summary['paginas']} páginas): "
+              f"{summary['valores_cambiados']} valores cambiados, {summary['actualizados']} {verb}, "
+              f"{summary['sin_origen']} sin PDF de origen, {summary['no_encontrados']} no encontrados")
+        return
+
+    summary = reextract_all(args.workers, args.dry_run, args.todo)
+    verb = "se actualizarían" if args.dry_run else "actualizados"
+    print(f"🧩 {summary['textos']} textos: {summary['al_dia']} al día, {summary['recalculados']} recalculados "
+          f"({summary['campos_recalculados']} campos), {summary['valores_cambiados']} valores cambiados en "
+          f"{summary['actualizados']} registros {verb}, {summary['nuevos']} nuevos, {summary['fallidos']} sin datos")
+    for column, n in summary["columnas"].items():
+        print(f"   {n:>6}  {column}")
+
+
+if __name__ == "__main__":
+    main()
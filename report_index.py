@@ -0,0 +1,187 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Índice de límites de informes de un documento (texto de un PDF con separadores de página).
+
+Una sola expresión recorre el texto una vez y ubica a la vez los separadores
+'--- PÁGINA n ---', las marcas '... peticion : IHQ######' y las apariciones crudas de
+'IHQ######'. Con ellas se arma, por informe, su código, su rango (inicio, fin) en el texto
+del documento y el rango de páginas que toca.
+
+Los informes se exponen como `ReportSpan`: vistas sobre el texto del documento que no
+copian nada hasta que se pide `.text`. Todas comparten la misma lista de fragmentos (páginas)
+con su posición absoluta, así que retienen el documento una sola vez, tenga los informes que tenga. Así se puede reprocesar un solo informe, o volver a
+hacer OCR solo de sus páginas, sin tocar el resto del PDF.
+
+Uso por consola:
+    python report_index.py documento.pdf
+"""
+
+from bisect import bisect_right
+import re
+
+import pattern_registry
+
+_BOUNDARIES_RE = pattern_registry.register("informes.limites", (
+    r'(?P<pagina>^--- PÁGINA (?P<numero>\d+) ---$)'
+    # Marca definitiva: '... peticion : IHQ######' en cualquier parte de la línea
+    r'|(?:N[°.\s]*|No\.\s*|Nº\s*|N\s*)?petici[oó]n\s*:\s*(?P<peticion>IHQ\d{6})'
+    # Respaldo: primera aparición cruda del código
+    r'|(?P<codigo>IHQ\d{6})'
+), re.IGNORECASE | re.MULTILINE)
+
+
+class _Chunks:
+    """Fragmentos del documento, sin copiar, con la posición absoluta donde empieza cada uno."""
+
+    __slots__ = ("parts", "starts")
+
+    def __init__(self):
+        self.parts, self.starts = [], []
+
+    def append(self, chunk: str, offset: int) -> None:
+        self.parts.append(chunk)
+        self.starts.append(offset)
+
+    def slice(self, start: int, end: int) -> str:
+        """Texto entre dos posiciones absolutas; un solo fragmento se corta sin unir."""
+        i = max(0, bisect_right(self.starts, start) - 1)
+        pieces = []
+        while i < len(self.parts) and self.starts[i] < end:
+            offset = self.starts[i]
+            pieces.append(self.parts[i][max(0, start - offset):end - offset])
+            i += 1
+        return pieces[0] if len(pieces) == 1 else "".join(pieces)
+
+
+class ReportSpan:
+    """Un informe dentro del texto del documento: código, posiciones y páginas, sin copiar el texto."""
+
+    __slots__ = ("code", "start", "end", "first_page", "last_page", "_source")
+
+    def __init__(self, source: _Chunks, code, start: int, end: int, first_page, last_page):
+        self._source = source
+        self.code = code                    # 'IHQ######' o None si el documento no trae códigos
+        self.start, self.end = start, end   # posiciones en el texto del documento
+        self.first_page, self.last_page = first_page, last_page   # base 1; None sin separadores
+
+    @property
+    def text(self) -> str:
+        """Texto del informe (se copia solo al pedirlo)."""
+        return self._source.slice(self.start, self.end)
+
+    @property
+    def pages(self) -> range:
+        """Páginas (base 0, como `iter_pdf_pages`) que hay que volver a leer para este informe."""
+        if self.first_page is None:
+            return range(0)
+        return range(self.first_page - 1, self.last_page)
+
+    def __len__(self) -> int:
+        return self.end - self.start
+
+    def __repr__(self) -> str:
+        return (f"ReportSpan({self.code!r}, {self.start}-{self.end}, "
+                f"páginas {self.first_page}-{self.last_page})")
+
+
+class ReportIndex:
+    """
+    Índice incremental: `feed` recibe el texto por fragmentos que cortan entre páginas (p. ej.
+    cada página según termina el OCR) y devuelve los informes cuyos dos límites ya son
+    definitivos; `finish` devuelve el resto. `index_reports` hace lo mismo sobre un texto completo.
+
+    Un inicio por 'peticion : IHQ######' es definitivo; uno por aparición cruda puede
+    desplazarse si más adelante aparece la petición de ese código.
+    """
+
+    def __init__(self):
+        self._chunks, self._length = _Chunks(), 0   # fragmentos recibidos, compartidos por las vistas
+        self._peticion, self._raw = {}, {}  # código → primera posición
+        self._page_starts, self._page_numbers = [], []
+        self._emitted = 0
+
+    def _starts(self) -> list:
+        starts = [(pos, True, code) for code, pos in self._peticion.items()]
+        starts += [(pos, False, code) for code, pos in self._raw.items() if code not in self._peticion]
+        starts.sort()
+        return starts
+
+    def _page_at(self, pos: int):
+        if not self._page_starts:
+            return None
+        # Lo anterior al primer separador (su salto de línea) cuenta como la primera página
+        return self._page_numbers[max(1, bisect_right(self._page_starts, pos)) - 1]
+
+    def _span(self, code, start: int, end: int) -> ReportSpan:
+        last = self._page_at(max(start, end - 1))
+        return ReportSpan(self._chunks, code, start, end, self._page_at(start), last)
+
+    def feed(self, chunk: str) -> list:
+        offset = self._length
+        self._chunks.append(chunk, offset)
+        self._length += len(chunk)
+        for m in _BOUNDARIES_RE.finditer(chunk):
+            kind = m.lastgroup
+            if kind == "pagina":
+                self._page_starts.append(offset + m.start())
+                self._page_numbers.append(int(m.group("numero")))
+                continue
+            code = m.group(kind).upper()
+            if kind == "peticion":
+                self._peticion.setdefault(code, offset + m.start())
+                # La petición también es la primera aparición cruda de su código
+                self._raw.setdefault(code, offset + m.start("peticion"))
+            else:
+                self._raw.setdefault(code, offset + m.start())
+
+        ready = []
+        starts = self._starts()
+        while (self._emitted + 1 < len(starts) and starts[self._emitted][1]
+               and starts[self._emitted + 1][1]):
+            (start, _, code), end = starts[self._emitted], starts[self._emitted + 1][0]
+            ready.append(self._span(code, start, end))
+            self._emitted += 1
+        return ready
+
+    def finish(self) -> list:
+        """Fin del documento: todos los inicios son definitivos. Sin códigos, un único informe."""
+        end = self._length
+        starts = self._starts()
+        if not starts:
+            return [self._span(None, 0, end)]
+        return [self._span(code, start, starts[i + 1][0] if i + 1 < len(starts) else end)
+                for i, (start, _, code) in enumerate(starts) if i >= self._emitted]
+
+
+def iter_report_spans(chunks):
+    """Rinde cada informe en cuanto se conocen sus dos límites (texto por fragmentos)."""
+    index = ReportIndex()
+    for chunk in chunks:
+        yield from index.feed(chunk)
+    yield from index.finish()
+
+
+def index_reports(full_text: str) -> list:
+    """Informes de un documento completo, en orden, como vistas sobre `full_text`."""
+    return list(iter_report_spans([full_text]))
+
+
+def main():
+    import argparse
+    from ocr_processing import format_page, iter_pdf_pages
+
+    parser = argparse.ArgumentParser(description="Lista los informes IHQ de un PDF con sus páginas")
+    parser.add_argument("pdf", help="Ruta al PDF")
+    args = parser.parse_args()
+
+    pages = (format_page(n, text) for n, text in iter_pdf_pages(args.pdf))
+    spans = list(iter_report_spans(pages))
+    print(f"📄 {len(spans)} informe(s) en {args.pdf}")
+    for span in spans:
+        print(f"   {span.code or '-':<10} páginas {span.first_page}-{span.last_page}  "
+              f"caracteres {span.start}-{span.end} ({len(span)})")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,215 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Documento de informe e índice de secciones.
+
+`ReportDocument` guarda el texto crudo de un informe y calcula bajo demanda, una sola vez,
+sus vistas derivadas: texto con espacios colapsados (el que usan los extractores), texto
+plegado (sin acentos, mayúsculas), mayúsculas, tabla de inicios de línea e índice de
+secciones, con mapas de posiciones de vuelta al texto crudo.
+
+`SectionIndex` ubica en una sola pasada los encabezados del informe (Estudios solicitados,
+INFORME DE ANATOMÍA PATOLÓGICA, DESCRIPCIÓN MACROSCÓPICA/MICROSCÓPICA, RESULTADO DE
+INMUNOHISTOQUÍMICA, DIAGNÓSTICO, COMENTARIOS, bloque de firma y nota final) y expone
+rangos (inicio, fin) por ámbito. Los extractores buscan solo dentro del rango que les
+corresponde con `patron.search(texto, inicio, fin)`, sin copiar el texto.
+"""
+
+from bisect import bisect_left, bisect_right
+from functools import cached_property
+import re
+
+import pattern_registry
+from keyword_matcher import fold_with_offsets
+
+_HSPACE_RE = pattern_registry.register("secciones.espacios_horizontales", r'[ \t]+')
+
+_HEADERS_RE = pattern_registry.register("secciones.encabezados", (
+    r'(?P<estudios>estudios\s+solicitados)'
+    r'|(?P<informe>INFORME\s+DE\s+ANATOM[ÍI]A\s+PATOL[ÓO]GICA)'
+    r'|(?P<macroscopica>DESCRIPCI[ÓO]N\s+MACROSC[ÓO]PICA)'
+    r'|(?P<microscopica>DESCRIPCI[ÓO]N\s+MICROSC[ÓO]PICA)'
+    r'|(?P<resultado_ihq>RESULTADO\s+DE\s+INMUNOHISTOQU[ÍI]MICA)'
+    # DIAGNÓSTICO y COMENTARIOS solo como línea propia ('Diagnóstico Inicial:' no es encabezado)
+    r'|(?P<diagnostico>^[ \t]*DIAGN[ÓO]STICO[ \t]*$)'
+    r'|(?P<comentarios>^[ \t]*COMENTARIOS[ \t]*$)'
+    # Firma: línea del nombre + línea del cargo
+    r'|(?P<firma>^[^\n]*\n[ \t]*(?:M[ée]dic[oa]\s+Pat[oó]log[oa]|Responsable\s+del\s+an[aá]lisis))'
+    r'|(?P<nota>Nota\s*:\s*Este\s+informe)'
+), re.IGNORECASE | re.MULTILINE)
+
+SECTION_NAMES = tuple(_HEADERS_RE.regex.groupindex)
+
+
+class SectionIndex:
+    """Posiciones de los encabezados de un informe y rangos de búsqueda por ámbito."""
+
+    def __init__(self, text: str):
+        self.length = len(text)
+        # nombre → [(inicio, fin), ...] en orden de aparición
+        self.headers = {name: [] for name in SECTION_NAMES}
+        self._all = []
+        for m in _HEADERS_RE.finditer(text):
+            self.headers[m.lastgroup].append((m.start(), m.end()))
+            self._all.append((m.start(), m.end(), m.lastgroup))
+
+    def first(self, *names, after: int = 0):
+        """Primer encabezado (inicio, fin) de cualquiera de `names` que empiece en `after` o después."""
+        best = None
+        for name in names:
+            spans = self.headers[name]
+            i = bisect_left(spans, (after, -1))
+            if i < len(spans) and (best is None or spans[i][0] < best[0]):
+                best = spans[i]
+        return best
+
+    def _close(self, span) -> int:
+        # Incluye el salto de línea que sigue al encabezado de cierre (lo exigen los lookahead)
+        return min(span[1] + 1, self.length) if span else self.length
+
+    def scope(self, name: str):
+        """
+        Rango (inicio, fin) de un ámbito, o None si el informe no tiene sus encabezados:
+          encabezado     desde el inicio hasta el primer encabezado de sección
+          estudios       'Estudios solicitados' hasta el encabezado siguiente (incluido)
+          macroscopica   DESCRIPCIÓN MACROSCÓPICA hasta MICROSCÓPICA/RESULTADO (incluido)
+          microscopica   MICROSCÓPICA/RESULTADO hasta DIAGNÓSTICO (incluido)
+          diagnostico    DIAGNÓSTICO hasta la nota final
+          firma          nombre + cargo del responsable
+          resultados     MICROSCÓPICA/RESULTADO (o DIAGNÓSTICO) hasta la firma o la nota
+        """
+        if name == "encabezado":
+            return (0, self._all[0][0]) if self._all else None
+        if name == "estudios":
+            start = self.first("estudios")
+            if not start:
+                return None
+            nxt = next((h for h in self._all if h[0] >= start[1] and h[2] != "estudios"), None)
+            return start[0], self._close(nxt)
+        if name == "macroscopica":
+            start = self.first("macroscopica")
+            if not start:
+                return None
+            return start[0], self._close(self.first("microscopica", "resultado_ihq", after=start[1]))
+        if name == "microscopica":
+            start = self.first("microscopica", "resultado_ihq")
+            if not start:
+                return None
+            return start[0], self._close(self.first("diagnostico", after=start[1]))
+        if name == "diagnostico":
+            start = self.first("diagnostico")
+            if not start:
+                return None
+            end = self.first("nota", after=start[1])
+            return start[0], end[1] if end else self.length
+        if name == "firma":
+            return self.first("firma")
+        if name == "resultados":
+            start = self.first("microscopica", "resultado_ihq") or self.first("diagnostico")
+            if not start:
+                return None
+            end = self.first("firma", "nota", after=start[1])
+            return start[0], end[0] if end else self.length
+        raise KeyError(name)
+
+
+def search_in(pattern, text: str, sections: SectionIndex, scope: str, fallback: bool = True):
+    """
+    Busca `pattern` dentro del ámbito `scope`. Si el ámbito no existe se busca en todo el
+    texto; si existe pero no hay coincidencia, también, salvo con `fallback=False`.
+    """
+    span = sections.scope(scope) if scope else None
+    if span is None:
+        return pattern.search(text)
+    m = pattern.search(text, *span)
+    if m is None and fallback:
+        m = pattern.search(text)
+    return m
+
+
+class ReportDocument:
+    """
+    Texto de un informe con vistas derivadas perezosas y en caché. Todas las posiciones
+    de `sections`, `folded` y `line_starts` se refieren a `text` (espacios colapsados);
+    `to_raw` las lleva al texto crudo.
+    """
+
+    def __init__(self, raw: str):
+        self.raw = raw
+
+    @classmethod
+    def of(cls, text_or_doc) -> "ReportDocument":
+        """Acepta un texto o un documento ya construido (para no recalcular sus vistas)."""
+        return text_or_doc if isinstance(text_or_doc, cls) else cls(text_or_doc)
+
+    # ── Espacios colapsados: vista de trabajo de los extractores ──
+    @cached_property
+    def _collapsed(self):
+        raw = self.raw
+        if "\t" not in raw and "  " not in raw:
+            return raw, None            # ya normalizado (caso habitual tras _post_ocr_cleanup)
+        parts, offsets, last = [], [], 0
+        for m in _HSPACE_RE.finditer(raw):
+            parts.append(raw[last:m.start()])
+            offsets.extend(range(last, m.start()))
+            parts.append(" ")
+            offsets.append(m.start())
+            last = m.end()
+        parts.append(raw[last:])
+        offsets.extend(range(last, len(raw)))
+        return "".join(parts), offsets
+
+    @property
+    def text(self) -> str:
+        """Texto con espacios y tabulaciones múltiples colapsados (conserva saltos de línea)."""
+        return self._collapsed[0]
+
+    def to_raw(self, pos: int) -> int:
+        """Posición en `text` → posición en `raw`."""
+        offsets = self._collapsed[1]
+        if offsets is None:
+            return pos
+        return offsets[pos] if pos < len(offsets) else len(self.raw)
+
+    # ── Plegado ASCII + mayúsculas ──
+    @cached_property
+    def _folded(self):
+        return fold_with_offsets(self.text)
+
+    @property
+    def folded(self) -> str:
+        """`text` sin acentos ni símbolos no ASCII, en mayúsculas."""
+        return self._folded[0]
+
+    def folded_span(self, start: int, end: int) -> tuple:
+        """Rango de `text` → rango equivalente en `folded`."""
+        offsets = self._folded[1]
+        if offsets is None:
+            return start, end
+        return bisect_left(offsets, start), bisect_left(offsets, end)
+
+    def folded_to_text(self, pos: int) -> int:
+        """Posición en `folded` → posición en `text`."""
+        offsets = self._folded[1]
+        if offsets is None:
+            return pos
+        return offsets[pos] if pos < len(offsets) else len(self.text)
+
+    @cached_property
+    def upper(self) -> str:
+        """`text` en mayúsculas (conserva acentos)."""
+        return self.text.upper()
+
+    # ── Líneas y secciones ──
+    @cached_property
+    def line_starts(self) -> list:
+        """Posición de inicio de cada línea de `text`."""
+        return [0] + [m.end() for m in re.finditer("\n", self.text)]
+
+    def line_of(self, pos: int) -> int:
+        """Número de línea (base 1) de una posición de `text`."""
+        return bisect_right(self.line_starts, pos)
+
+    @cached_property
+    def sections(self) -> SectionIndex:
+        return SectionIndex(self.text)
@@ -0,0 +1,86 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compara los motores OCR de `ocr_processing` lado a lado:
+- arranque: creación del motor + primera página (incluye carga del traineddata),
+- costo fijo por llamada: OCR de una imagen en blanco,
+- tiempo por página: promedio sobre las páginas renderizadas a DPI.
+
+Uso:
+    python scripts/bench_ocr_backend.py [carpeta_o_pdf ...] [--pages 6]
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+import fitz  # PyMuPDF
+from PIL import Image
+
+import ocr_processing as ocr
+
+
+def _render_pages(pdfs: list, limit: int) -> list:
+    images = []
+    for pdf in pdfs:
+        doc = fitz.open(pdf)
+        for page in doc:
+            images.append(ocr._render_gray(page, ocr.DPI, ocr.MIN_WIDTH))
+            if len(images) >= limit:
+                return images
+        doc.close()
+    return images
+
+
+def _bench(name: str, images: list) -> dict:
+    t0 = time.perf_counter()
+    backend = ocr.create_ocr_backend(name)
+    backend.image_to_string(images[0], ocr.PSM_MODE)
+    startup = time.perf_counter() - t0
+
+    blank = Image.new("L", (200, 60), color=255)
+    t0 = time.perf_counter()
+    for _ in range(5):
+        backend.image_to_string(blank, ocr.PSM_MODE)
+    per_call = (time.perf_counter() - t0) / 5
+
+    t0 = time.perf_counter()
+    for img in images[1:]:
+        backend.image_to_string(img, ocr.PSM_MODE)
+    per_page = (time.perf_counter() - t0) / max(1, len(images) - 1)
+    backend.close()
+    return {"motor": backend.name, "arranque_ms": startup * 1000,
+            "fijo_ms": per_call * 1000, "pagina_ms": per_page * 1000}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark de motores OCR")
+    parser.add_argument("paths", nargs="*", default=[str(ROOT / "pdfs_patologia")])
+    parser.add_argument("--pages", type=int, default=6, help="Páginas a usar en la medición")
+    args = parser.parse_args()
+
+    pdfs = []
+    for p in map(Path, args.paths):
+        pdfs += sorted(p.glob("*.pdf")) if p.is_dir() else [p]
+    images = _render_pages([str(p) for p in pdfs], args.pages)
+    if not images:
+        print("❌ No se encontraron páginas para medir.")
+        return
+
+    names = ["pytesseract"] + (["tesserocr"] if ocr.tesserocr_available() else [])
+    if not ocr.tesserocr_available():
+        print("ℹ️  tesserocr no está instalado; solo se mide pytesseract.")
+    results = [_bench(name, images) for name in names]
+
+    print(f"📊 Motores OCR sobre {len(images)} página(s) a {ocr.DPI} DPI")
+    print(f"   {'motor':<12}{'arranque':>12}{'fijo/llamada':>15}{'por página':>13}")
+    for r in results:
+        print(f"   {r['motor']:<12}{r['arranque_ms']:>10.0f}ms{r['fijo_ms']:>13.0f}ms{r['pagina_ms']:>11.0f}ms")
+
+
+if __name__ == "__main__":
+    main()
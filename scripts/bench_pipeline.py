@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark del pipeline IHQ por etapa sobre un corpus de PDFs.
+
+Etapas medidas (las mismas que recorre `process_ihq_paths`):
+    ocr            pdf_to_text_enhanced (por página)
+    segmentacion   _iter_reports sobre el texto del PDF (por informe)
+    extraccion     ReportDocument + extract_ihq_data + map_to_excel_format (por informe)
+    biomarcadores  _extract_biomarkers (por informe)
+    persistencia   database_manager.save_records en una BD temporal (por informe)
+
+Para cada etapa se reporta tiempo de pared, tiempo de CPU (incluye procesos hijos ya
+terminados: pool de OCR y tesseract) y pico de memoria Python (tracemalloc, en una pasada
+extra para no distorsionar los tiempos). La caché OCR se desactiva salvo con --cache.
+El resultado se guarda en JSON junto con la configuración OCR para comparar corridas.
+Con --regex se activa el perfilado del registro de patrones y el JSON incluye, por patrón,
+tiempo de compilación, llamadas y tiempo de búsqueda (con un pequeño costo en los tiempos).
+
+Uso:
+    python scripts/bench_pipeline.py [carpeta_o_pdf ...] [--repeat 3] [--json salida.json] [--cache] [--regex]
+    python scripts/bench_pipeline.py --compare antes.json despues.json
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+STAGES = (
+    ("ocr", "pagina"),
+    ("segmentacion", "informe"),
+    ("extraccion", "informe"),
+    ("biomarcadores", "informe"),
+    ("persistencia", "informe"),
+)
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB; macOS, bytes
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+
+def _cpu() -> float:
+    t = os.times()
+    return t.user + t.system + t.children_user + t.children_system
+
+
+class _Stage:
+    """Acumula pared, CPU y pico de memoria de una etapa a lo largo de varias llamadas."""
+
+    def __init__(self):
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_kb = 0.0
+
+    @contextlib.contextmanager
+    def measure(self):
+        if tracemalloc.is_tracing():
+            tracemalloc.reset_peak()
+        wall0, cpu0 = time.perf_counter(), _cpu()
+        try:
+            yield
+        finally:
+            self.wall += time.perf_counter() - wall0
+            self.cpu += _cpu() - cpu0
+            if tracemalloc.is_tracing():
+                self.peak_kb = max(self.peak_kb, tracemalloc.get_traced_memory()[1] / 1024)
+
+
+def _run_corpus(pdfs: list, stages: dict) -> list:
+    """Una pasada completa del pipeline; devuelve el detalle por PDF."""
+    import database_manager
+    import procesador_ihq as ihq
+    from ocr_processing import pdf_to_text_enhanced
+    from procesador_ihq_biomarcadores import _iter_reports, _extract_biomarkers
+    from report_sections import ReportDocument
+
+    detail = []
+    with tempfile.TemporaryDirectory() as tmp:
+        database_manager.DB_FILE = str(Path(tmp) / "bench.db")
+        database_manager.init_db()
+        for pdf in pdfs:
+            doc_wall0 = time.perf_counter()
+            # Los avisos por documento del OCR no forman parte de la salida del benchmark
+            with stages["ocr"].measure(), contextlib.redirect_stdout(io.StringIO()):
+                full_text = pdf_to_text_enhanced(pdf)
+            n_pages = full_text.count("\n--- PÁGINA ")
+
+            with stages["segmentacion"].measure():
+                reports = list(_iter_reports(full_text))
+
+            n_reports = 0
+            for report in reports:
+                with stages["extraccion"].measure():
+                    doc = ReportDocument(report)
+                    rows = ihq.map_to_excel_format(ihq.extract_ihq_data(doc))
+                if not rows:
+                    continue
+                row = dict(rows[0])
+                with stages["biomarcadores"].measure():
+                    row.update(_extract_biomarkers(doc))
+                with stages["persistencia"].measure(), contextlib.redirect_stdout(io.StringIO()):
+                    database_manager.save_records([row])
+                n_reports += 1
+
+            detail.append({"pdf": Path(pdf).name, "paginas": n_pages, "informes": n_reports,
+                           "pared_s": round(time.perf_counter() - doc_wall0, 4)})
+    return detail
+
+
+def run_benchmark(pdfs: list, repeat: int, use_cache: bool, profile_regex: bool = False) -> dict:
+    import ocr_cache
+    import ocr_processing
+    import pattern_registry
+
+    if not use_cache:
+        ocr_cache.CACHE_ENABLED = False
+
+    stages = {name: _Stage() for name, _ in STAGES}
+    detail = []
+    pattern_registry.enable_profiling(profile_regex)
+    try:
+        for _ in range(repeat):
+            detail = _run_corpus(pdfs, stages)
+    finally:
+        pattern_registry.enable_profiling(False)
+
+    # Pasada extra solo para el pico de memoria por etapa
+    mem_stages = {name: _Stage() for name, _ in STAGES}
+    tracemalloc.start()
+    try:
+        _run_corpus(pdfs, mem_stages)
+    finally:
+        tracemalloc.stop()
+
+    units = {"pagina": sum(d["paginas"] for d in detail), "informe": sum(d["informes"] for d in detail)}
+    result_stages = {}
+    for name, unit in STAGES:
+        st, n = stages[name], units[unit] * repeat
+        result_stages[name] = {
+            "unidad": unit,
+            "unidades": n,
+            "pared_s": round(st.wall, 4),
+            "cpu_s": round(st.cpu, 4),
+            "pared_ms_por_unidad": round(1000 * st.wall / n, 3) if n else None,
+            "cpu_ms_por_unidad": round(1000 * st.cpu / n, 3) if n else None,
+            "pico_mem_kb": round(mem_stages[name].peak_kb, 1),
+        }
+    result = {
+        "fecha": datetime.now().isoformat(timespec="seconds"),
+        "python": platform.python_version(),
+        "plataforma": platform.platform(),
+        "repeticiones": repeat,
+        "cache_ocr": use_cache,
+        "config_ocr": dict(ocr_processing._ocr_settings(), OCR_WORKERS=ocr_processing.OCR_WORKERS),
+        "pdfs": detail,
+        "paginas": units["pagina"],
+        "informes": units["informe"],
+        "etapas": result_stages,
+        "pico_rss_mb": round(_peak_rss_mb(), 1),
+        "compilacion_patrones_ms": round(1000 * pattern_registry.total_compile_seconds(), 3),
+    }
+    if profile_regex:
+        result["patrones"] = pattern_registry.stats()
+    return result
+
+
+def _print_summary(result: dict) -> None:
+    print(f"📊 Pipeline IHQ: {len(result['pdfs'])} PDF(s), {result['paginas']} páginas, "
+          f"{result['informes']} informes, {result['repeticiones']} repetición(es)")
+    for name, st in result["etapas"].items():
+        per = st["pared_ms_por_unidad"]
+        per_txt = f"{per:>10.3f} ms/{st['unidad']}" if per is not None else f"{'-':>10} ms/{st['unidad']}"
+        print(f"   {name:<14} pared {st['pared_s']:>9.3f} s  cpu {st['cpu_s']:>9.3f} s  {per_txt}  "
+              f"pico {st['pico_mem_kb']:>9.1f} KB")
+    print(f"   Pico RSS del proceso: {result['pico_rss_mb']:.1f} MB · "
+          f"compilación de patrones {result['compilacion_patrones_ms']:.1f} ms")
+    if "patrones" in result:
+        print("   Patrones más costosos:")
+        for r in result["patrones"][:10]:
+            print(f"     {r['total_ms']:>9.3f} ms  {r['llamadas']:>6} llamadas  {r['patron']}")
+
+
+def _compare(before_path: str, after_path: str) -> None:
+    before = json.loads(Path(before_path).read_text(encoding="utf-8"))
+    after = json.loads(Path(after_path).read_text(encoding="utf-8"))
+    print(f"📊 {Path(before_path).name} → {Path(after_path).name}")
+    changed = {k: (before["config_ocr"].get(k), v) for k, v in after["config_ocr"].items()
+               if before["config_ocr"].get(k) != v}
+    for key, (old, new) in changed.items():
+        print(f"   config {key}: {old} → {new}")
+    for name, st in after["etapas"].items():
+        old, new = before["etapas"].get(name, {}).get("pared_ms_por_unidad"), st["pared_ms_por_unidad"]
+        if old and new is not None:
+            print(f"   {name:<14} {old:>10.3f} → {new:>10.3f} ms/{st['unidad']}  ({100 * (new / old - 1):+.1f}%)")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del pipeline IHQ por etapa")
+    parser.add_argument("paths", nargs="*", default=[str(ROOT / "pdfs_patologia")])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--json", default="bench_pipeline.json", help="Archivo de resultados")
+    parser.add_argument("--cache", action="store_true", help="Usa la caché OCR (por defecto se desactiva)")
+    parser.add_argument("--regex", action="store_true", help="Perfila el tiempo por patrón regex")
+    parser.add_argument("--compare", nargs=2, metavar=("ANTES", "DESPUES"), help="Compara dos resultados JSON")
+    args = parser.parse_args()
+
+    if args.compare:
+        _compare(*args.compare)
+        return
+
+    pdfs = []
+    for p in map(Path, args.paths):
+        pdfs += sorted(p.glob("*.pdf")) if p.is_dir() else [p]
+    pdfs = [str(p) for p in pdfs]
+
+    result = run_benchmark(pdfs, max(1, args.repeat), args.cache, args.regex)
+    Path(args.json).write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+    _print_summary(result)
+    print(f"   Resultados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
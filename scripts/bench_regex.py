@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Perfilador de patrones regex contra retroceso catastrófico.
+
+Mide cada patrón de `pattern_registry` (todos los extractores IHQ) de dos formas:
+    corpus       recorrido completo (finditer) sobre los informes de los PDFs indicados
+    adversarial  entradas generadas de tamaño creciente a partir del corpus:
+                   linea_unica        el texto sin saltos de línea (página OCR en una sola línea)
+                   sin_terminadores   además sin ':', '%', '(', ')', '-', '.' que cierran los campos
+                   casi_coincidencias cada coincidencia del patrón sin su último carácter, repetida
+                   espacios           cada espacio convertido en ' \\n ' (muchas líneas y \\s largos)
+
+Para cada entrada adversarial se duplica el tamaño (1k → 16k caracteres por defecto) y se
+estima el exponente de crecimiento del tiempo (pendiente de log(tiempo) contra log(tamaño)):
+~1 es lineal, ~2 cuadrático. Un patrón se marca SUPERLINEAL si el exponente supera --umbral
+y el tiempo al tamaño mayor pasa de 5 ms, o si alguna medición excede --limite-ms (se corta
+con el mismo mecanismo del presupuesto de extracción). El resultado se guarda en JSON.
+
+Uso:
+    python scripts/bench_regex.py [carpeta_o_pdf ...] [--tamanos 1000 2000 4000 8000 16000]
+                                  [--umbral 1.5] [--limite-ms 2000] [--json bench_regex.json] [--patron PREFIJO]
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import math
+import re
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+# Por debajo de este tiempo (al tamaño mayor) la pendiente es ruido de medición
+MIN_FLAG_MS = 5.0
+# Las mediciones más cortas que esto se repiten y se toma la mínima
+REPEAT_BELOW_MS = 50.0
+
+
+def _load_corpus(pdfs: list) -> list:
+    """Textos de los informes (espacios colapsados, como los ven los extractores)."""
+    import ocr_cache
+    from ocr_processing import pdf_to_text_enhanced
+    from procesador_ihq_biomarcadores import _iter_reports
+    from report_sections import ReportDocument
+
+    ocr_cache.CACHE_ENABLED = False
+    texts = []
+    for pdf in pdfs:
+        with contextlib.redirect_stdout(io.StringIO()):
+            full_text = pdf_to_text_enhanced(pdf)
+        texts += [ReportDocument(report).text for report in _iter_reports(full_text)]
+    return texts
+
+
+def _fit(text: str, size: int) -> str:
+    """Repite o recorta `text` hasta `size` caracteres."""
+    if not text:
+        return ""
+    return (text * (size // len(text) + 1))[:size]
+
+
+def _generators(corpus: list):
+    """{nombre: función(patrón) → texto base} de las entradas adversariales."""
+    joined = " ".join(corpus)
+    one_line = joined.replace("\n", " ")
+    no_terminators = re.sub(r"[\n:%()\-.]", " ", joined)
+    spaced = joined.replace(" ", " \n ")
+
+    def near_misses(pattern):
+        misses = [m.group(0)[:-1] for text in corpus for m in pattern.regex.finditer(text) if len(m.group(0)) > 1]
+        return " ".join(misses).replace("\n", " ") or one_line
+
+    return {
+        "linea_unica": lambda pattern: one_line,
+        "sin_terminadores": lambda pattern: no_terminators,
+        "casi_coincidencias": near_misses,
+        "espacios": lambda pattern: spaced,
+    }
+
+
+def _scanner(name: str, pattern):
+    """
+    Recorrido del texto tal como lo hace la extracción. Los campos de biomarcadores
+    ('biomarcadores.MARCADOR.campo') no se buscan en todo el texto: se prueban con `match`
+    desde el final de cada alias hasta el fin de su línea (BiomarkerRules.extract).
+    """
+    if name.startswith("biomarcadores.") and name.count(".") == 2:
+        from biomarker_rules import RULES
+
+        def scan(text):
+            hits = 0
+            for m in RULES.pattern.regex.finditer(text):
+                line_end = text.find("\n", m.end())
+                hits += pattern.regex.match(text, m.end(), len(text) if line_end == -1 else line_end) is not None
+            return hits
+        return scan
+    return lambda text: sum(1 for _ in pattern.regex.finditer(text))
+
+
+def _time_scan(scan, text: str, limit_s: float):
+    """Milisegundos de un recorrido completo, o None si se cortó por --limite-ms."""
+    import pattern_registry
+
+    best = None
+    for _ in range(3):
+        start = time.perf_counter()
+        try:
+            pattern_registry.run_with_limit(scan, text, seconds=limit_s)
+        except pattern_registry.RegexTimeout:
+            return None
+        ms = 1000 * (time.perf_counter() - start)
+        best = ms if best is None else min(best, ms)
+        if best >= REPEAT_BELOW_MS:
+            break
+    return best
+
+
+def _growth(sizes: list, times: list) -> float:
+    """Pendiente por mínimos cuadrados de log(ms) contra log(tamaño); ignora tiempos ínfimos."""
+    points = [(math.log(n), math.log(t)) for n, t in zip(sizes, times) if t is not None and t > 0.05]
+    if len(points) < 2:
+        return 0.0
+    mx = sum(x for x, _ in points) / len(points)
+    my = sum(y for _, y in points) / len(points)
+    var = sum((x - mx) ** 2 for x, _ in points)
+    return round(sum((x - mx) * (y - my) for x, y in points) / var, 2)
+
+
+def profile_patterns(corpus: list, sizes: list, threshold: float, limit_ms: float, prefix: str = "") -> list:
+    import procesador_ihq_biomarcadores  # noqa: F401  (registra todos los patrones)
+    import pattern_registry
+
+    generators = _generators(corpus)
+    rows = []
+    for name in sorted(pattern_registry._registry):
+        if not name.startswith(prefix):
+            continue
+        pattern = pattern_registry.get(name)
+        scan = _scanner(name, pattern)
+        corpus_ms = sum(_time_scan(scan, text, limit_ms / 1000) or limit_ms for text in corpus)
+        row = {"patron": name, "corpus_ms": round(corpus_ms, 3), "entradas": {}, "superlineal": False}
+        for gen_name, generator in generators.items():
+            base = generator(pattern)
+            times = []
+            for size in sizes:
+                ms = _time_scan(scan, _fit(base, size), limit_ms / 1000)
+                times.append(ms)
+                if ms is None:
+                    break               # cortado: los tamaños mayores solo tardarían más
+            cut = times[-1] is None
+            exponent = _growth(sizes, times)
+            flagged = cut or (exponent > threshold and times[-1] > MIN_FLAG_MS)
+            row["entradas"][gen_name] = {"ms": [None if t is None else round(t, 3) for t in times],
+                                         "exponente": exponent, "cortado": cut}
+            row["superlineal"] |= flagged
+        row["peor_exponente"] = max(e["exponente"] for e in row["entradas"].values())
+        row["peor_ms"] = max((t if t is not None else limit_ms)
+                             for e in row["entradas"].values() for t in e["ms"])
+        rows.append(row)
+    return sorted(rows, key=lambda r: (not r["superlineal"], -r["peor_ms"]))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Perfila los patrones regex y detecta crecimiento superlineal")
+    parser.add_argument("paths", nargs="*", default=[str(ROOT / "pdfs_patologia")])
+    parser.add_argument("--tamanos", type=int, nargs="+", default=[1000, 2000, 4000, 8000, 16000],
+                        help="Tamaños de las entradas adversariales (duplicándose)")
+    parser.add_argument("--umbral", type=float, default=1.5, help="Exponente a partir del cual se marca")
+    parser.add_argument("--limite-ms", type=float, default=2000, help="Corte por medición")
+    parser.add_argument("--patron", default="", help="Solo patrones cuyo nombre empiece así")
+    parser.add_argument("--json", default="bench_regex.json", help="Archivo de resultados")
+    args = parser.parse_args()
+
+    pdfs = []
+    for p in map(Path, args.paths):
+        pdfs += sorted(p.glob("*.pdf")) if p.is_dir() else [p]
+    corpus = _load_corpus([str(p) for p in pdfs])
+
+    rows = profile_patterns(corpus, sorted(args.tamanos), args.umbral, args.limite_ms, args.patron)
+    result = {"fecha": datetime.now().isoformat(timespec="seconds"), "informes": len(corpus),
+              "tamanos": sorted(args.tamanos), "umbral": args.umbral, "limite_ms": args.limite_ms,
+              "patrones": rows}
+    Path(args.json).write_text(json.dumps(result, indent=2, ensure_ascii=False), encoding="utf-8")
+
+    flagged = [r for r in rows if r["superlineal"]]
+    print(f"📊 {len(rows)} patrones sobre {len(corpus)} informes; {len(flagged)} superlineales")
+    for r in rows[:max(10, len(flagged))]:
+        worst = max(r["entradas"].items(), key=lambda kv: kv[1]["exponente"])
+        mark = "⚠️ " if r["superlineal"] else "   "
+        print(f"   {mark}{r['peor_ms']:>9.2f} ms  exp {r['peor_exponente']:>5.2f} ({worst[0]:<18})  "
+              f"corpus {r['corpus_ms']:>7.2f} ms  {r['patron']}")
+    print(f"   Resultados en {args.json}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Compara el render de páginas para OCR: ruta anterior (RGB → PPM → PIL → "L" → LANCZOS)
+contra `ocr_processing._render_gray` (pixmap en grises a resolución final, sin copias).
+
+Cada modo corre en un subproceso propio para medir su pico de memoria (RSS) por separado.
+
+Uso:
+    python scripts/bench_render.py [carpeta_o_pdf ...] [--repeat 3]
+"""
+
+import argparse
+import io
+import json
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(ROOT))
+
+
+def _peak_rss_mb() -> float:
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # Linux reporta KB; macOS, bytes
+        return peak / 1024 / 1024 if sys.platform == "darwin" else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / 1024 / 1024
+
+
+def _render_legacy(page, dpi, min_width):
+    import fitz
+    from PIL import Image
+    pix = page.get_pixmap(matrix=fitz.Matrix(dpi / 72, dpi / 72))
+    img = Image.open(io.BytesIO(pix.tobytes("ppm")))
+    if img.mode != "L":
+        img = img.convert("L")
+    if img.width < min_width:
+        scale = min_width / img.width
+        img = img.resize((int(img.width * scale), int(img.height * scale)), Image.LANCZOS)
+    return img
+
+
+def _run_mode(mode: str, pdfs: list, repeat: int) -> dict:
+    import fitz
+    import ocr_processing as ocr
+
+    times = []
+    for _ in range(repeat):
+        for pdf in pdfs:
+            doc = fitz.open(pdf)
+            for page in doc:
+                t0 = time.perf_counter()
+                if mode == "legacy":
+                    img = _render_legacy(page, ocr.DPI, ocr.MIN_WIDTH)
+                else:
+                    img = ocr._render_gray(page, ocr.DPI, ocr.MIN_WIDTH)
+                img.load()  # fuerza que la imagen esté materializada
+                times.append(time.perf_counter() - t0)
+                del img
+            doc.close()
+    return {
+        "modo": mode,
+        "paginas": len(times),
+        "ms_por_pagina": round(1000 * sum(times) / len(times), 1) if times else 0.0,
+        "pico_rss_mb": round(_peak_rss_mb(), 1),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark del render de páginas para OCR")
+    parser.add_argument("paths", nargs="*", default=[str(ROOT / "pdfs_patologia")])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--mode", choices=("legacy", "gris"), help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    pdfs = []
+    for p in map(Path, args.paths):
+        pdfs += sorted(p.glob("*.pdf")) if p.is_dir() else [p]
+    pdfs = [str(p) for p in pdfs]
+
+    if args.mode:
+        # Subproceso: mide un solo modo y devuelve JSON por stdout
+        print(json.dumps(_run_mode(args.mode, pdfs, args.repeat)))
+        return
+
+    results = []
+    for mode in ("legacy", "gris"):
+        out = subprocess.run([sys.executable, __file__, *pdfs, "--repeat", str(args.repeat), "--mode", mode],
+                             capture_output=True, text=True, check=True)
+        results.append(json.loads(out.stdout.strip().splitlines()[-1]))
+
+    print(f"📊 Render para OCR sobre {len(pdfs)} PDF(s), {args.repeat} repetición(es)")
+    for r in results:
+        print(f"   {r['modo']:<7} {r['paginas']:>4} págs  {r['ms_por_pagina']:>8.1f} ms/pág  pico RSS {r['pico_rss_mb']:>7.1f} MB")
+    legacy, gris = results
+    if legacy["ms_por_pagina"] and legacy["pico_rss_mb"]:
+        print(f"   Tiempo: {100 * (1 - gris['ms_por_pagina'] / legacy['ms_por_pagina']):.0f}% menos · "
+              f"RSS: {100 * (1 - gris['pico_rss_mb'] / legacy['pico_rss_mb']):.0f}% menos")
+
+
+if __name__ == "__main__":
+    main()
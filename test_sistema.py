@@ -118,6 +118,646 @@ def test_sample_processing():
         print(f"❌ Error en procesamiento de prueba: {str(e)}")
         return False
 
+def test_page_classification():
+    """Probar que una primera página con el código IHQ mal leído no se acepta como continuación"""
+    print("\n🔍 Verificando clasificación de páginas OCR...")
+    print("=" * 40)
+
+    import ocr_templates
+    from ocr_processing import _passes_quality
+
+    cases = [
+        # Primera página con el código mal leído: trae DIAGNÓSTICO y 'Pag. 1 de 2' pero no el código
+        ("N. peticion : 1HQ25O0I2\nDIAGNÓSTICO\nCARCINOMA DUCTAL INFILTRANTE\nPag. 1 de 2", "sin_codigo", False),
+        ("N. peticion : IHQ250012\nDIAGNÓSTICO\nCARCINOMA DUCTAL INFILTRANTE\nPag. 1 de 2", "encabezado", True),
+        ("COMENTARIOS\nResponsable del análisis\nPag. 2 de 2", "continuacion", True),
+        ("DIAGNÓSTICO\nCARCINOMA DUCTAL INFILTRANTE\nPag. 1 de 2", "desconocida", False),
+    ]
+    ok = True
+    for text, expected, accepted in cases:
+        page_type = ocr_templates.classify_page_text(text)
+        # Texto largo y confianza alta: solo el tipo de página decide el primer nivel
+        passes = _passes_quality(text + " " * 300, page_type, 100.0)
+        status = "✅" if (page_type, passes) == (expected, accepted) else "❌"
+        ok &= status == "✅"
+        print(f"{status} {text.splitlines()[0][:40]!r}: {page_type}, primer nivel {'aceptado' if passes else 'escala'}")
+    return ok
+
+def test_key_migration():
+    """Probar que la migración al índice único solo quita duplicados con número de petición y respalda la BD"""
+    print("\n🔍 Verificando migración de duplicados por número de petición...")
+    print("=" * 40)
+
+    import sqlite3
+    import tempfile
+    from pathlib import Path
+    import database_manager as dm
+
+    original = dm.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        dm.DB_FILE = str(Path(tmp) / "migracion.db")
+        try:
+            # Base anterior al índice único: dos duplicados reales y varios informes sin número
+            dm.init_db()
+            conn = dm.get_connection()
+            conn.execute(f"DROP INDEX {dm.KEY_INDEX}")
+            keys = ["IHQ250001", "IHQ250001", "IHQ250002", "", "", None, None]
+            conn.executemany(f'INSERT INTO {dm.TABLE_NAME} ("{dm.KEY_COLUMN}", "Primer nombre") VALUES (?, ?)',
+                             [(key, f"PACIENTE {i}") for i, key in enumerate(keys)])
+            conn.commit()
+
+            dm.init_db()
+            names = [row[0] for row in conn.execute(f'SELECT "Primer nombre" FROM {dm.TABLE_NAME} ORDER BY id')]
+            backups = list(Path(tmp).glob("migracion.antes_dedup-*.db"))
+            backed_up = 0
+            if backups:
+                copy = sqlite3.connect(backups[0])
+                backed_up = copy.execute(f"SELECT COUNT(*) FROM {dm.TABLE_NAME}").fetchone()[0]
+                copy.close()
+            # Un informe nuevo sin número tampoco choca con el índice
+            counts = dm.save_records([{dm.KEY_COLUMN: "", "Primer nombre": "NUEVO"}])
+        finally:
+            dm.close_connections()
+            dm.DB_FILE = original
+
+    expected = [f"PACIENTE {i}" for i in (0, 2, 3, 4, 5, 6)]
+    ok = names == expected and backed_up == len(keys) and counts["insertados"] == 1
+    print(f"{'✅' if ok else '❌'} {len(names)}/{len(keys)} registros conservados, "
+          f"respaldo con {backed_up} registros, informe sin número: {counts}")
+    return ok
+
+def test_listing_search():
+    """Probar que la búsqueda del listado no distingue mayúsculas ni acentos (ñ incluida)"""
+    print("\n🔍 Verificando búsqueda del listado con nombres no ASCII...")
+    print("=" * 40)
+
+    import tempfile
+    from pathlib import Path
+    import database_manager as dm
+
+    original = dm.DB_FILE
+    with tempfile.TemporaryDirectory() as tmp:
+        dm.DB_FILE = str(Path(tmp) / "busqueda.db")
+        try:
+            dm.init_db()
+            dm.save_records([
+                {dm.KEY_COLUMN: "IHQ250001", "Primer nombre": "MARÍA", "Primer apellido": "ESTUPIÑAN"},
+                {dm.KEY_COLUMN: "IHQ250002", "Primer nombre": "José", "Primer apellido": "Nuñez"},
+                {dm.KEY_COLUMN: "IHQ250003", "Primer nombre": "ANA", "Primer apellido": "GOMEZ"},
+            ])
+            cases = {"estupiñan": ["IHQ250001"], "maria": ["IHQ250001"], "NÚÑEZ": ["IHQ250002"],
+                     "josé": ["IHQ250002"], "gómez": ["IHQ250003"], "ihq2500": ["IHQ250001", "IHQ250002", "IHQ250003"]}
+            found = {text: [row[1] for row in dm.get_listing_page(search=text)[0]] for text in cases}
+        finally:
+            dm.close_connections()
+            dm.DB_FILE = original
+
+    ok = True
+    for text, expected in cases.items():
+        status = "✅" if found[text] == expected else "❌"
+        ok &= status == "✅"
+        print(f"{status} {text!r}: {found[text]}")
+    return ok
+
+def test_rerun_after_rule_change():
+    """Probar que reprocesar un PDF ya guardado no marca como al día una fila que no se reescribió"""
+    print("\n🔍 Verificando versiones de reglas al reprocesar un PDF...")
+    print("=" * 40)
+
+    import tempfile
+    from pathlib import Path
+    import database_manager as dm
+    import ocr_cache
+    import procesador_ihq_biomarcadores as proc
+
+    pdf = str(Path(__file__).resolve().parent / "pdfs_patologia" / "IHQ250905.pdf")
+    column = "IHQ_HER2"
+    original_db, original_versions, cache = dm.DB_FILE, proc.field_versions, ocr_cache.CACHE_ENABLED
+    with tempfile.TemporaryDirectory() as tmp:
+        dm.DB_FILE = str(Path(tmp) / "versiones.db")
+        ocr_cache.CACHE_ENABLED = False
+        try:
+            proc.process_ihq_paths([pdf], tmp)
+            before = {peticion: versions for peticion, _, versions in dm.get_report_texts()}
+            # Cambia la versión de una regla: la fila ya existe y save_records la omite
+            bumped = original_versions()
+            bumped["biomarcadores"][column] = "regla-nueva"
+            proc.field_versions = lambda: bumped
+            proc.process_ihq_paths([pdf], tmp)
+            after = {peticion: versions for peticion, _, versions in dm.get_report_texts()}
+        finally:
+            proc.field_versions = original_versions
+            ocr_cache.CACHE_ENABLED = cache
+            dm.close_connections()
+            dm.DB_FILE = original_db
+
+    ok = bool(before) and all(after[p].get(column) == before[p].get(column) != "regla-nueva" for p in before)
+    print(f"{'✅' if ok else '❌'} {len(before)} informe(s): versión de {column} "
+          f"{'conservada' if ok else 'marcada al día sin reescribir la fila'}")
+    return ok
+
+def test_incremental_reextraction():
+    """Probar la re-extracción incremental de punta a punta: PDF → BD → regla cambiada → reextraccion_ihq"""
+    print("\n🔍 Verificando re-extracción incremental...")
+    print("=" * 40)
+
+    import json
+    import tempfile
+    from pathlib import Path
+    import database_manager as dm
+    import ocr_cache
+    import procesador_ihq_biomarcadores as proc
+    import reextraccion_ihq
+
+    folder = Path(__file__).resolve().parent / "pdfs_patologia"
+    pdfs = [str(folder / "IHQ250905.pdf"), str(folder / "IHQ250906.pdf")]
+    column = "IHQ_HER2"
+    original_db, original_build, cache = dm.DB_FILE, proc.build_record, ocr_cache.CACHE_ENABLED
+
+    def build_without_number(doc, groups=proc.EXTRACTOR_GROUPS):
+        # El segundo PDF simula un informe cuyo número de petición no se pudo leer
+        row = original_build(doc, groups)
+        if row and "IHQ250906" in doc.raw:
+            row[dm.KEY_COLUMN] = ""
+        return row
+
+    with tempfile.TemporaryDirectory() as tmp:
+        dm.DB_FILE = str(Path(tmp) / "reextraccion.db")
+        ocr_cache.CACHE_ENABLED = False
+        proc.build_record = build_without_number
+        try:
+            proc.process_ihq_paths(pdfs, tmp)
+            texts = dm.get_report_texts()
+            records = dm.get_records_by_peticion()
+            peticion = texts[0][0]
+            expected = records[peticion][column]
+            # Valor producido por una versión anterior de la regla de HER2
+            conn = dm.get_connection()
+            with conn:
+                conn.execute(f'UPDATE {dm.TABLE_NAME} SET "{column}" = ? WHERE "{dm.KEY_COLUMN}" = ?',
+                             ("VALOR ANTERIOR", peticion))
+                stale = {**texts[0][2], column: "regla-anterior"}
+                conn.execute(f"UPDATE {dm.TEXT_TABLE} SET versiones = ? WHERE peticion = ?",
+                             (json.dumps(stale), peticion))
+            first = reextraccion_ihq.reextract_all(workers=1)
+            repaired = dm.get_records_by_peticion()[peticion][column]
+            second = reextraccion_ihq.reextract_all(workers=1)
+            without_number = conn.execute(f'SELECT COUNT(*) FROM {dm.TABLE_NAME} '
+                                          f'WHERE "{dm.KEY_COLUMN}" IS NULL').fetchone()[0]
+        finally:
+            proc.build_record = original_build
+            ocr_cache.CACHE_ENABLED = cache
+            dm.close_connections()
+            dm.DB_FILE = original_db
+
+    checks = {
+        "solo el informe con número guarda texto": [t[0] for t in texts] == [peticion] and without_number == 1,
+        "la regla cambiada se recalcula": first["recalculados"] == 1 and first["campos_recalculados"] == 1,
+        f"{column} vuelve al valor actual": repaired == expected and first["actualizados"] == 1,
+        "la segunda pasada no tiene nada que hacer": second["al_dia"] == second["textos"] == 1,
+    }
+    for name, passed in checks.items():
+        print(f"{'✅' if passed else '❌'} {name}")
+    return all(checks.values())
+
+def test_report_index_memory():
+    """Probar que las vistas de informes retienen el documento una sola vez, no una copia por informe"""
+    print("\n🔍 Verificando memoria retenida por el índice de informes...")
+    print("=" * 40)
+
+    import gc
+    import tracemalloc
+    from report_index import index_reports, iter_report_spans
+
+    # 20 informes de ~100.000 caracteres, en 10 páginas cada uno (≈ 2 MB)
+    body = "CARCINOMA DUCTAL INFILTRANTE GRADO 2. " * 263
+
+    def pages():
+        # Cada página se crea al pedirla, como las que entrega el OCR
+        for i in range(200):
+            code = f"N. peticion : IHQ{250001 + i // 10}\n" if i % 10 == 0 else ""
+            yield f"--- PÁGINA {i + 1} ---\n{code}{body}"
+
+    size = sum(len(page) for page in pages())
+    ok = True
+    for name, build in (("texto completo", lambda: index_reports("".join(pages()))),
+                        ("por páginas", lambda: list(iter_report_spans(pages())))):
+        gc.collect()
+        tracemalloc.start()
+        spans = build()
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        # El documento (texto ASCII, un byte por carácter) más índices y vistas, no 20 copias
+        passed = len(spans) == 20 and retained < 1.5 * size
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} {name}: {len(spans)} informes, "
+              f"{retained / size:.2f} veces el tamaño del documento retenido")
+        del spans
+    return ok
+
+def test_psm_snapshot():
+    """Probar que el PSM aprendido durante un documento se aplica desde el siguiente, no a mitad"""
+    print("\n🔍 Verificando aprendizaje de PSM por documento...")
+    print("=" * 40)
+
+    import tempfile
+    from pathlib import Path
+    import ocr_templates
+
+    saved = ocr_templates.TEMPLATES_DB, ocr_templates._learned
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            ocr_templates.TEMPLATES_DB = Path(tmp) / "plantillas.db"
+            template = "612x792|siguiente|tinta-media"
+            learned = ocr_templates.snapshot()
+            # Otro proceso del pool registra aciertos mientras el documento sigue en curso
+            for _ in range(5):
+                ocr_templates.record_psm(template, 4, True)
+            during = ocr_templates.learned_psm(template)
+            ocr_templates.use_snapshot(learned)
+            in_worker = ocr_templates.learned_psm(template)
+            ocr_templates.snapshot()
+            after = ocr_templates.learned_psm(template)
+    finally:
+        ocr_templates.TEMPLATES_DB, ocr_templates._learned = saved
+
+    ok = during is None and in_worker is None and after == 4
+    print(f"{'✅' if ok else '❌'} durante el documento: {during}, en un proceso del pool: {in_worker}, "
+          f"documento siguiente: {after}")
+    return ok
+
+def test_frozen_data_dir():
+    """Probar que en el ejecutable (--onefile) los datos se guardan junto al .exe y no en _MEIPASS"""
+    print("\n🔍 Verificando carpeta de datos del ejecutable...")
+    print("=" * 40)
+
+    import subprocess
+    import tempfile
+    from pathlib import Path
+
+    with tempfile.TemporaryDirectory() as tmp:
+        exe = Path(tmp) / "OCR_Medico.exe"
+        # Se simula lo que PyInstaller define al arrancar: sys.frozen y sys.executable
+        code = ("import sys; sys.frozen = True; sys.executable = sys.argv[1]\n"
+                "import database_manager, ocr_cache, ocr_templates\n"
+                "print(database_manager.DB_FILE); print(ocr_cache.CACHE_DIR); "
+                "print(ocr_templates.TEMPLATES_DB)")
+        out = subprocess.run([sys.executable, "-c", code, str(exe)], capture_output=True, text=True,
+                             cwd=Path(__file__).resolve().parent)
+        if out.returncode != 0:
+            print(f"❌ Error al importar: {out.stderr.strip()[-300:]}")
+            return False
+        ok = True
+        base = exe.resolve().parent
+        # Las tres últimas líneas (PyMuPDF puede escribir avisos al importarse)
+        for path in out.stdout.splitlines()[-3:]:
+            passed = Path(path).resolve().is_relative_to(base)
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} {path}")
+    return ok
+
+def test_regex_budget():
+    """Probar el corte por presupuesto en ambos motores y que `regex` da lo mismo que `re`"""
+    print("\n🔍 Verificando presupuesto de tiempo de los patrones...")
+    print("=" * 40)
+
+    import threading
+    import time
+    from pathlib import Path
+    import fitz
+    import pattern_registry
+    import procesador_ihq_biomarcadores  # noqa: F401  (registra todos los patrones)
+    from report_sections import ReportDocument
+
+    ok = True
+    saved = pattern_registry.get_budget_ms()
+    try:
+        pattern_registry.set_budget(100)
+        # Retroceso exponencial en ambos motores: sin corte tardaría minutos
+        pattern = pattern_registry.Pattern("prueba.catastrofico", r"(?:(a|aa)+)+c")
+        start = time.perf_counter()
+        result = pattern.search("a" * 40)
+        elapsed = time.perf_counter() - start
+        passed = result is None and pattern.timeouts == 1 and elapsed < 2
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} hilo principal (re + SIGALRM): cortado en {elapsed:.2f} s")
+
+        if pattern.guarded() is None:
+            print("⚠️ módulo regex no instalado: no se prueba el corte fuera del hilo principal")
+        else:
+            out = {}
+
+            def worker():
+                begin = time.perf_counter()
+                out["resultado"] = pattern.search("a" * 40)
+                out["segundos"] = time.perf_counter() - begin
+
+            thread = threading.Thread(target=worker)
+            thread.start()
+            thread.join(10)
+            passed = not thread.is_alive() and out["resultado"] is None and pattern.timeouts == 2
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} otro hilo (respaldo regex con timeout): "
+                  f"cortado en {out.get('segundos', 0):.2f} s")
+    finally:
+        pattern_registry.set_budget(saved)
+
+    if pattern_registry.regex is not None:
+        # El respaldo solo sirve si encuentra lo mismo que `re` en los textos reales
+        texts = []
+        for pdf in sorted((Path(__file__).resolve().parent / "pdfs_patologia").glob("*.pdf")):
+            with fitz.open(pdf) as doc:
+                raw = "\n".join(page.get_text() for page in doc)
+            texts += [raw, ReportDocument(raw).text, raw.upper()]
+        differences = []
+        for name, registered in sorted(pattern_registry._registry.items()):
+            for text in texts:
+                expected = [(m.span(), m.groups()) for m in registered.regex.finditer(text)]
+                got = [(m.span(), m.groups()) for m in registered.guarded().finditer(text)]
+                if expected != got:
+                    differences.append(name)
+                    break
+        passed = not differences
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} {len(pattern_registry._registry)} patrones en {len(texts)} textos: "
+              f"{'mismos resultados en re y regex' if passed else 'difieren ' + ', '.join(differences)}")
+    return ok
+
+def test_long_line_biomarkers():
+    """Probar que un valor lejos del alias en una línea larga y ruidosa no se pierde"""
+    print("\n🔍 Verificando biomarcadores en líneas largas...")
+    print("=" * 40)
+
+    import pandas as pd
+    from procesador_ihq_biomarcadores import _extract_biomarkers, extract_biomarkers_batch
+
+    noise = "tincion nuclear heterogenea en celulas tumorales con artefacto de fijacion " * 5
+    text = (f"DIAGNOSTICO\nKI-67: {noise} 35%\n"
+            f"RECEPTOR DE ESTROGENO: {noise} POSITIVO 90%\n")
+    expected = {"IHQ_KI-67": "35%", "IHQ_RECEPTOR_ESTROGENO": "POSITIVO 90%"}
+    scalar = _extract_biomarkers(text)
+    batch = extract_biomarkers_batch(pd.Series([text])).iloc[0]
+    ok = True
+    for column, value in expected.items():
+        passed = scalar[column] == value and batch[column] == value
+        ok &= passed
+        print(f"{'✅' if passed else '❌'} {column} a {len(noise)} caracteres del alias: "
+              f"escalar={scalar[column]!r} lotes={batch[column]!r}")
+    return ok
+
+def test_scanned_pdf_ocr():
+    """Probar el OCR sobre un PDF solo imagen: secuencial = paralelo, caché, resolución adaptativa y ROI"""
+    print("\n🔍 Verificando OCR de un PDF escaneado...")
+    print("=" * 40)
+
+    import contextlib
+    import io
+    import tempfile
+    from pathlib import Path
+    import fitz
+    import ocr_cache
+    import ocr_templates
+    import ocr_processing as ocr
+
+    settings = ("OCR_WORKERS", "ADAPTIVE_DPI", "ROI_MODE")
+    saved_ocr = {name: getattr(ocr, name) for name in settings}
+    saved_cache = ocr_cache.CACHE_ENABLED, ocr_cache.CACHE_DIR, ocr_cache.CACHE_DB
+    saved_templates = ocr_templates.TEMPLATES_DB, ocr_templates._learned
+
+    def run(pdf, **overrides):
+        for name in settings:
+            setattr(ocr, name, overrides.get(name, {"OCR_WORKERS": 1, "ADAPTIVE_DPI": 0, "ROI_MODE": False}[name]))
+        with contextlib.redirect_stdout(io.StringIO()):
+            return list(ocr.iter_pdf_pages(str(pdf), with_info=True))
+
+    def comparable(pages):
+        # El tiempo por página es lo único que puede variar entre corridas
+        return [(num, text, {k: v for k, v in info.items() if k != "segundos"}) for num, text, info in pages]
+
+    ok = True
+    try:
+        with tempfile.TemporaryDirectory() as tmp:
+            tmp = Path(tmp)
+            # Informe de muestra rasterizado: cada página es solo una imagen, sin capa de texto
+            pdf = tmp / "escaneado.pdf"
+            with fitz.open(Path(__file__).resolve().parent / "pdfs_patologia" / "IHQ250905.pdf") as src, \
+                    fitz.open() as out:
+                for page in src:
+                    pix = page.get_pixmap(dpi=100, colorspace=fitz.csGRAY)
+                    new = out.new_page(width=page.rect.width, height=page.rect.height)
+                    new.insert_image(new.rect, stream=pix.tobytes("png"))
+                out.save(pdf)
+            with fitz.open(pdf) as doc:
+                kind = ocr.classify_pdf(doc, range(len(doc)))["tipo"]
+            passed = kind == "escaneado"
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} PDF de prueba clasificado como {kind}")
+
+            ocr_cache.CACHE_ENABLED = False
+            # Cada modo parte de un aprendizaje de PSM vacío
+            ocr_templates.TEMPLATES_DB = tmp / "plantillas_secuencial.db"
+            ocr_templates._learned = None
+            serial = run(pdf)
+            ocr_templates.TEMPLATES_DB = tmp / "plantillas_paralelo.db"
+            ocr_templates._learned = None
+            parallel = run(pdf, OCR_WORKERS=2)
+            passed = (comparable(serial) == comparable(parallel)
+                      and all(info["fuente"] == "ocr" and text.strip() for _, text, info in serial))
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} {len(serial)} páginas por OCR; secuencial y paralelo "
+                  f"{'idénticos' if passed else 'difieren'}")
+
+            ocr_cache.CACHE_ENABLED = True
+            ocr_cache.CACHE_DIR = tmp / "cache"
+            ocr_cache.CACHE_DB = ocr_cache.CACHE_DIR / "ocr_cache.db"
+            first, second = run(pdf), run(pdf)
+            passed = (not any(info["cache"] for _, _, info in first)
+                      and all(info["cache"] for _, _, info in second)
+                      and [text for _, text, _ in first] == [text for _, text, _ in second])
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} segunda corrida desde la caché: "
+                  f"{sum(info['cache'] for _, _, info in second)}/{len(second)} páginas")
+            ocr_cache.CACHE_ENABLED = False
+
+            adaptive = run(pdf, ADAPTIVE_DPI=150)
+            # El primer nivel por sí solo (la página puede escalar a DPI si no pasa los controles)
+            with fitz.open(pdf) as doc:
+                low_text = ocr._ocr_page_low_res(doc.load_page(0))[0]
+            passed = bool(low_text.strip()) and all(text.strip() for _, text, _ in adaptive)
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} resolución adaptativa: {len(low_text)} caracteres a 150 DPI, "
+                  f"niveles {[info['nivel'] for _, _, info in adaptive]}")
+
+            roi = run(pdf, ROI_MODE=True)
+            passed = all(text.strip() and info.get("regiones") for _, text, info in roi)
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} OCR por regiones: "
+                  f"{[len(info.get('regiones') or []) for _, _, info in roi]} regiones por página")
+    finally:
+        for name, value in saved_ocr.items():
+            setattr(ocr, name, value)
+        ocr_cache.CACHE_ENABLED, ocr_cache.CACHE_DIR, ocr_cache.CACHE_DB = saved_cache
+        ocr_templates.TEMPLATES_DB, ocr_templates._learned = saved_templates
+    return ok
+
+def test_dashboard_aggregates():
+    """Probar los agregados SQL del dashboard contra pandas y que no cierran una transacción ajena"""
+    print("\n🔍 Verificando agregados del dashboard...")
+    print("=" * 40)
+
+    import tempfile
+    from pathlib import Path
+    import database_manager as dm
+
+    date_col = "Fecha finalizacion (3. Fecha del informe)"
+    original = dm.DB_FILE
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        dm.DB_FILE = str(Path(tmp) / "dashboard.db")
+        try:
+            dm.init_db()
+            dm.save_records([
+                {dm.KEY_COLUMN: "IHQ250101", date_col: "15/01/2025", "Malignidad": "PRESENTE",
+                 "Servicio": "GINECOLOGIA", dm.ORGAN_COLUMN: "MAMA", "IHQ_KI-67": "20%"},
+                {dm.KEY_COLUMN: "IHQ250102", date_col: "20/01/2025", "Malignidad": "AUSENTE",
+                 "Servicio": "GINECOLOGIA", dm.ORGAN_COLUMN: "", "IHQ_KI-67": ""},
+                {dm.KEY_COLUMN: "IHQ250103", date_col: "03/02/2025", "Malignidad": "PRESENTE",
+                 "Servicio": "CIRUGIA"},
+            ])
+            # Un NULL real (filas de versiones anteriores); '' cuenta como dato, igual que en pandas
+            conn = dm.get_connection()
+            conn.execute(f'UPDATE {dm.TABLE_NAME} SET "Servicio" = NULL WHERE "{dm.KEY_COLUMN}" = ?', ("IHQ250103",))
+            conn.commit()
+            data = dm.get_dashboard_aggregates()
+            df = dm.get_all_records_as_dataframe()
+            # Lo mismo calculado en pandas sobre la tabla completa, como el dashboard anterior
+            checks = {
+                "total": (data["total"], len(df)),
+                "malignidad": (data["malignidad"].to_dict(), df["Malignidad"].value_counts().to_dict()),
+                "por_mes": (data["por_mes"].tolist(), [2, 1]),
+                "ki67": (data["ki67"].to_dict(), {20: 1}),
+                "vacios": (data["vacios"].to_dict(), df[list(dm.MISSING_COLUMNS)].isna().mean().to_dict()),
+                "filtro servicio": (dm.get_dashboard_aggregates({"servicio": "GINECOLOGIA"})["total"], 2),
+            }
+            ok &= data["vacios"]["Servicio"] > 0
+            for name, (got, expected) in checks.items():
+                passed = got == expected
+                ok &= passed
+                print(f"{'✅' if passed else '❌'} {name}: {got}" + ("" if passed else f" (esperado {expected})"))
+
+            # Dentro de una transacción del llamador: ve sus cambios y no la confirma
+            conn.execute("BEGIN")
+            conn.execute(f'DELETE FROM {dm.TABLE_NAME} WHERE "{dm.KEY_COLUMN}" = ?', ("IHQ250103",))
+            inside = dm.get_dashboard_aggregates()["total"]
+            still_open = conn.in_transaction
+            conn.rollback()
+            after = dm.get_dashboard_aggregates()["total"]
+            passed = inside == 2 and still_open and after == 3 and not conn.in_transaction
+            ok &= passed
+            print(f"{'✅' if passed else '❌'} transacción del llamador: {inside} informes dentro, "
+                  f"{'sigue abierta' if still_open else 'confirmada'}, {after} tras revertirla")
+        finally:
+            dm.close_connections()
+            dm.DB_FILE = original
+    return ok
+
+def test_typed_backfill():
+    """Probar que una BD anterior a las columnas tipadas las completa al abrirla, normalizadas"""
+    print("\n🔍 Verificando migración de columnas tipadas...")
+    print("=" * 40)
+
+    import sqlite3
+    import tempfile
+    from pathlib import Path
+    import database_manager as dm
+
+    date_col, intake_col = "Fecha finalizacion (3. Fecha del informe)", "Fecha de ingreso (2. Fecha de la muestra)"
+    # (texto de cada columna de origen) → valores tipados esperados
+    rows = [
+        ({dm.KEY_COLUMN: "IHQ250201", date_col: "05/03/2025 10:20", intake_col: "2025-02-28", "Edad": "45 años",
+          "IHQ_KI-67": "15%", "IHQ_HER2": "POSITIVO (3+)", "IHQ_RECEPTOR_ESTROGENO": "POSITIVO 90%",
+          "IHQ_RECEPTOR_PROGESTAGENOS": "NEGATIVO", "Primer nombre": "MARÍA", "Primer apellido": "Peña"},
+         {"fecha_informe": "2025-03-05", "fecha_ingreso": "2025-02-28", "edad_anios": 45, "ki67_pct": 15,
+          "her2_puntaje": "3+", "re_estado": "POSITIVO", "re_pct": 90, "rp_estado": "NEGATIVO", "rp_pct": None,
+          "nombre_busqueda": "MARIA", "apellido_busqueda": "PENA"}),
+        ({dm.KEY_COLUMN: "IHQ250202", date_col: "31/02/2025", intake_col: "", "Edad": "",
+          "IHQ_KI-67": "<1%", "IHQ_HER2": "2+ (NO AMPLIFICADO)", "IHQ_RECEPTOR_ESTROGENO": "negativo 0%",
+          "IHQ_RECEPTOR_PROGESTAGENOS": "POSITIVO 15,5 %"},
+         {"fecha_informe": None, "fecha_ingreso": None, "edad_anios": None, "ki67_pct": 1,
+          "her2_puntaje": "2+", "re_estado": "NEGATIVO", "re_pct": 0, "rp_estado": "POSITIVO", "rp_pct": 15}),
+        ({dm.KEY_COLUMN: "IHQ250203", date_col: "1-4-2025", "IHQ_KI-67": "150%", "IHQ_HER2": "0"},
+         {"fecha_informe": "2025-04-01", "ki67_pct": None, "her2_puntaje": "0", "re_estado": None}),
+        ({dm.KEY_COLUMN: "IHQ250204", "IHQ_KI-67": "30", "IHQ_HER2": "NEGATIVO"},
+         {"ki67_pct": 30, "her2_puntaje": "NEGATIVO"}),
+    ]
+
+    original = dm.DB_FILE
+    ok = True
+    with tempfile.TemporaryDirectory() as tmp:
+        dm.DB_FILE = str(Path(tmp) / "anterior.db")
+        try:
+            # Esquema anterior: solo columnas de texto, sin columnas tipadas ni índices
+            columns = list(dict.fromkeys([dm.KEY_COLUMN, *(source for _, source, _ in dm.TYPED_COLUMNS.values()),
+                                          *(col for cols in dm.SECONDARY_INDEXES.values() for col in cols
+                                            if col not in dm.TYPED_COLUMNS)]))
+            old = sqlite3.connect(dm.DB_FILE)
+            old.execute(f"CREATE TABLE {dm.TABLE_NAME} (id INTEGER PRIMARY KEY AUTOINCREMENT, "
+                        + ", ".join(f'"{col}" TEXT' for col in columns)
+                        + ", fecha_procesado TIMESTAMP DEFAULT CURRENT_TIMESTAMP)")
+            for record, _ in rows:
+                names = ", ".join(f'"{col}"' for col in record)
+                old.execute(f"INSERT INTO {dm.TABLE_NAME} ({names}) VALUES ({', '.join('?' * len(record))})",
+                            list(record.values()))
+            old.commit()
+            old.close()
+
+            dm.init_db()
+            conn = dm.get_connection()
+            for record, expected in rows:
+                got = dict(zip(expected, conn.execute(
+                    f"SELECT {', '.join(expected)} FROM {dm.TABLE_NAME} WHERE \"{dm.KEY_COLUMN}\" = ?",
+                    (record[dm.KEY_COLUMN],)).fetchone()))
+                passed = got == expected
+                ok &= passed
+                print(f"{'✅' if passed else '❌'} {record[dm.KEY_COLUMN]}: {got}"
+                      + ("" if passed else f" (esperado {expected})"))
+        finally:
+            dm.close_connections()
+            dm.DB_FILE = original
+    return ok
+
+def test_batch_biomarkers():
+    """Probar que la extracción por lotes coincide con la escalar en los PDFs de muestra"""
+    print("\n🔍 Verificando extracción de biomarcadores por lotes...")
+    print("=" * 40)
+
+    from pathlib import Path
+    import pandas as pd
+    import ocr_cache
+    from ocr_processing import pdf_to_text_enhanced
+    from procesador_ihq_biomarcadores import _iter_reports, _extract_biomarkers, extract_biomarkers_batch
+
+    ocr_cache.CACHE_ENABLED = False
+    texts = []
+    for pdf in sorted((Path(__file__).resolve().parent / "pdfs_patologia").glob("*.pdf")):
+        full_text = pdf_to_text_enhanced(str(pdf))
+        texts += [full_text, *_iter_reports(full_text)]
+    # Variantes de caja y espaciado para recorrer más ramas de las reglas
+    texts += [t.upper() for t in texts] + [t.lower() for t in texts] + [t.replace("\n", "  \n") for t in texts]
+
+    batch = extract_biomarkers_batch(pd.Series(texts))
+    scalar = pd.DataFrame([_extract_biomarkers(t) for t in texts])[batch.columns]
+    diff = batch.astype(object) != scalar
+    mismatches = int(diff.values.sum())
+    if mismatches:
+        print(f"❌ {len(texts)} textos, {len(batch.columns)} columnas, {mismatches} diferencias:")
+        for row, col in zip(*diff.values.nonzero()):
+            column = batch.columns[col]
+            print(f"   texto {row}, {column}: lotes={batch.iat[row, col]!r} escalar={scalar.iat[row, col]!r}")
+    else:
+        print(f"✅ {len(texts)} textos, {len(batch.columns)} columnas, sin diferencias")
+    return mismatches == 0
+
 def main():
     """Función principal de prueba"""
     print("🚀 OCR Médico - Verificación del Sistema")
@@ -128,7 +768,21 @@ def main():
     tests = [
         ("Dependencias de Python", test_dependencies),
         ("Tesseract OCR", test_tesseract), 
-        ("Procesamiento de muestra", test_sample_processing)
+        ("Procesamiento de muestra", test_sample_processing),
+        ("Clasificación de páginas", test_page_classification),
+        ("Migración de duplicados", test_key_migration),
+        ("Búsqueda del listado", test_listing_search),
+        ("Versiones al reprocesar", test_rerun_after_rule_change),
+        ("Re-extracción incremental", test_incremental_reextraction),
+        ("Memoria del índice de informes", test_report_index_memory),
+        ("Datos junto al ejecutable", test_frozen_data_dir),
+        ("Aprendizaje de PSM por documento", test_psm_snapshot),
+        ("Presupuesto de patrones", test_regex_budget),
+        ("Biomarcadores en líneas largas", test_long_line_biomarkers),
+        ("OCR de PDF escaneado", test_scanned_pdf_ocr),
+        ("Agregados del dashboard", test_dashboard_aggregates),
+        ("Migración de columnas tipadas", test_typed_backfill),
+        ("Biomarcadores por lotes", test_batch_biomarkers)
     ]
 
     passed = 0
@@ -45,6 +45,27 @@ import procesador_ihq_biomarcadores
 import database_manager
 
 
+def _box_stats(counts):
+    """Estadísticos de boxplot (para ax.bxp) desde {valor: frecuencia}, sin expandir los datos."""
+    counts = counts.sort_index()
+    values = counts.index.to_numpy(dtype=float)
+    cum = counts.to_numpy().cumsum()
+    n = cum[-1]
+
+    def quantile(p):
+        # Interpolación lineal entre posiciones, como np.percentile sobre los datos expandidos
+        pos = p * (n - 1)
+        lo, hi = int(np.floor(pos)), int(np.ceil(pos))
+        v_lo, v_hi = values[np.searchsorted(cum, lo + 1)], values[np.searchsorted(cum, hi + 1)]
+        return v_lo + (v_hi - v_lo) * (pos - lo)
+
+    q1, med, q3 = quantile(0.25), quantile(0.5), quantile(0.75)
+    iqr = q3 - q1
+    inside = values[(values >= q1 - 1.5 * iqr) & (values <= q3 + 1.5 * iqr)]
+    return {"med": med, "q1": q1, "q3": q3, "whislo": inside.min(), "whishi": inside.max(),
+            "fliers": values[(values < inside.min()) | (values > inside.max())]}
+
+
 class App(ctk.CTk):
     def __init__(self):
         super().__init__()
@@ -63,7 +84,11 @@ class App(ctk.CTk):
         self.state('zoomed')       # Y añadimos esta, ¡listo el pollo!
         self.configure(fg_color=BG)
 
-        self.master_df = pd.DataFrame()  # DataFrame maestro (fuente única de verdad)
+        # Listado de Visualizar: se pide a la BD por ventanas (orden, búsqueda y cursor actuales)
+        self._listing_order = (database_manager.KEY_COLUMN, False)
+        self._listing_cursor = None
+        self._listing_count = 0
+        self._listing_loading = False
 
         # Grid maestro: fila 0 header, fila 1 contenido, fila 2 status
         self.grid_rowconfigure(0, weight=0)
@@ -187,37 +212,9 @@ class App(ctk.CTk):
         card.value_lbl = value_lbl
         return card
 
-    def _render_kpis(self, df):
-        if df is None or df.empty:
-            self.kpi_total.value_lbl.configure(text="0")
-            self.kpi_malig.value_lbl.configure(text="0.0%")
-            self.kpi_ultimo.value_lbl.configure(text="—")
-            return
-
-        total = len(df)
-
-        # Malignidad: "PRESENTE"
-        mal_col = "Malignidad" if "Malignidad" in df.columns else None
-        malignos = int(df[mal_col].astype(str).str.upper().eq("PRESENTE").sum()) if mal_col else 0
+    def _set_kpis(self, total, malignos, ultima_fecha):
         pct = (malignos / total * 100) if total else 0.0
-
-        # Último ingreso: fecha finalización > informe > ingreso
-        fecha_cols = [
-            "Fecha finalizacion (3. Fecha del informe)",
-            "Fecha de informe",
-            "Fecha de ingreso",
-        ]
-        fecha_encontrada = None
-        for c in fecha_cols:
-            if c in df.columns:
-                try:
-                    fecha_encontrada = (pd.to_datetime(df[c], dayfirst=True, errors="coerce")).max()
-                    if pd.notna(fecha_encontrada):
-                        break
-                except Exception:
-                    pass
-        ultimo_txt = "—" if (fecha_encontrada is None or pd.isna(fecha_encontrada)) else fecha_encontrada.strftime("%d/%m/%Y")
-
+        ultimo_txt = "—" if (ultima_fecha is None or pd.isna(ultima_fecha)) else pd.Timestamp(ultima_fecha).strftime("%d/%m/%Y")
         self.kpi_total.value_lbl.configure(text=f"{total:,}".replace(",", "."))
         self.kpi_malig.value_lbl.configure(text=f"{pct:.1f}%")
         self.kpi_ultimo.value_lbl.configure(text=ultimo_txt)
@@ -313,9 +310,14 @@ class App(ctk.CTk):
         search_entry.grid(row=0, column=0, sticky="ew", padx=10, pady=10)
 
         style = self.setup_treeview_style()
-        self.tree = ttk.Treeview(table_frame, show="headings", style="Custom.Treeview")
-        self.tree.grid(row=1, column=0, sticky="nsew", padx=10, pady=(0, 10))
+        self.tree = ttk.Treeview(table_frame, show="headings", style="Custom.Treeview",
+                                 yscrollcommand=self._on_tree_scroll)
+        self.tree.grid(row=1, column=0, sticky="nsew", padx=(10, 0), pady=(0, 10))
         self.tree.bind("<<TreeviewSelect>>", self.mostrar_detalle_registro)
+        self.tree_scrollbar = ctk.CTkScrollbar(table_frame, command=self.tree.yview)
+        self.tree_scrollbar.grid(row=1, column=1, sticky="ns", padx=(0, 10), pady=(0, 10))
+        self.listing_info = ctk.CTkLabel(table_frame, text="", text_color=MUTED)
+        self.listing_info.grid(row=2, column=0, sticky="w", padx=10, pady=(0, 6))
 
         self.detail_frame = ctk.CTkFrame(frame, fg_color=SURFACE)
         self.detail_frame.grid(row=1, column=1, sticky="nsew")
@@ -417,29 +419,9 @@ class App(ctk.CTk):
         finally:
             self.set_status("Dashboard actualizado.")
 
-    def _get_filtered_df(self, df):
-        dff = df.copy()
-        fd = self.db_filters["fecha_desde"].get().strip()
-        fh = self.db_filters["fecha_hasta"].get().strip()
-        if fd:
-            d0 = pd.to_datetime(fd, dayfirst=True, errors="coerce")
-            if pd.notna(d0):
-                dff = dff[dff["_fecha_informe"] >= d0]
-        if fh:
-            d1 = pd.to_datetime(fh, dayfirst=True, errors="coerce")
-            if pd.notna(d1):
-                dff = dff[dff["_fecha_informe"] <= d1]
-
-        srv = self.db_filters["servicio"].get().strip()
-        if srv:
-            dff = dff[dff.get("Servicio", "").astype(str).eq(srv)]
-        mal = self.db_filters["malignidad"].get().strip()
-        if mal:
-            dff = dff[dff.get("Malignidad", "").astype(str).str.upper().eq(mal)]
-        rsp = self.db_filters["responsable"].get().strip()
-        if rsp:
-            dff = dff[dff.get("Usuario finalizacion", "").astype(str).eq(rsp)]
-        return dff
+    def _filter_state(self):
+        # Estado de los filtros tal como lo espera database_manager (fechas dd/mm/aaaa)
+        return {k: v.get().strip() for k, v in self.db_filters.items()}
 
     def _clear_dash_area(self):
         # Desmonta los canvases previos para liberar memoria
@@ -455,7 +437,7 @@ class App(ctk.CTk):
             for child in tab.grid_slaves():
                 child.destroy()
 
-    def _chart_in(self, tab, row, col, render_fn, title, dff):
+    def _chart_in(self, tab, row, col, render_fn, title, data):
         card = ctk.CTkFrame(tab, fg_color=SURFACE, corner_radius=12)
         card.grid(row=row, column=col, padx=10, pady=10, sticky="nsew")
         tab.grid_rowconfigure(row, weight=1)
@@ -464,7 +446,7 @@ class App(ctk.CTk):
         header.pack(fill="x", padx=10, pady=(8, 0))
         ctk.CTkLabel(header, text=title, text_color=TEXT, font=ctk.CTkFont(size=13, weight="bold")).pack(side="left")
         ctk.CTkButton(header, text="⛶ Pantalla completa", width=150,
-                      command=lambda: self._open_fullscreen_figure(render_fn, title, dff)).pack(side="right")
+                      command=lambda: self._open_fullscreen_figure(render_fn, title, data)).pack(side="right")
 
         try:
             fig = render_fn()
@@ -475,7 +457,7 @@ class App(ctk.CTk):
             canvas.draw()
             widget = canvas.get_tk_widget()
             widget.pack(fill="both", expand=True, padx=8, pady=8)
-            widget.bind("<Double-Button-1>", lambda e: self._open_fullscreen_figure(render_fn, title, dff))
+            widget.bind("<Double-Button-1>", lambda e: self._open_fullscreen_figure(render_fn, title, data))
             self._dash_canvases.append(canvas)
         except Exception as e:
             ctk.CTkLabel(card, text=f"Error: {e}", text_color=MUTED).pack(padx=10, pady=10)
@@ -520,7 +502,7 @@ class App(ctk.CTk):
         ctk.CTkButton(btns, text="Aplicar", command=lambda:(self._refresh_dashboard(), top.destroy())).pack(side="left", expand=True, fill="x", padx=(0,6))
         ctk.CTkButton(btns, text="Limpiar", command=self._clear_filters).pack(side="left", expand=True, fill="x", padx=(6,0))
 
-    def _open_fullscreen_figure(self, render_fn, title, dff):
+    def _open_fullscreen_figure(self, render_fn, title, data):
         # Ventana a pantalla completa con inspector lateral
         fs = ctk.CTkToplevel(self)
         fs.title(title)
@@ -548,7 +530,7 @@ class App(ctk.CTk):
         insp = ctk.CTkFrame(fs, fg_color=SURFACE, corner_radius=12, width=300)
         insp.grid(row=0, column=1, sticky="ns", padx=(6,10), pady=10)
         ctk.CTkLabel(insp, text="Inspector", font=ctk.CTkFont(size=16, weight="bold")).pack(anchor="w", padx=12, pady=(12,6))
-        self._build_inspector(insp, title, dff)
+        self._build_inspector(insp, title, data)
 
         # Barra superior simple (cerrar)
         topbar = ctk.CTkFrame(graph_area, fg_color="transparent")
@@ -556,12 +538,11 @@ class App(ctk.CTk):
         ctk.CTkLabel(topbar, text=title, font=ctk.CTkFont(size=14, weight="bold")).pack(side="left")
         ctk.CTkButton(topbar, text="Cerrar", width=80, command=fs.destroy).pack(side="right")
 
-    def _build_inspector(self, parent, title, dff):
-        # Datos generales
-        n = len(dff)
-        fmin = pd.to_datetime(dff.get("_fecha_informe"), errors="coerce").min()
-        fmax = pd.to_datetime(dff.get("_fecha_informe"), errors="coerce").max()
-        rng = f"{fmin:%d/%m/%Y} – {fmax:%d/%m/%Y}" if pd.notna(fmin) and pd.notna(fmax) else "—"
+    def _build_inspector(self, parent, title, data):
+        # Datos generales (agregados ya calculados en SQL)
+        n = data["total"]
+        fmin, fmax = data["fecha_min"], data["fecha_max"]
+        rng = f"{pd.Timestamp(fmin):%d/%m/%Y} – {pd.Timestamp(fmax):%d/%m/%Y}" if fmin and fmax else "—"
 
         def row(k, v):
             r = ctk.CTkFrame(parent, fg_color="transparent"); r.pack(fill="x", padx=12, pady=4)
@@ -572,8 +553,8 @@ class App(ctk.CTk):
         row("Rango de fechas", rng)
 
         # Secciones condicionales útiles
-        if "Malignidad" in dff.columns:
-            ser = dff["Malignidad"].astype(str).str.upper().value_counts()
+        ser = data["malignidad"]
+        if not ser.empty:
             box = ctk.CTkFrame(parent, fg_color=BG, corner_radius=10); box.pack(fill="x", padx=12, pady=(10,4))
             ctk.CTkLabel(box, text="Malignidad", font=ctk.CTkFont(size=13, weight="bold")).pack(anchor="w", padx=10, pady=(8,2))
             for k,v in ser.items():
@@ -581,14 +562,8 @@ class App(ctk.CTk):
                 ctk.CTkLabel(rowtxt, text=f"{k}").pack(side="left")
                 ctk.CTkLabel(rowtxt, text=str(v)).pack(side="right")
 
-        if "Organo (1. Muestra enviada a patología)" in dff.columns:
-            top_org = dff["Organo (1. Muestra enviada a patología)"].astype(str).replace({"": "No especificado"}).value_counts().head(8)
-        elif "IHQ_ORGANO" in dff.columns:
-            top_org = dff["IHQ_ORGANO"].astype(str).replace({"": "No especificado"}).value_counts().head(8)
-        else:
-            top_org = None
-
-        if top_org is not None and not top_org.empty:
+        top_org = data["organos"].head(8)
+        if not top_org.empty:
             box2 = ctk.CTkFrame(parent, fg_color=BG, corner_radius=10); box2.pack(fill="x", padx=12, pady=(10,12))
             ctk.CTkLabel(box2, text="Top Órganos", font=ctk.CTkFont(size=13, weight="bold")).pack(anchor="w", padx=10, pady=(8,2))
             for k,v in top_org.items():
@@ -597,11 +572,12 @@ class App(ctk.CTk):
                 ctk.CTkLabel(rowtxt, text=str(v)).pack(side="right")
 
     # ---------- Renderers: Overview ----------
+    # Cada renderer recibe los agregados de database_manager.get_dashboard_aggregates
 
-    def _g_line_informes_por_mes(self, df):
-        if df.empty or df["_fecha_informe"].isna().all():
+    def _g_line_informes_por_mes(self, data):
+        ser = data["por_mes"]
+        if ser.empty:
             return None
-        ser = df.dropna(subset=["_fecha_informe"]).set_index("_fecha_informe").resample("MS").size()
         fig = Figure(figsize=(5.6, 3.2), dpi=100)
         ax = fig.add_subplot(111)
         ax.plot(ser.index, ser.values, marker="o")
@@ -611,10 +587,8 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_pie_malignidad(self, df):
-        if "Malignidad" not in df.columns or df.empty:
-            return None
-        ser = df["Malignidad"].astype(str).str.upper().replace({"": "DESCONOCIDO"}).value_counts()
+    def _g_pie_malignidad(self, data):
+        ser = data["malignidad"]
         if ser.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100)
         ax = fig.add_subplot(111)
@@ -623,10 +597,8 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_bar_top_servicio(self, df, top=12):
-        if "Servicio" not in df.columns or df.empty:
-            return None
-        ser = df["Servicio"].astype(str).value_counts().head(top)
+    def _g_bar_top_servicio(self, data):
+        ser = data["servicios"]
         if ser.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100)
         ax = fig.add_subplot(111)
@@ -637,11 +609,8 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_bar_top_organo(self, df, top=12):
-        # soporta tanto columna Excel como IHQ_ORGANO
-        col = "Organo (1. Muestra enviada a patología)" if "Organo (1. Muestra enviada a patología)" in df.columns else ("IHQ_ORGANO" if "IHQ_ORGANO" in df.columns else None)
-        if not col: return None
-        ser = df[col].astype(str).replace({"": "No especificado"}).value_counts().head(top)
+    def _g_bar_top_organo(self, data):
+        ser = data["organos"]
         if ser.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100)
         ax = fig.add_subplot(111)
@@ -654,25 +623,21 @@ class App(ctk.CTk):
 
     # ---------- Renderers: Biomarcadores ----------
 
-    def _g_hist_ki67(self, df):
-        col = "IHQ_KI-67" if "IHQ_KI-67" in df.columns else None
-        if not col: return None
-        s = pd.to_numeric(df[col], errors="coerce").dropna()
+    def _g_hist_ki67(self, data):
+        s = data["ki67"]   # {porcentaje: informes}
         if s.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100)
         ax = fig.add_subplot(111)
-        ax.hist(s.values, bins=12)
+        ax.hist(s.index, bins=12, weights=s.values)
         ax.set_title("Ki-67 (%)")
         ax.set_xlabel("%")
         ax.set_ylabel("Frecuencia")
         fig.tight_layout()
         return fig
 
-    def _g_bar_her2(self, df):
-        col = "IHQ_HER2" if "IHQ_HER2" in df.columns else None
-        if not col: return None
+    def _g_bar_her2(self, data):
         order = ["0", "1+", "2+", "3+", "NEGATIVO", "POSITIVO"]
-        ser = df[col].astype(str).str.upper().value_counts()
+        ser = data["her2"]
         ser = ser.reindex(order, fill_value=0) if any(k in ser.index for k in order) else ser
         if ser.sum() == 0: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
@@ -682,19 +647,14 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_bar_re_rp(self, df):
-        cols = [c for c in ["IHQ_RECEPTOR_ESTROGENO", "IHQ_RECEPTOR_PROGESTAGENOS"] if c in df.columns]
-        if not cols: return None
+    def _g_bar_re_rp(self, data):
+        data_rr = [data["re"], data["rp"]]
+        labels = ["RE", "RP"]
+        if all(d.empty for d in data_rr): return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
-        data = []
-        labels = []
-        for c in cols:
-            ser = df[c].astype(str).str.upper().replace({"": "ND"}).value_counts()
-            data.append(ser)
-            labels.append(c.replace("IHQ_", ""))
         # Normaliza categorías
-        cats = sorted(set().union(*[d.index for d in data]))
-        mat = np.array([[d.get(k, 0) for k in cats] for d in data])
+        cats = sorted(set().union(*[d.index for d in data_rr]))
+        mat = np.array([[d.get(k, 0) for k in cats] for d in data_rr])
         for i, row in enumerate(mat):
             ax.bar(np.arange(len(cats))+i*0.35, row, width=0.35, label=labels[i])
         ax.set_xticks(np.arange(len(cats))+0.35/2)
@@ -704,15 +664,8 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_bar_pdl1(self, df):
-        # intenta TPS o CPS
-        for col in ["IHQ_PDL-1", "IHQ_PDL1_TPS", "IHQ_PDL1_CPS"]:
-            if col in df.columns:
-                s = df[col].astype(str)
-                break
-        else:
-            return None
-        ser = s.replace({"": "ND"}).value_counts()
+    def _g_bar_pdl1(self, data):
+        ser = data["pdl1"]
         if ser.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
         ax.bar(ser.index, ser.values)
@@ -724,20 +677,18 @@ class App(ctk.CTk):
 
     # ---------- Renderers: Tiempos ----------
 
-    def _g_box_tiempo_proceso(self, df):
-        f_ing = pd.to_datetime(df.get("Fecha de ingreso (2. Fecha de la muestra)", ""), dayfirst=True, errors="coerce")
-        f_inf = pd.to_datetime(df.get("Fecha finalizacion (3. Fecha del informe)", df.get("Fecha de informe", "")), dayfirst=True, errors="coerce")
-        dias = (f_inf - f_ing).dt.days.dropna()
+    def _g_box_tiempo_proceso(self, data):
+        dias = data["dias_proceso"]   # {días: informes}
         if dias.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
-        ax.boxplot(dias.values, vert=True)
+        ax.bxp([_box_stats(dias)], vert=True)
         ax.set_title("Tiempo de proceso (días)")
         fig.tight_layout()
         return fig
 
-    def _g_line_throughput_semana(self, df):
-        if df.empty or df["_fecha_informe"].isna().all(): return None
-        ser = df.dropna(subset=["_fecha_informe"]).set_index("_fecha_informe").resample("W-MON").size()
+    def _g_line_throughput_semana(self, data):
+        ser = data["por_semana"]
+        if ser.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
         ax.plot(ser.index, ser.values, marker="o")
         ax.set_title("Throughput semanal")
@@ -746,14 +697,11 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_scatter_edad_ki67(self, df):
-        if "Edad" not in df.columns: return None
-        x = pd.to_numeric(df["Edad"], errors="coerce")
-        y = pd.to_numeric(df.get("IHQ_KI-67", pd.Series(np.nan, index=df.index)), errors="coerce")
-        m = x.notna() & y.notna()
-        if not m.any(): return None
+    def _g_scatter_edad_ki67(self, data):
+        pts = data["edad_ki67"]   # una fila por par (edad, ki67) con su número de informes
+        if pts.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
-        ax.scatter(x[m], y[m], alpha=0.6)
+        ax.scatter(pts["edad"], pts["ki67"], s=12 * np.sqrt(pts["n"]), alpha=0.6)
         ax.set_title("Edad vs Ki-67")
         ax.set_xlabel("Edad")
         ax.set_ylabel("Ki-67 (%)")
@@ -762,14 +710,9 @@ class App(ctk.CTk):
 
     # ---------- Renderers: Calidad ----------
 
-    def _g_bar_missingness(self, df):
-        cols = [
-            "Servicio", "Malignidad", "Usuario finalizacion",
-            "Organo (1. Muestra enviada a patología)", "IHQ_HER2", "IHQ_KI-67"
-        ]
-        present = [c for c in cols if c in df.columns]
-        if not present: return None
-        miss = df[present].isna().mean().sort_values(ascending=False)
+    def _g_bar_missingness(self, data):
+        miss = data["vacios"]
+        if miss.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
         ax.bar(miss.index, (miss.values*100.0))
         ax.set_title("Campos vacíos (%)")
@@ -778,10 +721,9 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_bar_top_responsables(self, df, top=10):
-        col = "Usuario finalizacion"
-        if col not in df.columns: return None
-        ser = df[col].astype(str).value_counts().head(top)
+    def _g_bar_top_responsables(self, data):
+        ser = data["responsables"]
+        if ser.empty: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
         ax.bar(ser.index, ser.values)
         ax.set_title("Productividad por responsable (Top)")
@@ -790,12 +732,9 @@ class App(ctk.CTk):
         fig.tight_layout()
         return fig
 
-    def _g_bar_largos_texto(self, df):
-        col = "Descripcion Diagnostico (5,6,7 Tipo histológico, subtipo histológico, margenes tumorales)"
-        if col not in df.columns: return None
-        s = df[col].astype(str).str.len()
-        bins = [0, 50, 150, 300, 600, 1200, np.inf]
-        ser = pd.cut(s, bins=bins, labels=["<50", "50–150", "150–300", "300–600", "600–1200", "1200+"], include_lowest=True).value_counts().sort_index()
+    def _g_bar_largos_texto(self, data):
+        ser = data["largo_diagnostico"]
+        if ser.sum() == 0: return None
         fig = Figure(figsize=(5.6, 3.2), dpi=100); ax = fig.add_subplot(111)
         ax.bar(ser.index.astype(str), ser.values)
         ax.set_title("Longitud del diagnóstico (bins)")
@@ -805,52 +744,46 @@ class App(ctk.CTk):
 
     # ---------- Comparador parametrizable ----------
 
-    def _build_comparator(self, tab, df):
+    def _build_comparator(self, tab, data, filters):
         # Controles
         ctrl = ctk.CTkFrame(tab, fg_color="transparent")
         ctrl.grid(row=0, column=0, columnspan=2, padx=10, pady=(10,0), sticky="ew")
 
-        dims = [c for c in ["Servicio", "Usuario finalizacion", "Malignidad", "Organo (1. Muestra enviada a patología)"] if c in df.columns]
-        mets = [c for c in ["IHQ_KI-67"] if c in df.columns]  # se pueden añadir más numéricas
+        dims = list(database_manager.COMPARE_DIMENSIONS)
+        mets = list(database_manager.COMPARE_METRICS)  # columnas tipadas de la BD
 
-        self._compare_controls["dim"] = ctk.StringVar(value=dims[0] if dims else "")
+        self._compare_controls["dim"] = ctk.StringVar(value=dims[0])
         self._compare_controls["agg"] = ctk.StringVar(value="conteo")
-        self._compare_controls["met"] = ctk.StringVar(value=mets[0] if mets else "")
+        self._compare_controls["met"] = ctk.StringVar(value=mets[0])
 
         row = ctk.CTkFrame(ctrl, fg_color=SURFACE, corner_radius=12)
         row.pack(fill="x", padx=4, pady=4)
         ctk.CTkLabel(row, text="Dimensión:").pack(side="left", padx=6)
-        ctk.CTkComboBox(row, values=dims or [""], variable=self._compare_controls["dim"]).pack(side="left", padx=6)
+        ctk.CTkComboBox(row, values=dims, variable=self._compare_controls["dim"]).pack(side="left", padx=6)
         ctk.CTkLabel(row, text="Agregador:").pack(side="left", padx=6)
         ctk.CTkComboBox(row, values=["conteo", "promedio"], variable=self._compare_controls["agg"]).pack(side="left", padx=6)
         ctk.CTkLabel(row, text="Métrica:").pack(side="left", padx=6)
-        ctk.CTkComboBox(row, values=mets or [""], variable=self._compare_controls["met"]).pack(side="left", padx=6)
-        ctk.CTkButton(row, text="Aplicar", command=lambda: self._chart_in(tab, 1, 0, lambda: self._g_compare(df),)).pack(side="left", padx=10)
+        ctk.CTkComboBox(row, values=mets, variable=self._compare_controls["met"]).pack(side="left", padx=6)
+        ctk.CTkButton(row, text="Aplicar", command=lambda: self._chart_in(tab, 1, 0, lambda: self._g_compare(filters), "Comparador", data)).pack(side="left", padx=10)
 
         # Gráfico inicial
-        self._chart_in(tab, 1, 0, lambda: self._g_compare(df))
+        self._chart_in(tab, 1, 0, lambda: self._g_compare(filters), "Comparador", data)
 
-    def _g_compare(self, df):
+    def _g_compare(self, filters):
         dim = self._compare_controls["dim"].get()
         agg = self._compare_controls["agg"].get()
         met = self._compare_controls["met"].get()
-        if not dim or df.empty: return None
+        if not dim: return None
+        if agg != "conteo" and not met: return None
 
-        fig = Figure(figsize=(11.6, 3.2), dpi=100); ax = fig.add_subplot(111)
+        # Conteo o promedio por dimensión, agrupado en SQL con los mismos filtros del dashboard
+        ser = database_manager.get_comparison(filters, dim, None if agg == "conteo" else met)
+        if ser.empty: return None
 
-        if agg == "conteo":
-            ser = df[dim].astype(str).value_counts()
-            ax.bar(ser.index, ser.values)
-            ax.set_title(f"Conteo por {dim}")
-            ax.tick_params(axis="x", rotation=25)
-        else:
-            if not met or met not in df.columns:
-                return None
-            s = pd.to_numeric(df[met], errors="coerce")
-            grp = df.assign(_metric=s).groupby(dim)["_metric"].mean().dropna()
-            ax.bar(grp.index, grp.values)
-            ax.set_title(f"Promedio de {met} por {dim}")
-            ax.tick_params(axis="x", rotation=25)
+        fig = Figure(figsize=(11.6, 3.2), dpi=100); ax = fig.add_subplot(111)
+        ax.bar(ser.index.astype(str), ser.values)
+        ax.set_title(f"Conteo por {dim}" if agg == "conteo" else f"Promedio de {met} por {dim}")
+        ax.tick_params(axis="x", rotation=25)
 
         fig.tight_layout()
         return fig
@@ -906,179 +839,140 @@ class App(ctk.CTk):
     def refresh_data_and_table(self):
         try:
             database_manager.init_db()
-            self.master_df = database_manager.get_all_records_as_dataframe()
-            self._populate_treeview(self.master_df)
-            self._render_kpis(self.master_df)
+            kpis = database_manager.get_kpis()
+            self._set_kpis(kpis["total"], kpis["malignos"], kpis["ultima_fecha"])
+            self._reload_listing()
         except Exception as e:
             messagebox.showerror("Error de Base de Datos", f"No se pudieron cargar los datos: {e}")
             self.set_status("Error al cargar datos.")
 
-    def _populate_treeview(self, df_to_display):
+    def _reload_listing(self):
+        # Vuelve a la primera ventana con el orden y la búsqueda actuales
         for item in self.tree.get_children():
             self.tree.delete(item)
+        self._listing_cursor = None
+        self._listing_count = 0
 
-        if df_to_display.empty:
-            return
-
-        cols_to_show = [
-            "N. peticion (0. Numero de biopsia)",
-            "Primer nombre",
-            "Primer apellido",
-            "Fecha finalizacion (3. Fecha del informe)",
-            "Malignidad",
-            "Organo (1. Muestra enviada a patología)",
-        ]
-        df_display = df_to_display[[c for c in cols_to_show if c in df_to_display.columns]].copy()
-
-        self.tree["columns"] = list(df_display.columns)
-        for col in df_display.columns:
+        self.tree["columns"] = list(database_manager.LISTING_COLUMNS)
+        order_col, descending = self._listing_order
+        for col in database_manager.LISTING_COLUMNS:
             header = col.split("(")[0].strip()
-            # Ordenamiento al clic
-            self.tree.heading(col, text=header, command=lambda c=col: self._sort_treeview(c, False))
-            # Auto-ancho (acorde a datos y encabezado, con límites)
-            try:
-                max_len = max(df_display[col].astype(str).str.len().max(), len(header))
-            except Exception:
-                max_len = len(header)
-            width = max(120, min(280, int(max_len * 7)))
-            self.tree.column(col, width=width, anchor="w", stretch=True)
+            if col == order_col:
+                header += " ▼" if descending else " ▲"
+            # Ordenamiento al clic (en la BD: el listado no está completo en memoria)
+            self.tree.heading(col, text=header,
+                              command=lambda c=col: self._sort_treeview(c, c == order_col and not descending))
 
         # Filas cebra
         self.tree.tag_configure("oddrow", background="#2a2d2e")
         self.tree.tag_configure("evenrow", background="#232629")
 
-        for idx, (_, row) in enumerate(df_display.iterrows()):
-            tag = "evenrow" if idx % 2 == 0 else "oddrow"
-            self.tree.insert("", "end", values=list(row), iid=idx, tags=(tag,))
+        self._load_listing_page(first=True)
 
-        # Actualizar KPIs en base a lo mostrado
+    def _load_listing_page(self, first=False):
+        # Trae la siguiente ventana del listado (solo sus columnas) y la agrega al Treeview
+        if self._listing_loading or (not first and self._listing_cursor is None):
+            return
+        self._listing_loading = True
         try:
-            self._render_kpis(df_display)
-        except Exception:
-            pass
-
-    def _sort_treeview(self, col, reverse):
-        items = self.tree.get_children("")
-        data = [(self.tree.set(it, col), it) for it in items]
-
-        from datetime import datetime as _dt
-
-        def _key(v):
-            s = str(v).strip()
-            # número
-            try:
-                return float(s.replace(",", "."))
-            except Exception:
-                pass
-            # fecha
-            for fmt in ("%d/%m/%Y", "%Y-%m-%d", "%d-%m-%Y"):
-                try:
-                    return _dt.strptime(s, fmt)
-                except Exception:
-                    pass
-            return s.lower()
-
-        data.sort(key=lambda x: _key(x[0]), reverse=reverse)
+            order_col, descending = self._listing_order
+            rows, self._listing_cursor = database_manager.get_listing_page(
+                order_col, descending, self._listing_cursor, search=self.search_var.get())
+            for row in rows:
+                tag = "evenrow" if self._listing_count % 2 == 0 else "oddrow"
+                values = ["" if v is None else v for v in row[1:]]
+                self.tree.insert("", "end", values=values, iid=str(row[0]), tags=(tag,))
+                self._listing_count += 1
+
+            if first:
+                # Auto-ancho (acorde a la primera ventana y encabezado, con límites)
+                for i, col in enumerate(database_manager.LISTING_COLUMNS):
+                    header = col.split("(")[0].strip()
+                    max_len = max([len(str(row[i + 1] or "")) for row in rows] + [len(header)])
+                    self.tree.column(col, width=max(120, min(280, int(max_len * 7))), anchor="w", stretch=True)
+
+            more = " (desplace para ver más)" if self._listing_cursor else ""
+            self.listing_info.configure(text=f"{self._listing_count:,} registros cargados{more}".replace(",", "."))
+        finally:
+            self._listing_loading = False
 
-        for idx, (_, item) in enumerate(data):
-            self.tree.move(item, "", idx)
+    def _on_tree_scroll(self, first, last):
+        self.tree_scrollbar.set(first, last)
+        # Cerca del final (y solo si el usuario ya desplazó): pide la ventana siguiente
+        if float(first) > 0 and float(last) >= 0.9 and self._listing_cursor is not None:
+            self.after_idle(self._load_listing_page)
 
-        self.tree.heading(col, command=lambda: self._sort_treeview(col, not reverse))
+    def _sort_treeview(self, col, reverse):
+        self._listing_order = (col, reverse)
+        self._reload_listing()
 
     def filter_tabla(self, *args):
-        query = self.search_var.get().lower()
-        if not query:
-            self._populate_treeview(self.master_df)
-            return
-
-        df = self.master_df.copy()
-        search_cols = ["N. peticion (0. Numero de biopsia)", "Primer nombre", "Primer apellido"]
-        for col in search_cols:
-            if col in df.columns:
-                df[col] = df[col].astype(str)
-        mask = False
-        if search_cols[0] in df.columns:
-            mask = df[search_cols[0]].str.lower().str.contains(query, na=False)
-        if search_cols[1] in df.columns:
-            mask |= df[search_cols[1]].str.lower().str.contains(query, na=False)
-        if search_cols[2] in df.columns:
-            mask |= df[search_cols[2]].str.lower().str.contains(query, na=False)
-        self._populate_treeview(df[mask])
+        self._reload_listing()
 
     def mostrar_detalle_registro(self, event):
         selected_item = self.tree.focus()
         if not selected_item:
             return
 
-        item_index = int(selected_item)
-        if item_index not in self.master_df.index:
+        # Registro completo (con los textos largos) solo del seleccionado
+        record = database_manager.get_record(int(selected_item))
+        if record is None:
             return
-        record = self.master_df.loc[item_index]
 
         self.detail_textbox.configure(state="normal")
         self.detail_textbox.delete("1.0", "end")
 
         details_text = ""
         for key, value in record.items():
-            if pd.notna(value) and str(value).strip():
+            if value is not None and str(value).strip():
                 details_text += f"{key.split('(')[0].strip()}:\n{value}\n{'-'*30}\n"
 
         self.detail_textbox.insert("1.0", details_text)
         self.detail_textbox.configure(state="disabled")
 
     def cargar_dashboard(self):
-        # 1) Preparar DF y combos de filtros
-        df = self.master_df.copy()
-        if df is None or df.empty:
-            self._render_kpis(df)
+        # 1) KPIs de la tabla completa y combos de filtros (consultas por índice, sin DataFrame)
+        kpis = database_manager.get_kpis()
+        self._set_kpis(kpis["total"], kpis["malignos"], kpis["ultima_fecha"])
+        if not kpis["total"]:
             self._clear_dash_area()
             return
 
-        # Normaliza fechas (varias columnas posibles)
-        df["_fecha_informe"] = pd.to_datetime(
-            df.get("Fecha finalizacion (3. Fecha del informe)", df.get("Fecha de informe", df.get("Fecha de ingreso", ""))),
-            dayfirst=True, errors="coerce"
-        )
-
         # Llenar combos dinámicos (servicios / responsables)
-        srv_vals = sorted([s for s in df.get("Servicio", pd.Series(dtype=str)).dropna().astype(str).unique() if s.strip()])
-        rsp_vals = sorted([s for s in df.get("Usuario finalizacion", pd.Series(dtype=str)).dropna().astype(str).unique() if s.strip()])
-        self.cmb_servicio.configure(values=[""] + srv_vals)
-        self.cmb_resp.configure(values=[""] + rsp_vals)
-
-        # 2) Render de KPIs básicos
-        self._render_kpis(df)
+        self.cmb_servicio.configure(values=[""] + database_manager.get_distinct_values("Servicio"))
+        self.cmb_resp.configure(values=[""] + database_manager.get_distinct_values("Usuario finalizacion"))
 
-        # 3) Limpiar canvases anteriores y pintar
+        # 2) Limpiar canvases anteriores
         self._clear_dash_area()
 
-        # Filtros iniciales (los que estén llenos)
-        dff = self._get_filtered_df(df)
+        # 3) Filtros y agregados de todos los gráficos resueltos en SQL (GROUP BY por índice)
+        filters = self._filter_state()
+        data = database_manager.get_dashboard_aggregates(filters)
 
         # 4) PINTAR: OVERVIEW (4 gráficos)
-        self._chart_in(self.tab_overview, 0, 0, lambda: self._g_line_informes_por_mes(dff), "Informes por mes", dff)
-        self._chart_in(self.tab_overview, 0, 1, lambda: self._g_pie_malignidad(dff), "Distribución de Malignidad", dff)
-        self._chart_in(self.tab_overview, 1, 0, lambda: self._g_bar_top_servicio(dff), "Top Servicios", dff)
-        self._chart_in(self.tab_overview, 1, 1, lambda: self._g_bar_top_organo(dff), "Top Órganos", dff)
+        self._chart_in(self.tab_overview, 0, 0, lambda: self._g_line_informes_por_mes(data), "Informes por mes", data)
+        self._chart_in(self.tab_overview, 0, 1, lambda: self._g_pie_malignidad(data), "Distribución de Malignidad", data)
+        self._chart_in(self.tab_overview, 1, 0, lambda: self._g_bar_top_servicio(data), "Top Servicios", data)
+        self._chart_in(self.tab_overview, 1, 1, lambda: self._g_bar_top_organo(data), "Top Órganos", data)
 
         # 5) PINTAR: BIOMARCADORES
-        self._chart_in(self.tab_biomarkers, 0, 0, lambda: self._g_hist_ki67(dff), "Ki-67 (%)", dff)
-        self._chart_in(self.tab_biomarkers, 0, 1, lambda: self._g_bar_her2(dff), "HER2 (score)", dff)
-        self._chart_in(self.tab_biomarkers, 1, 0, lambda: self._g_bar_re_rp(dff), "RE / RP (estado)", dff)
-        self._chart_in(self.tab_biomarkers, 1, 1, lambda: self._g_bar_pdl1(dff), "PD-L1", dff)
+        self._chart_in(self.tab_biomarkers, 0, 0, lambda: self._g_hist_ki67(data), "Ki-67 (%)", data)
+        self._chart_in(self.tab_biomarkers, 0, 1, lambda: self._g_bar_her2(data), "HER2 (score)", data)
+        self._chart_in(self.tab_biomarkers, 1, 0, lambda: self._g_bar_re_rp(data), "RE / RP (estado)", data)
+        self._chart_in(self.tab_biomarkers, 1, 1, lambda: self._g_bar_pdl1(data), "PD-L1", data)
 
         # 6) PINTAR: TIEMPOS
-        self._chart_in(self.tab_times, 0, 0, lambda: self._g_box_tiempo_proceso(dff), "Tiempo de proceso (días)", dff)
-        self._chart_in(self.tab_times, 0, 1, lambda: self._g_line_throughput_semana(dff), "Throughput semanal", dff)
-        self._chart_in(self.tab_times, 1, 0, lambda: self._g_scatter_edad_ki67(dff), "Edad vs Ki-67", dff)
+        self._chart_in(self.tab_times, 0, 0, lambda: self._g_box_tiempo_proceso(data), "Tiempo de proceso (días)", data)
+        self._chart_in(self.tab_times, 0, 1, lambda: self._g_line_throughput_semana(data), "Throughput semanal", data)
+        self._chart_in(self.tab_times, 1, 0, lambda: self._g_scatter_edad_ki67(data), "Edad vs Ki-67", data)
 
         # 7) PINTAR: CALIDAD
-        self._chart_in(self.tab_quality, 0, 0, lambda: self._g_bar_missingness(dff), "Campos vacíos (%)", dff)
-        self._chart_in(self.tab_quality, 0, 1, lambda: self._g_bar_top_responsables(dff), "Productividad por responsable", dff)
-        self._chart_in(self.tab_quality, 1, 0, lambda: self._g_bar_largos_texto(dff), "Longitud del diagnóstico", dff)
+        self._chart_in(self.tab_quality, 0, 0, lambda: self._g_bar_missingness(data), "Campos vacíos (%)", data)
+        self._chart_in(self.tab_quality, 0, 1, lambda: self._g_bar_top_responsables(data), "Productividad por responsable", data)
+        self._chart_in(self.tab_quality, 1, 0, lambda: self._g_bar_largos_texto(data), "Longitud del diagnóstico", data)
 
         # 8) PINTAR: COMPARADOR
-        self._build_comparator(self.tab_compare, dff)
+        self._build_comparator(self.tab_compare, data, filters)
 
 
     def _create_kpi_card(self, title, value, col):